@@ -0,0 +1,205 @@
+import time
+import threading
+import numpy as np
+import db
+import config
+
+#######################################################################
+#   Throughput + ETA analytics (per-stage cost models from job history)
+#######################################################################
+
+# Refit the cost models at most this often (fetch_media_previews is polled by the UI)
+MODEL_REFRESH_INTERVAL = 60
+
+# Fewer samples than this -> use a plain ratio (seconds per media second) instead of a fit
+MIN_FIT_SAMPLES = 5
+
+# Media duration assumed for queued items whose metadata hasn't arrived yet, if there's no history
+DEFAULT_MEDIA_DURATION = 20 * 60
+
+models = None
+models_fitted_t = 0
+models_lock = threading.Lock()
+
+def fit_stage_model(samples):
+    """
+    Least squares fit of stage seconds = intercept + slope * media seconds.
+    samples: [(media_duration, duration)]
+    """
+    x = np.array([s[0] for s in samples], dtype=np.float64)
+    y = np.array([s[1] for s in samples], dtype=np.float64)
+
+    if len(samples) >= MIN_FIT_SAMPLES and np.ptp(x) > 0:
+        slope, intercept = np.polyfit(x, y, 1)
+        # A negative intercept or slope is noise from a small / clustered sample; fall back to a ratio
+        if slope >= 0 and intercept >= 0:
+            residual = y - (intercept + slope * x)
+            total = y - y.mean()
+            r2 = 1 - float(residual @ residual) / float(total @ total) if total.any() else 1.0
+            return {
+                'intercept': float(intercept),
+                'slope': float(slope),
+                'r2': r2,
+                'samples': len(samples),
+                'kind': 'linear'
+            }
+
+    return {
+        'intercept': 0.0,
+        'slope': float(np.median(y / x)),
+        'r2': None,
+        'samples': len(samples),
+        'kind': 'ratio'
+    }
+
+def fit_models(db_path=config.DB_PATH):
+    """{stage: model} for every main-job stage with history, plus the typical media duration"""
+    stage_samples = db.fetch_stage_samples('main', db_path=db_path)
+
+    # Libraries that predate job_metrics only have diarization_time on the media rows
+    if len(stage_samples.get('diarize', [])) < MIN_FIT_SAMPLES:
+        history = db.fetch_diarization_history(db_path=db_path)
+        if len(history) > len(stage_samples.get('diarize', [])):
+            stage_samples['diarize'] = history
+
+    fitted = {
+        stage: fit_stage_model(samples)
+        for stage, samples in stage_samples.items()
+        if samples and not stage.startswith('diarize_') and stage != 'queue_wait'
+    }
+
+    media_durations = [s[0] for samples in stage_samples.values() for s in samples]
+
+    return {
+        'stages': fitted,
+        'typical_media_duration': float(np.median(media_durations)) if media_durations else DEFAULT_MEDIA_DURATION
+    }
+
+def get_models(db_path=config.DB_PATH):
+    global models, models_fitted_t
+    with models_lock:
+        if models is None or time.time() - models_fitted_t > MODEL_REFRESH_INTERVAL:
+            models = fit_models(db_path)
+            models_fitted_t = time.time()
+        return models
+
+def invalidate_models():
+    """Refit on next use (e.g. after a job finished)"""
+    global models
+    with models_lock:
+        models = None
+
+#######################################################################
+#   Estimates
+#######################################################################
+
+def get_job_stages(item, stream_youtube_audio):
+    """Stages a main job for item goes through (mirrors diarize_loop.process_job)"""
+    if item['source'] == 'local':
+        return ['decompress', 'diarize', 'db_write']
+    if stream_youtube_audio:
+        return ['stream_download', 'diarize', 'db_write']
+    return ['download', 'decompress', 'diarize', 'db_write']
+
+def estimate_job_seconds(item, fitted_models, stream_youtube_audio):
+    """(estimated seconds to process item, whether its duration was known)"""
+    duration_known = bool(item.get('duration'))
+    media_duration = item['duration'] if duration_known else fitted_models['typical_media_duration']
+
+    seconds = 0.0
+    for stage in get_job_stages(item, stream_youtube_audio):
+        model = fitted_models['stages'].get(stage)
+        # A stream_download model may not exist yet if streaming was only just enabled
+        if model is None and stage == 'stream_download':
+            for fallback_stage in ('download', 'decompress'):
+                fallback = fitted_models['stages'].get(fallback_stage)
+                if fallback:
+                    seconds += fallback['intercept'] + fallback['slope'] * media_duration
+            continue
+        if model:
+            seconds += model['intercept'] + model['slope'] * media_duration
+
+    return max(seconds, 0.0), duration_known
+
+def estimate_queue(processing_items, queued_items, db_path=config.DB_PATH):
+    """
+    ETAs for the running job(s) and the queue in processing order.
+    Adds an 'eta' dict to each item: seconds (estimated processing time), start and finish
+    (seconds from now), duration_known. Returns the seconds until the whole queue is done.
+    """
+    fitted_models = get_models(db_path)
+    if not fitted_models['stages']:
+        for item in processing_items + queued_items:
+            item['eta'] = None
+        return None
+
+    stream_youtube_audio = bool(db.get_setting('stream_youtube_audio'))
+    now = time.time()
+    clock = 0.0
+
+    for item in processing_items:
+        seconds, duration_known = estimate_job_seconds(item, fitted_models, stream_youtube_audio)
+        elapsed = now - item['started_t'] if item.get('started_t') else 0.0
+        remaining = max(seconds - elapsed, 0.0)
+        item['eta'] = {
+            'seconds': seconds,
+            'start': -elapsed,
+            'finish': remaining,
+            'duration_known': duration_known
+        }
+        clock = max(clock, remaining)
+
+    for item in queued_items:
+        seconds, duration_known = estimate_job_seconds(item, fitted_models, stream_youtube_audio)
+        item['eta'] = {
+            'seconds': seconds,
+            'start': clock,
+            'finish': clock + seconds,
+            'duration_known': duration_known
+        }
+        clock += seconds
+
+    return clock
+
+#######################################################################
+#   Report
+#######################################################################
+
+THROUGHPUT_WINDOWS = {
+    '24h': 24 * 60 * 60,
+    '7d': 7 * 24 * 60 * 60,
+    '30d': 30 * 24 * 60 * 60
+}
+
+def build_report(db_path=config.DB_PATH):
+    """Cost models, recent throughput and queue ETAs, for capacity planning"""
+    now = time.time()
+
+    throughput = {}
+    for window_name, window in THROUGHPUT_WINDOWS.items():
+        window_throughput = db.fetch_throughput(now - window, db_path=db_path)
+        processing_seconds = window_throughput['processing_seconds']
+        window_throughput['realtime_factor'] = (
+            window_throughput['media_seconds'] / processing_seconds if processing_seconds else None
+        )
+        window_throughput['jobs_per_hour'] = window_throughput['jobs'] / (window / 3600)
+        throughput[window_name] = window_throughput
+
+    previews = db.fetch_media_previews(db_path=db_path)
+    queue_eta = estimate_queue(previews['processing'], previews['queued'], db_path=db_path)
+
+    return {
+        'models': get_models(db_path),
+        'throughput': throughput,
+        'queue_eta_seconds': queue_eta,
+        'queue': [
+            {
+                'id': item['id'],
+                'title': item['title'],
+                'status': item['status'],
+                'duration': item['duration'],
+                'eta': item['eta']
+            }
+            for item in previews['processing'] + previews['queued']
+        ]
+    }
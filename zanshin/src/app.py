@@ -1,4 +1,6 @@
+import startup_timer
 import sys
+import signal
 import threading
 import time
 import os
@@ -12,21 +14,30 @@ from collections import deque
 from flask import Flask, jsonify, request
 from flask_socketio import SocketIO
 from flask_cors import CORS
-from flask import send_from_directory
 import zmq
 from termcolor import colored
 
-from diarize_loop import diarize_loop
-from metadata_loop import metadata_loop
 import db
 import config
 import shared_dict
 import rust_comms
-from stream_local_file import stream_local_file
+import speaker_index
+import prometheus
+import analytics
+import memory_tracking
+import sampling_profiler
+import request_stats
+import wsgi_server
+import static_assets
+from stream_local_file import stream_local_file, invalidate_stream_handle, get_stream_info, get_stream_seek_point, serve_hls, stream_render, get_render_info
+from transcode import remove_cached_remuxes
+from audio_proxy import has_proxy, remove_proxy
+from hls import remove_packages
+from render import VARIANTS, remove_renders
+from job_worker import cancel_command, kill_all_workers
 from misc import (
     extract_video_id,
     router_to_all_dealers,
-    collect_dealers,
     get_media_types,
     get_file_hash,
     create_bookmark_data,
@@ -35,7 +46,8 @@ from misc import (
     get_zanshin_application_support_path,
     get_file_extension,
     is_supported_format,
-    create_or_clean_dir
+    create_or_clean_dir,
+    get_data_hash
 )
 
 # Flask server setup
@@ -58,6 +70,8 @@ worker_identities = set()
 # Zanshin version
 version = None
 
+startup_timer.mark('imports')
+
 #######################################################################
 #   Fetch Zanshin version
 #######################################################################
@@ -76,6 +90,7 @@ def submit_youtube_endpoint():
     youtube_url = data["url"]
     id = db.submit_job("youtube", extract_video_id(youtube_url), "video")
     router_to_all_dealers(socket, worker_identities, "new_job_submission")
+    preempt_if_outranked()
     socketio.emit(
         "new_job_submission", {"timestamp": time.time() * 1000}
     )  # milliseconds
@@ -115,6 +130,102 @@ def retry_processing_endpoint():
 
     return "", 200
 
+#######################################################################
+#   Queue priority
+#######################################################################
+
+def parse_priority(value):
+    """int priority from request JSON, or None if it isn't one (bools and fractions included)"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    if not number.is_integer():
+        return None
+    return int(number)
+
+@app.route("/api/set_priority", methods=["POST"])
+def set_priority_endpoint():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or "id" not in data or "priority" not in data:
+        return "", 400
+
+    priority = parse_priority(data["priority"])
+    if priority is None:
+        return "", 400
+
+    db.set_priority(data["id"], priority)
+    router_to_all_dealers(socket, worker_identities, "new_job_submission")
+    preempt_if_outranked()
+    socketio.emit("queue_update")
+    return "", 200
+
+@app.route("/api/bump_priority", methods=["POST"])
+def bump_priority_endpoint():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or "id" not in data:
+        return "", 400
+
+    amount = parse_priority(data.get("amount", 1))
+    if amount is None:
+        return "", 400
+
+    priority = db.bump_priority(data["id"], amount)
+    if priority is None:
+        return "", 404
+
+    router_to_all_dealers(socket, worker_identities, "new_job_submission")
+    preempt_if_outranked()
+    socketio.emit("queue_update")
+    return jsonify({"priority": priority}), 200
+
+@app.route("/api/set_pinned", methods=["POST"])
+def set_pinned_endpoint():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("id"), str) or not isinstance(data.get("pinned"), bool):
+        return "", 400
+
+    db.set_pinned(data["id"], data["pinned"])
+    router_to_all_dealers(socket, worker_identities, "new_job_submission")
+    preempt_if_outranked()
+    socketio.emit("queue_update")
+    return "", 200
+
+#######################################################################
+#   Cancellation / preemption
+#######################################################################
+
+@app.route("/api/cancel_job", methods=["POST"])
+def cancel_job_endpoint():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("id"), str):
+        return "", 400
+
+    id = data["id"]
+
+    # Not started yet
+    if db.cancel_queued_job(id):
+        socketio.emit("queue_update")
+        return "", 200
+
+    # Currently processing; diarize_loop kills the worker and marks the job cancelled
+    if shared_dict.read('active_job_id') == id:
+        router_to_dealer(socket, "diarize_loop".encode(), cancel_command(id))
+        return "", 202
+
+    return "", 404
+
+def preempt_if_outranked():
+    """Park the running job if the preempt_jobs setting is on and a higher priority item is now queued"""
+    if not db.get_setting('preempt_jobs'):
+        return
+
+    active_id = shared_dict.read('active_job_id')
+    if active_id and db.should_preempt(active_id):
+        router_to_dealer(socket, "diarize_loop".encode(), cancel_command(active_id, 'preempted'))
+
 #######################################################################
 #   Open local file dialog
 #######################################################################
@@ -154,7 +265,7 @@ def open_file_endpoint():
                 [Console]::OutputEncoding = [System.Text.Encoding]::UTF8
                 Add-Type -AssemblyName System.Windows.Forms
                 $dialog = New-Object System.Windows.Forms.OpenFileDialog
-                $dialog.Filter = "Audio and Video files (*.mp3;*.wav;*.ogg;*.aac;*.m4a;*.opus;*.mp4;*.webm;*.ogv;*.mpg;*.mpeg)|*.mp3;*.wav;*.ogg;*.aac;*.m4a;*.opus;*.mp4;*.webm;*.ogv;*.mpg;*.mpeg|Audio files (*.mp3;*.wav;*.ogg;*.aac;*.m4a;*.opus)|*.mp3;*.wav;*.ogg;*.aac;*.m4a;*.opus|Video files (*.mp4;*.webm;*.ogv;*.mpg;*.mpeg)|*.mp4;*.webm;*.ogv;*.mpg;*.mpeg|All Files (*.*)|*.*"
+                $dialog.Filter = "Audio and Video files (*.mp3;*.wav;*.ogg;*.aac;*.m4a;*.opus;*.flac;*.mka;*.wma;*.aiff;*.aif;*.wv;*.ape;*.mp4;*.webm;*.ogv;*.mpg;*.mpeg;*.mkv;*.mov;*.m4v;*.avi;*.wmv;*.flv;*.ts;*.m2ts;*.mts;*.3gp)|*.mp3;*.wav;*.ogg;*.aac;*.m4a;*.opus;*.flac;*.mka;*.wma;*.aiff;*.aif;*.wv;*.ape;*.mp4;*.webm;*.ogv;*.mpg;*.mpeg;*.mkv;*.mov;*.m4v;*.avi;*.wmv;*.flv;*.ts;*.m2ts;*.mts;*.3gp|Audio files (*.mp3;*.wav;*.ogg;*.aac;*.m4a;*.opus;*.flac;*.mka;*.wma;*.aiff;*.aif;*.wv;*.ape)|*.mp3;*.wav;*.ogg;*.aac;*.m4a;*.opus;*.flac;*.mka;*.wma;*.aiff;*.aif;*.wv;*.ape|Video files (*.mp4;*.webm;*.ogv;*.mpg;*.mpeg;*.mkv;*.mov;*.m4v;*.avi;*.wmv;*.flv;*.ts;*.m2ts;*.mts;*.3gp)|*.mp4;*.webm;*.ogv;*.mpg;*.mpeg;*.mkv;*.mov;*.m4v;*.avi;*.wmv;*.flv;*.ts;*.m2ts;*.mts;*.3gp|All Files (*.*)|*.*"
                 $dialog.Title = "Select an audio or video file"
                 $dialog.Multiselect = $false
                 $result = $dialog.ShowDialog()
@@ -220,7 +331,7 @@ def open_file_endpoint():
                             'kdialog',
                             '--getopenfilename',
                             '.',
-                            'Audio and Video files (*.mp3 *.wav *.ogg *.aac *.m4a *.opus *.mp4 *.webm *.ogv *.mpg *.mpeg)|Audio files (*.mp3 *.wav *.ogg *.aac *.m4a *.opus)|Video files (*.mp4 *.webm *.ogv *.mpg *.mpeg)|All files (*)'
+                            'Audio and Video files (*.mp3 *.wav *.ogg *.aac *.m4a *.opus *.flac *.mka *.wma *.aiff *.aif *.wv *.ape *.mp4 *.webm *.ogv *.mpg *.mpeg *.mkv *.mov *.m4v *.avi *.wmv *.flv *.ts *.m2ts *.mts *.3gp)|Audio files (*.mp3 *.wav *.ogg *.aac *.m4a *.opus *.flac *.mka *.wma *.aiff *.aif *.wv *.ape)|Video files (*.mp4 *.webm *.ogv *.mpg *.mpeg *.mkv *.mov *.m4v *.avi *.wmv *.flv *.ts *.m2ts *.mts *.3gp)|All files (*)'
                         ]
                     },
                     # Try zenity second (better for GNOME environments)
@@ -230,9 +341,9 @@ def open_file_endpoint():
                             'zenity',
                             '--file-selection',
                             '--title=Select an audio or video file',
-                            '--file-filter=Audio and Video files | *.mp3 *.wav *.ogg *.aac *.m4a *.opus *.mp4 *.webm *.ogv *.mpg *.mpeg',
-                            '--file-filter=Audio files | *.mp3 *.wav *.ogg *.aac *.m4a *.opus',
-                            '--file-filter=Video files | *.mp4 *.webm *.ogv *.mpg *.mpeg',
+                            '--file-filter=Audio and Video files | *.mp3 *.wav *.ogg *.aac *.m4a *.opus *.flac *.mka *.wma *.aiff *.aif *.wv *.ape *.mp4 *.webm *.ogv *.mpg *.mpeg *.mkv *.mov *.m4v *.avi *.wmv *.flv *.ts *.m2ts *.mts *.3gp',
+                            '--file-filter=Audio files | *.mp3 *.wav *.ogg *.aac *.m4a *.opus *.flac *.mka *.wma *.aiff *.aif *.wv *.ape',
+                            '--file-filter=Video files | *.mp4 *.webm *.ogv *.mpg *.mpeg *.mkv *.mov *.m4v *.avi *.wmv *.flv *.ts *.m2ts *.mts *.3gp',
                             '--file-filter=All files | *'
                         ]
                     },
@@ -329,6 +440,7 @@ def open_file_endpoint():
             if id:
                 socketio.emit("file_submitted", {"id": id})
                 router_to_all_dealers(socket, worker_identities, "new_job_submission")
+                preempt_if_outranked()
                 socketio.emit("new_job_submission", {"timestamp": time.time() * 1000})
 
         except Exception as e:
@@ -350,6 +462,9 @@ def open_file_endpoint():
 def fetch_media_previews_endpoint():
     preview_data = db.fetch_media_previews()
 
+    # Adds an 'eta' to each processing/queued item
+    queue_eta = analytics.estimate_queue(preview_data["processing"], preview_data["queued"])
+
     processor_status = shared_dict.read('processor_status')
     active_job_status = shared_dict.read('active_job_status')
 
@@ -360,10 +475,153 @@ def fetch_media_previews_endpoint():
         "success": preview_data["success"],
         "processor_status": processor_status,
         "active_job_status": active_job_status,
+        "queue_eta_seconds": queue_eta,
     }
 
     return jsonify(return_data), 200
 
+#######################################################################
+#   Job metrics
+#######################################################################
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics_endpoint():
+    # Optional filters: ?window=<seconds back from now>&job_type=<main|metadata>
+    window = request.args.get("window", type=float)
+    job_type = request.args.get("job_type")
+    since = time.time() - window if window else None
+
+    return jsonify({
+        "stages": db.fetch_job_metrics_summary(since=since, job_type=job_type)
+    }), 200
+
+#######################################################################
+#   Analytics (cost models, throughput, queue ETAs)
+#######################################################################
+
+@app.route("/api/analytics/report", methods=["GET"])
+def analytics_report_endpoint():
+    return jsonify(analytics.build_report()), 200
+
+#######################################################################
+#   Memory debugging
+#######################################################################
+
+@app.route("/api/debug/memory", methods=["GET"])
+def debug_memory_endpoint():
+    # RSS per process role, recent samples, per-job peaks and tracemalloc diffs
+    return jsonify(memory_tracking.get_report()), 200
+
+@app.route("/api/debug/memory/tracemalloc", methods=["POST"])
+def set_tracemalloc_endpoint():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict) or not isinstance(data.get("enabled"), bool):
+        return jsonify({"error": "Expected {\"enabled\": true|false}"}), 400
+    enabled = data["enabled"]
+
+    # Takes effect at the end of the next job (first diff comes one job after that)
+    db.set_setting('tracemalloc_enabled', enabled)
+    socketio.emit("settings_update")
+
+    return jsonify({"tracemalloc_enabled": enabled}), 200
+
+#######################################################################
+#   Sampling profiler
+#######################################################################
+
+@app.route("/api/debug/profiler/start", methods=["POST"])
+def start_profiler_endpoint():
+    # Optional: duration (s, max 300), interval (s), threads (roles: flask, parent_listener, diarize_loop,
+    # metadata_loop, ..., and the job worker processes: diarize_worker, io_worker)
+    data = request.get_json(silent=True) or {}
+    try:
+        duration = float(data.get("duration", 30))
+        interval = float(data.get("interval", sampling_profiler.DEFAULT_INTERVAL))
+    except (TypeError, ValueError):
+        return jsonify({"error": "duration and interval must be numbers"}), 400
+    if not (duration > 0 and interval > 0):
+        return jsonify({"error": "duration and interval must be positive"}), 400
+    roles = data.get("threads")
+    if roles is not None and (not isinstance(roles, list) or not all(isinstance(role, str) for role in roles)):
+        return jsonify({"error": "threads must be a list of role names"}), 400
+
+    profiler_status = sampling_profiler.start(duration=duration, interval=interval, roles=roles)
+
+    if profiler_status is None:
+        return jsonify({"error": "Profiler already running"}), 409
+
+    return jsonify(profiler_status), 200
+
+@app.route("/api/debug/profiler/stop", methods=["POST"])
+def stop_profiler_endpoint():
+    profiler_status = sampling_profiler.stop()
+    if profiler_status is None:
+        return jsonify({"error": "Profiler has not been started"}), 404
+    return jsonify(profiler_status), 200
+
+@app.route("/api/debug/profiler/status", methods=["GET"])
+def profiler_status_endpoint():
+    return jsonify(sampling_profiler.status()), 200
+
+@app.route("/api/debug/profiler/result", methods=["GET"])
+def profiler_result_endpoint():
+    # ?format=collapsed (default) or speedscope
+    stacks, interval = sampling_profiler.get_result()
+    if stacks is None:
+        return jsonify({"error": "Profiler has not been started"}), 404
+
+    if request.args.get("format") == "speedscope":
+        return jsonify(sampling_profiler.to_speedscope(stacks, interval)), 200
+
+    return app.response_class(
+        response=sampling_profiler.to_collapsed(stacks), status=200, mimetype="text/plain"
+    )
+
+#######################################################################
+#   Prometheus metrics
+#######################################################################
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics_endpoint():
+    return app.response_class(
+        response=prometheus.render(), status=200, mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@app.teardown_request
+def record_request_errors(exc):
+    if isinstance(exc, sqlite3.OperationalError) and prometheus.is_sqlite_busy_error(exc):
+        prometheus.observe_sqlite_busy('http')
+
+#######################################################################
+#   Request instrumentation
+#######################################################################
+
+@app.before_request
+def start_request_timer():
+    request.environ['zanshin.request_start'] = time.perf_counter()
+
+@app.after_request
+def record_request_stats(response):
+    start = request.environ.get('zanshin.request_start')
+    if start is not None:
+        # Group by route pattern (not path) to keep the number of series bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_stats.record(
+            route,
+            request.method,
+            response.status_code,
+            time.perf_counter() - start,
+            response.content_length,
+            request.path,
+            request.query_string
+        )
+    return response
+
+@app.route("/api/debug/requests", methods=["GET"])
+def debug_requests_endpoint():
+    # Per-route latency percentiles + histogram, response bytes, status codes, slow requests
+    return jsonify(request_stats.get_report()), 200
+
 #######################################################################
 #   Fetch media item
 #######################################################################
@@ -378,6 +636,10 @@ def fetch_media_item_endpoint():
     id = data["id"]
     media_data = db.fetch_media_item(id, router_socket=socket)
     if media_data:
+        if media_data.get('source') == 'local':
+            media_data.update(get_stream_info(id))
+            media_data['audio_proxy'] = has_proxy(id)
+
         # Show welcome dialog only on first call, if first_run is True, AND if processing status for this id is success
         show_welcome = (shared_dict.read('first_run') and not welcome_dialog_shown and media_data.get('status') == 'success')
         if show_welcome:
@@ -402,9 +664,21 @@ def delete_media_item_endpoint():
     data = request.json
     ids = data["ids"]
 
+    # Stop the job if it's currently being processed
+    active_id = shared_dict.read('active_job_id')
+    if active_id in ids:
+        router_to_dealer(socket, "diarize_loop".encode(), cancel_command(active_id, 'deleted'))
+
     def delete_thread():
         try:
             db.delete_media_item(ids)
+            speaker_index.get_index().remove_media(ids)
+            for id in ids:
+                invalidate_stream_handle(id)
+                remove_cached_remuxes(id)
+                remove_proxy(id)
+                remove_packages(id)
+                remove_renders(id)
         except Exception as e:
             print(f"Error deleting media items: {str(e)}")
         finally:
@@ -517,6 +791,57 @@ def set_auto_skip_disabled_speakers_endpoint():
     db.set_auto_skip_disabled_speakers(id, auto_skip_disabled_speakers)
     return "", 200
 
+#######################################################################
+#   Speakers (library-wide speaker index, named identities)
+#######################################################################
+
+MAX_SIMILAR_SPEAKERS = 100
+MAX_SPEAKER_NAME_LENGTH = 200
+
+@app.route("/api/speakers/similar", methods=["POST"])
+def similar_speakers_endpoint():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("id"), str) or not isinstance(data.get("speaker_id"), str):
+        return "", 400
+
+    id = data["id"]
+    speaker_id = data["speaker_id"]
+    try:
+        k = int(data.get("k", 10))
+    except (TypeError, ValueError, OverflowError):
+        return "", 400
+    k = min(max(1, k), MAX_SIMILAR_SPEAKERS)
+
+    index = speaker_index.get_index()
+    centroid = index.lookup(id, speaker_id)
+    if centroid is None:
+        # Not indexed (yet); fall back to the stored centroid
+        centroids = db.fetch_speaker_centroids(id)
+        if not centroids or speaker_id not in centroids:
+            return "", 404
+        centroid = centroids[speaker_id]
+
+    matches = index.query(centroid, k=k, exclude_media_id=id)
+
+    # Attach names given to matched speakers
+    names = db.fetch_speaker_names_for([(match["media_id"], match["speaker_id"]) for match in matches])
+    for match in matches:
+        match["name"] = names.get((match["media_id"], match["speaker_id"]))
+
+    return jsonify({"matches": matches}), 200
+
+@app.route("/api/speakers/set_name", methods=["POST"])
+def set_speaker_name_endpoint():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("id"), str) or not isinstance(data.get("speaker_id"), str):
+        return "", 400
+    # An empty name removes it
+    if not isinstance(data.get("name"), str) or len(data["name"]) > MAX_SPEAKER_NAME_LENGTH:
+        return "", 400
+
+    db.set_speaker_name(data["id"], data["speaker_id"], data["name"])
+    return "", 200
+
 #######################################################################
 #   Settings
 #######################################################################
@@ -565,62 +890,82 @@ def get_thumbnail(id):
     # Check if low_res parameter is provided
     low_res = request.args.get('low_res', 'false').lower() == 'true'
 
-    conn = sqlite3.connect(config.DB_PATH)
-    cursor = conn.cursor()
-
-    if low_res:
-        # For low_res request: prefer low_res, fallback to high_res
-        cursor.execute(
-            "SELECT COALESCE(thumbnail_low_res, thumbnail) as thumbnail_data FROM media WHERE id = ?",
-            (id,)
-        )
-        etag_suffix = "-low"
-    else:
-        # For regular request: just return high_res
-        cursor.execute("SELECT thumbnail FROM media WHERE id = ?", (id,))
-        etag_suffix = ""
+    validators = db.fetch_thumbnail_validators(id, low_res)
+    if not validators:
+        return "", 404
+    content_hash, updated_t, column = validators
 
-    result = cursor.fetchone()
-    conn.close()
+    # Revalidation is answered without reading the BLOB
+    if content_hash and is_image_not_modified(content_hash, updated_t):
+        return image_not_modified_response(content_hash, updated_t)
 
-    if result and result[0]:
-        image_data = result[0]
-        response = app.response_class(
-            response=image_data, status=200, mimetype="image/jpeg"
-        )
-        # Add cache headers
-        response.headers["Cache-Control"] = "max-age=86400"  # Cache for 24 hours
-        response.headers["ETag"] = f'"{id}{etag_suffix}"'
-        return response
-    else:
+    image_data = db.fetch_thumbnail(id, low_res)
+    if not image_data:
         return "", 404
 
+    # Thumbnails written before hashes were stored get one on first fetch
+    if not content_hash:
+        content_hash = get_data_hash(image_data)
+        db.set_thumbnail_hash(id, column, content_hash)
+
+    prometheus.observe_bytes('thumbnail', len(image_data))
+    return image_response(image_data, content_hash, updated_t)
+
 #######################################################################
 #   Thumbnail preview frames
 #######################################################################
 
 @app.route("/api/frame/<id>/<int:timestamp>", methods=["GET"])
 def get_frame(id, timestamp):
-    conn = sqlite3.connect(config.DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT frame FROM frames WHERE media_id = ? AND timestamp = ?", (id, timestamp))
-    result = cursor.fetchone()
-    conn.close()
-
-    if result and result[0]:
-        # The frame data is already binary
-        frame_data = result[0]
-        # Create a response with the binary data
-        response = app.response_class(
-            response=frame_data, status=200, mimetype="image/jpeg"
-        )
-        # Add cache headers
-        response.headers["Cache-Control"] = "max-age=86400"  # Cache for 24 hours
-        response.headers["ETag"] = f'"{id}-{timestamp}"'
-        return response
-    else:
+    validators = db.fetch_frame_validators(id, timestamp)
+    if not validators:
+        return "", 404
+    content_hash, created_t = validators
+
+    # Revalidation is answered without reading the BLOB
+    if content_hash and is_image_not_modified(content_hash, created_t):
+        return image_not_modified_response(content_hash, created_t)
+
+    frame_data = db.fetch_frame(id, timestamp)
+    if not frame_data:
         return "", 404
 
+    # Frames written before hashes were stored get one on first fetch
+    if not content_hash:
+        content_hash = get_data_hash(frame_data)
+        db.set_frame_hash(id, timestamp, content_hash)
+
+    prometheus.observe_bytes('frame', len(frame_data))
+    return image_response(frame_data, content_hash, created_t)
+
+#######################################################################
+#   Image responses (thumbnails, frames)
+#######################################################################
+
+def is_image_not_modified(content_hash, updated_t):
+    # If-Modified-Since only counts when there's no If-None-Match (RFC 9110 13.1.3)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(content_hash)
+    if_modified_since = request.if_modified_since
+    return bool(updated_t and if_modified_since and int(updated_t) <= if_modified_since.timestamp())
+
+def add_image_cache_headers(response, content_hash, updated_t):
+    response.headers["Cache-Control"] = "max-age=86400"  # Cache for 24 hours
+    response.set_etag(content_hash)
+    if updated_t:
+        response.last_modified = int(updated_t)
+    return response
+
+def image_not_modified_response(content_hash, updated_t):
+    return add_image_cache_headers(app.response_class(status=304), content_hash, updated_t)
+
+def image_response(image_data, content_hash, updated_t):
+    # The image data is already binary
+    response = app.response_class(
+        response=image_data, status=200, mimetype="image/jpeg"
+    )
+    return add_image_cache_headers(response, content_hash, updated_t)
+
 #######################################################################
 #   Stream local media file
 #######################################################################
@@ -629,6 +974,41 @@ def get_frame(id, timestamp):
 def stream_local_file_endpoint(id):
     return stream_local_file(id)
 
+@app.route("/api/stream/<id>/seek_point", methods=["GET"])
+def stream_seek_point_endpoint(id):
+    # For items streamed live (stream_mode "live"): where /api/stream/<id>?t=<start> will start
+    t = request.args.get("t", 0.0, type=float)
+    start = get_stream_seek_point(id, t)
+    if start is None:
+        return "", 404
+    return jsonify({"start": start}), 200
+
+@app.route("/api/hls/<id>/<name>", methods=["GET"])
+def hls_endpoint(id, name):
+    return serve_hls(id, name)
+
+@app.route("/api/render/<id>", methods=["GET"])
+def render_endpoint(id):
+    return stream_render(id)
+
+@app.route("/api/render/<id>/edl", methods=["GET"])
+def render_edl_endpoint(id):
+    # Clips ([start, end, speed] in source time) and the render's duration, for mapping between the two
+    # timelines, and its stream_mode ("cached" or "live"); ?variant=audio as for /api/render/<id>
+    variant = request.args.get("variant", "video")
+    if variant not in VARIANTS:
+        return jsonify({"error": f"Unknown variant: {variant}"}), 400
+    edl = get_render_info(id, variant)
+    if edl is None:
+        return "", 404
+    return jsonify(edl), 200
+
+@app.route("/api/render/<id>/seek_point", methods=["GET"])
+def render_seek_point_endpoint(id):
+    # Renders are re-encoded throughout, so /api/render/<id>?t=<t> starts right at t
+    t = request.args.get("t", 0.0, type=float)
+    return jsonify({"start": max(t, 0.0)}), 200
+
 #######################################################################
 #   Third party licenses
 #######################################################################
@@ -725,11 +1105,8 @@ def serve_packaged_third_party_licenses():
 @app.route('/', defaults={'path': 'index.html'})
 @app.route('/<path:path>')
 def serve_static(path):
-    try:
-        return send_from_directory('ui_dist', path)
-    except:
-        # Fallback for SPA routing - return index.html for paths that don't exist as files
-        return send_from_directory('ui_dist', 'index.html')
+    # Precompressed variants, immutable caching for hashed assets, SPA fallback to index.html
+    return static_assets.serve_asset(path)
 
 #######################################################################
 #   Websocket handlers
@@ -748,8 +1125,35 @@ def handle_disconnect():
 #   main()
 #######################################################################
 
-def main(dev_mode=False, no_browser=False, first_run=False, port=1776):
-    global context, socket, worker_identities, version
+def run_diarize_loop(address):
+    # senko, yt_dlp, ffmpeg etc. are imported here rather than at module import
+    from diarize_loop import diarize_loop
+    diarize_loop(address)
+
+def run_metadata_loop(address):
+    from metadata_loop import metadata_loop
+    metadata_loop(address)
+
+def handle_sigterm(signum, frame):
+    print("Received SIGTERM, shutting down")
+    kill_all_workers()
+    # os._exit skips atexit, where the index would otherwise be flushed
+    speaker_index.flush_index()
+    sys.stdout.flush()
+    os._exit(0)
+
+def main(dev_mode=False, no_browser=False, first_run=False, port=1776, request_log=False,
+         server_mode=False, server_backend=None, max_connections=wsgi_server.DEFAULT_MAX_CONNECTIONS,
+         keep_alive_timeout=wsgi_server.DEFAULT_KEEP_ALIVE_TIMEOUT):
+    global context, socket, version
+
+    request_stats.log_requests = request_log
+
+    # Server mode: headless (no browser), on the bounded threaded server unless told otherwise
+    if server_mode:
+        no_browser = True
+    if server_backend is None:
+        server_backend = "threaded" if server_mode else "werkzeug"
 
     shared_dict.write('first_run', first_run)
 
@@ -773,6 +1177,7 @@ def main(dev_mode=False, no_browser=False, first_run=False, port=1776):
 
     # Init db
     db.initialize()
+    startup_timer.mark('migrations')
 
     if dev_mode:
         db.vacuum()
@@ -783,6 +1188,11 @@ def main(dev_mode=False, no_browser=False, first_run=False, port=1776):
 
     # Create temp directory / clean it if it already exists
     create_or_clean_dir(config.PROCESSING_TEMP_DIR)
+    startup_timer.mark('db_init')
+
+    # Index ui_dist (in dev mode it's re-indexed whenever the UI is rebuilt)
+    static_assets.load_manifest(watch=dev_mode)
+    startup_timer.mark('static_manifest')
 
     # ZeroMQ setup
     address = "tcp://127.0.0.1:5545"
@@ -792,36 +1202,43 @@ def main(dev_mode=False, no_browser=False, first_run=False, port=1776):
 
     print(f'Zanshin v{version} starting on port {port}... {"(development mode)" if dev_mode else ""}')
 
-    # Job processing threads
-    diarization_thread = threading.Thread(target=diarize_loop, args=(address,), daemon=True)
-    metadata_thread = threading.Thread(target=metadata_loop, args=(address,), daemon=True)
+    # RSS sampling for /api/debug/memory + per-job peak memory
+    memory_tracking.start_sampler()
+
+    # The launcher quits the app with SIGTERM, which runs neither atexit nor multiprocessing's
+    # cleanup: job workers (in process groups of their own) would finish their task orphaned
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    # Job processing threads (they import their heavy dependencies themselves, off the startup path)
+    diarization_thread = threading.Thread(target=run_diarize_loop, args=(address,), name="diarize_loop", daemon=True)
+    metadata_thread = threading.Thread(target=run_metadata_loop, args=(address,), name="metadata_loop", daemon=True)
     diarization_thread.start()
     metadata_thread.start()
+    prometheus.register_worker('diarize_loop', diarization_thread)
+    prometheus.register_worker('metadata_loop', metadata_thread)
 
-    # Wait for dealers to connect to router
-    worker_identities = collect_dealers(socket, expected_count=2)
-
-    # Thread to relay dealers' messages to client
+    # Thread to relay dealers' messages to client. Dealers register whenever their loop
+    # has finished importing, so the server doesn't wait for them
     def parent_listener():
+        global worker_identities
         while True:
-            _ = socket.recv()  # Identity frame
+            identity = socket.recv()  # Identity frame
             content = socket.recv()
+            prometheus.observe_dealer_message(identity.decode("utf-8"))
             message = content.decode("utf-8")
+            if message == "DEALER_REGISTRATION":
+                # New set rather than add(): request threads iterate it without a lock
+                worker_identities = worker_identities | {identity}
+                continue
             data = json.loads(message)
             socketio.emit(data["message_type"], data["content"])
 
-    listener_thread = threading.Thread(target=parent_listener, daemon=True)
+    listener_thread = threading.Thread(target=parent_listener, name="parent_listener", daemon=True)
     listener_thread.start()
-
-    # Notify Tauri that backend has started
-    rust_comms.send({
-        "status": "started app"
-    })
+    startup_timer.mark('zmq_setup')
 
     # Open browser to localhost:{port}
     def open_browser():
-        time.sleep(1.5)
-
         if config.RUNNING_WSL:
             # WSL: Use PowerShell to open browser in Windows
             try:
@@ -843,12 +1260,33 @@ def main(dev_mode=False, no_browser=False, first_run=False, port=1776):
             # other systems: use webbrowser module
             webbrowser.open(f"http://localhost:{port}")
 
-    if not no_browser:
-        browser_thread = threading.Thread(target=open_browser, daemon=True)
-        browser_thread.start()
+    # Once the server accepts connections: report startup timing, notify Tauri, open the browser
+    def on_server_ready():
+        if not startup_timer.wait_for_port(port):
+            print(f"Server didn't start accepting connections on port {port}")
+            return
+        startup_timer.mark('server_bind')
+
+        startup_timing = startup_timer.get_report()
+        print(startup_timer.format_report(startup_timing))
+
+        # Notify Tauri that backend has started
+        rust_comms.send({
+            "status": "started app",
+            "startup_timing": startup_timing
+        })
+
+        if not no_browser:
+            open_browser()
+
+    ready_thread = threading.Thread(target=on_server_ready, name="startup_ready", daemon=True)
+    ready_thread.start()
 
     # Run Flask HTTP + Websocket server
-    socketio.run(app, host="0.0.0.0", port=port, debug=False, allow_unsafe_werkzeug=True)
+    if server_backend == "threaded":
+        wsgi_server.run_threaded(app, "0.0.0.0", port, max_connections, keep_alive_timeout)
+    else:
+        socketio.run(app, host="0.0.0.0", port=port, debug=False, allow_unsafe_werkzeug=True)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -856,6 +1294,21 @@ if __name__ == "__main__":
     parser.add_argument('--no-browser', action='store_true', help='Don\'t open browser automatically')
     parser.add_argument('--first-run', action='store_true', help='Indicates this is the first run of the application')
     parser.add_argument('--port', type=int, default=1776, help='Port to run the server on (default: 1776)')
+    parser.add_argument('--request-log', action='store_true', help='Log every API request as a JSON line (query values redacted)')
+    parser.add_argument('--server-mode', action='store_true', help='Run headless as a server (no browser; threaded server backend by default)')
+    parser.add_argument('--server-backend', choices=['werkzeug', 'threaded'], default=None, help='HTTP server: werkzeug dev server, or bounded threaded server (default: threaded with --server-mode, else werkzeug)')
+    parser.add_argument('--max-connections', type=int, default=wsgi_server.DEFAULT_MAX_CONNECTIONS, help=f'Threaded backend: connections served at once (default: {wsgi_server.DEFAULT_MAX_CONNECTIONS})')
+    parser.add_argument('--keep-alive-timeout', type=float, default=wsgi_server.DEFAULT_KEEP_ALIVE_TIMEOUT, help=f'Threaded backend: seconds an idle connection is kept open (default: {wsgi_server.DEFAULT_KEEP_ALIVE_TIMEOUT:g})')
     args = parser.parse_args()
 
-    main(dev_mode=args.dev, no_browser=args.no_browser, first_run=args.first_run, port=args.port)
+    main(
+        dev_mode=args.dev,
+        no_browser=args.no_browser,
+        first_run=args.first_run,
+        port=args.port,
+        request_log=args.request_log,
+        server_mode=args.server_mode,
+        server_backend=args.server_backend,
+        max_connections=args.max_connections,
+        keep_alive_timeout=args.keep_alive_timeout
+    )
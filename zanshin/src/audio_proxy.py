@@ -0,0 +1,141 @@
+import os
+import threading
+import subprocess
+import ffmpeg
+import media_cache
+
+#######################################################################
+#   Audio proxies (/api/stream/<id>?variant=audio)
+#######################################################################
+
+# Listening to a local recording shouldn't mean streaming gigabytes of video. A proxy
+# is a small speech-quality AAC copy of an item's audio (~15MB per hour), served in
+# place of the file for ?variant=audio. It's encoded from the 16kHz mono wav the
+# diarize loop decodes anyway, in an ffmpeg process running alongside diarization, so
+# it costs no extra decode of the source. Items processed before proxies existed get
+# theirs from the source file, in the background, the first time one is asked for.
+#
+# Proxies live in STREAM_CACHE_DIR/audio_proxy/ until their item is deleted; they're
+# not trimmed like the other caches (regenerating one means reading the whole source).
+
+PROXY_KIND = "audio_proxy"
+PROXY_BITRATE = 32_000              # bits/s
+PROXY_SAMPLE_RATE = 16000
+WAV_BYTES_PER_SECOND = 32_000       # decompress_audio's 16kHz mono s16le
+
+# Not worth it unless the source is at least this many times the proxy's size
+MIN_SAVING_FACTOR = 4
+
+source_builds_lock = threading.Lock()
+source_builds = set()               # ids being encoded from their source file
+too_small = set()                   # ids whose source is too small to need a proxy
+
+def get_proxy_path(id):
+    return os.path.join(media_cache.get_cache_dir(PROXY_KIND), f"{id}.m4a")
+
+def has_proxy(id):
+    return os.path.exists(get_proxy_path(id))
+
+def is_worth_it(source_size, duration):
+    return source_size > MIN_SAVING_FACTOR * duration * PROXY_BITRATE / 8
+
+def get_output_args():
+    return {
+        "format": "mp4",
+        "vn": None,
+        "sn": None,
+        "dn": None,
+        "acodec": "aac",
+        "audio_bitrate": PROXY_BITRATE,
+        "ac": 1,
+        "ar": PROXY_SAMPLE_RATE,
+        "movflags": "+faststart"
+    }
+
+def start_encode(id, source_file, wav_file):
+    """
+    Start encoding id's proxy from wav_file (decompress_audio's output) if source_file is
+    big enough for it to pay off. Returns the ffmpeg process, for finish_encode/cancel_encode, or None.
+    """
+    try:
+        duration = max(os.path.getsize(wav_file) - 44, 0) / WAV_BYTES_PER_SECOND
+        if not is_worth_it(os.path.getsize(source_file), duration):
+            return None
+    except OSError:
+        return None
+
+    stream = ffmpeg.input(wav_file).output(media_cache.get_part_path(get_proxy_path(id)), **get_output_args()).overwrite_output()
+    try:
+        # stderr isn't read, so it mustn't be a pipe (ffmpeg's progress output would fill it)
+        return subprocess.Popen(
+            ffmpeg.compile(stream),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+    except OSError as e:
+        print(f"Error starting audio proxy encode: {str(e)}")
+        return None
+
+def finish_encode(process, id):
+    """Wait for start_encode's process and put the proxy in place; True if it succeeded"""
+    if process is None:
+        return False
+    proxy_path = get_proxy_path(id)
+    part_path = media_cache.get_part_path(proxy_path)
+    if process.wait() != 0:
+        print(f"Error encoding audio proxy for {id} (ffmpeg exited with {process.returncode})")
+        media_cache.remove_file(part_path)
+        return False
+    try:
+        os.replace(part_path, proxy_path)
+    except OSError as e:
+        print(f"Error saving audio proxy for {id}: {str(e)}")
+        return False
+    return True
+
+def cancel_encode(process, id):
+    if process is None:
+        return
+    if process.poll() is None:
+        process.kill()
+    process.wait()
+    media_cache.remove_file(media_cache.get_part_path(get_proxy_path(id)))
+
+def build_from_source(id, source_file):
+    """Encode id's proxy from its source file in the background (once at a time per item)"""
+    with source_builds_lock:
+        if id in source_builds or id in too_small:
+            return
+        source_builds.add(id)
+
+    threading.Thread(target=encode_from_source, args=(id, source_file), name="audio_proxy_build", daemon=True).start()
+
+def encode_from_source(id, source_file):
+    proxy_path = get_proxy_path(id)
+    part_path = media_cache.get_part_path(proxy_path)
+    try:
+        try:
+            duration = float(ffmpeg.probe(source_file)["format"]["duration"])
+        except (ffmpeg.Error, KeyError, ValueError):
+            duration = None
+        if duration is not None and not is_worth_it(os.path.getsize(source_file), duration):
+            with source_builds_lock:
+                too_small.add(id)
+            return
+
+        print(f"Encoding audio proxy for {id}")
+        ffmpeg.input(source_file).output(part_path, **get_output_args()).run(quiet=True, overwrite_output=True)
+        os.replace(part_path, proxy_path)
+    except ffmpeg.Error as e:
+        print(f"Error encoding audio proxy for {id}: {e.stderr.decode(errors='replace')}")
+        media_cache.remove_file(part_path)
+    except Exception as e:
+        print(f"Error encoding audio proxy for {id}: {str(e)}")
+        media_cache.remove_file(part_path)
+    finally:
+        with source_builds_lock:
+            source_builds.discard(id)
+
+def remove_proxy(id):
+    media_cache.remove_file(get_proxy_path(id))
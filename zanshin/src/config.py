@@ -9,6 +9,7 @@ ROOT = os.path.dirname(SCRIPT_DIR)
 
 DB_PATH = os.path.join(ROOT, 'media.db')
 SETTINGS_PATH = os.path.join(ROOT, 'settings.json')
+SPEAKER_INDEX_PATH = os.path.join(ROOT, 'speaker_index.npz')
 
 if IS_PACKAGED:
     FFMPEG_DIR = os.path.join(ROOT, 'third_party', 'ffmpeg')
@@ -20,6 +21,10 @@ if IS_PACKAGED:
 
 PROCESSING_TEMP_DIR = os.path.join(SCRIPT_DIR, 'temp')
 
+UI_DIST_DIR = os.path.join(SCRIPT_DIR, 'ui_dist')
+
+STREAM_CACHE_DIR = os.path.join(ROOT, 'stream_cache')
+
 RUNNING_DARWIN = platform.system() == 'Darwin'
 RUNNING_LINUX = platform.system() == 'Linux'
 
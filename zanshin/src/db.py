@@ -4,8 +4,10 @@ import random
 import string
 import signal
 import json
+import time
 import numpy as np
 from misc import resolve_bookmark
+import scheduler
 import config
 
 #######################################################################
@@ -35,6 +37,24 @@ def initialize(db_path=config.DB_PATH):
     else:
         add_missing_columns(cursor, 'frames', get_frames_columns())
 
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='job_metrics'")
+    job_metrics_table_exists = cursor.fetchone() is not None
+
+    if not db_exists or not job_metrics_table_exists:
+        cursor.execute(get_create_job_metrics_table_sql())
+        cursor.execute("CREATE INDEX idx_job_metrics_stage ON job_metrics(stage, started_t)")
+    else:
+        add_missing_columns(cursor, 'job_metrics', get_job_metrics_columns())
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='speaker_names'")
+    speaker_names_table_exists = cursor.fetchone() is not None
+
+    if not db_exists or not speaker_names_table_exists:
+        cursor.execute(get_create_speaker_names_table_sql())
+        cursor.execute("CREATE INDEX idx_speaker_names_media_id ON speaker_names(media_id)")
+    else:
+        add_missing_columns(cursor, 'speaker_names', get_speaker_names_columns())
+
     conn.commit()
     conn.close()
 
@@ -57,6 +77,9 @@ def get_media_columns():
         'aspect_ratio': 'REAL DEFAULT NULL',                # (e.g. 16:9 = 16/9)
         'thumbnail': 'BLOB DEFAULT NULL',                   # jpeg raw data,
         'thumbnail_low_res': 'BLOB DEFAULT NULL',           # jpeg raw data (low res for list view) (3x downsample)
+        'thumbnail_hash': 'TEXT DEFAULT NULL',              # content hash of thumbnail (ETag)
+        'thumbnail_low_res_hash': 'TEXT DEFAULT NULL',      # content hash of thumbnail_low_res (ETag)
+        'thumbnail_updated_t': 'INTEGER DEFAULT NULL',      # unix time thumbnail was last written (Last-Modified)
 
         # ============================================================================================
         #  Local
@@ -90,8 +113,10 @@ def get_media_columns():
         'submitted_t': 'INTEGER NOT NULL',                  # job sumitted timestamp
         'started_t': 'INTEGER DEFAULT NULL',                # job started processing timestamp
         'finished_t': 'INTEGER DEFAULT NULL',               # UNIX timestamp for when finished processing
-        'error': 'TEXT DEFAULT NULL',                       # download error json dict, fields 'type': {age_restricted, bot, interrupted, no_speakers, other}, 'full_str'
+        'error': 'TEXT DEFAULT NULL',                       # download error json dict, fields 'type': {age_restricted, bot, interrupted, no_speakers, cancelled, other}, 'full_str'
         'diarization_time': 'REAL DEFAULT NULL',            # Seconds taken to diarize
+        'priority': 'INTEGER DEFAULT 0',                    # higher runs first; ties broken by the scheduling_policy setting
+        'pinned': 'BOOLEAN DEFAULT 0',                      # pinned items run before everything else in the queue
 
         # ============================================================================================
         #  Diarization data
@@ -102,6 +127,8 @@ def get_media_columns():
         'speaker_centroids': 'TEXT DEFAULT NULL',
         'speaker_color_sets': 'TEXT DEFAULT NULL',
         'timing_stats': 'TEXT DEFAULT NULL',                # JSON: total_time, vad_time, fbank_time, embeddings_time, clustering_time
+        'provisional_segments': 'TEXT DEFAULT NULL',        # JSON: merged segments accumulated so far while incrementally diarizing; cleared once final result is written
+        'peak_memory': 'TEXT DEFAULT NULL',                 # JSON: {process role: peak RSS bytes} sampled while the job ran
 
         # ============================================================================================
         #  Saved player state
@@ -205,7 +232,8 @@ def cleanup_interrupted_jobs(db_path=config.DB_PATH):
                 UPDATE media
                 SET status = 'failed',
                     finished_t = strftime('%s', 'now'),
-                    error = ?
+                    error = ?,
+                    provisional_segments = NULL
                 WHERE id = ?
             """, (json.dumps({'type': 'interrupted', 'full_str': 'Processing interrupted'}), job_id))
 
@@ -280,6 +308,8 @@ def fetch_media_previews(db_path=config.DB_PATH):
            submitted_t,
            started_t,
            finished_t,
+           priority,
+           pinned,
            error,
            metadata_error,
            CASE WHEN thumbnail IS NOT NULL THEN 1 ELSE 0 END as thumbnail_exists
@@ -315,7 +345,11 @@ def fetch_media_previews(db_path=config.DB_PATH):
     processing_items.sort(key=lambda x: x["started_t"] or 0)  # Oldest first
 
     queued_items = [item for item in all_media if item["status"] == "queued"]
-    queued_items.sort(key=lambda x: x["submitted_t"] or 0)  # Oldest first
+    queued_items = scheduler.order_queue(  # Processing order
+        queued_items,
+        get_setting('scheduling_policy'),
+        unknown_duration=scheduler.get_median_duration(item["duration"] for item in all_media)
+    )
 
     failed_items = [item for item in all_media if item["status"] == "failed"]
     failed_items.sort(key=lambda x: -(x["finished_t"] or 0))  # Newest first
@@ -355,6 +389,31 @@ def fetch_speaker_centroids(id, db_path=config.DB_PATH):
 
     return None
 
+# Fetch speaker centroids of every diarized media item (for building the speaker index)
+def fetch_all_speaker_centroids(db_path=config.DB_PATH):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, speaker_centroids FROM media WHERE status = 'success' AND speaker_centroids IS NOT NULL ORDER BY finished_t"
+    )
+
+    for id, centroids_json in cursor:
+        centroids_dict = json.loads(centroids_json)
+        for speaker_id in centroids_dict:
+            centroids_dict[speaker_id] = np.array(centroids_dict[speaker_id], dtype=np.float32)
+        yield id, centroids_dict
+
+    conn.close()
+
+def fetch_speaker_centroid_media_ids(db_path=config.DB_PATH):
+    """Ids of the items fetch_all_speaker_centroids would yield"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM media WHERE status = 'success' AND speaker_centroids IS NOT NULL")
+    ids = {id for id, in cursor}
+    conn.close()
+    return ids
+
 def fetch_media_item(id, router_socket, db_path=config.DB_PATH):
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
@@ -401,6 +460,7 @@ def fetch_media_item(id, router_socket, db_path=config.DB_PATH):
 
         -- Results
         merged_segments,
+        provisional_segments,
         speaker_color_sets,
 
         -- Saved player state
@@ -428,7 +488,7 @@ def fetch_media_item(id, router_socket, db_path=config.DB_PATH):
             result["uri"] = resolve_bookmark(result["uri"])
 
         # Convert JSON fields
-        json_fields = ['error', 'metadata_error', 'chapters', 'available_timestamps', 'speaker_visibility', 'speaker_speeds', 'zoom_window']
+        json_fields = ['error', 'metadata_error', 'chapters', 'available_timestamps', 'speaker_visibility', 'speaker_speeds', 'zoom_window', 'provisional_segments']
         for field in json_fields:
             if result[field]:
                 result[field] = json.loads(result[field])
@@ -436,10 +496,158 @@ def fetch_media_item(id, router_socket, db_path=config.DB_PATH):
         # Convert the integer to a boolean
         result["thumbnail_exists"] = bool(result["thumbnail_exists"])
 
+        result["speaker_names"] = fetch_speaker_names(id, db_path=db_path)
+
         return result
     else:
         return None
 
+def fetch_thumbnail(id, low_res=False, db_path=config.DB_PATH):
+    """Thumbnail jpeg bytes; low_res prefers the low res version, falling back to the full one"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    if low_res:
+        cursor.execute("SELECT COALESCE(thumbnail_low_res, thumbnail) FROM media WHERE id = ?", (id,))
+    else:
+        cursor.execute("SELECT thumbnail FROM media WHERE id = ?", (id,))
+
+    result = cursor.fetchone()
+    conn.close()
+
+    return result[0] if result else None
+
+def fetch_thumbnail_validators(id, low_res=False, db_path=config.DB_PATH):
+    """
+    (content hash, updated_t, column) of the thumbnail fetch_thumbnail would return, without
+    reading the BLOB, or None if there's none. The hash is None for thumbnails written before
+    hashes were stored (set_thumbnail_hash fills it in).
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT thumbnail_low_res IS NOT NULL, thumbnail IS NOT NULL,
+               thumbnail_low_res_hash, thumbnail_hash, thumbnail_updated_t
+        FROM media WHERE id = ?
+        """,
+        (id,)
+    )
+    result = cursor.fetchone()
+    conn.close()
+
+    if not result:
+        return None
+
+    has_low_res, has_thumbnail, low_res_hash, thumbnail_hash, updated_t = result
+    if low_res and has_low_res:
+        return low_res_hash, updated_t, 'thumbnail_low_res'
+    if has_thumbnail:
+        return thumbnail_hash, updated_t, 'thumbnail'
+    return None
+
+def set_thumbnail_hash(id, column, content_hash, db_path=config.DB_PATH):
+    """Backfill the hash of a thumbnail column ('thumbnail' or 'thumbnail_low_res')"""
+    if column not in ('thumbnail', 'thumbnail_low_res'):
+        raise ValueError(f"Not a thumbnail column: {column}")
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        UPDATE media
+        SET {column}_hash = ?, thumbnail_updated_t = COALESCE(thumbnail_updated_t, strftime('%s', 'now'))
+        WHERE id = ?
+        """,
+        (content_hash, id)
+    )
+    conn.commit()
+    conn.close()
+
+def fetch_frame(id, timestamp, db_path=config.DB_PATH):
+    """Storyboard frame jpeg bytes at timestamp (seconds)"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT frame FROM frames WHERE media_id = ? AND timestamp = ?", (id, timestamp))
+    result = cursor.fetchone()
+    conn.close()
+
+    return result[0] if result else None
+
+def fetch_frame_validators(id, timestamp, db_path=config.DB_PATH):
+    """(content hash, created_t) of a storyboard frame without reading the BLOB, or None if it doesn't exist"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT frame_hash, created_t FROM frames WHERE media_id = ? AND timestamp = ?", (id, timestamp))
+    result = cursor.fetchone()
+    conn.close()
+
+    return result
+
+def set_frame_hash(id, timestamp, content_hash, db_path=config.DB_PATH):
+    """Backfill the hash of a frame written before hashes were stored"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE frames
+        SET frame_hash = ?, created_t = COALESCE(created_t, strftime('%s', 'now'))
+        WHERE media_id = ? AND timestamp = ?
+        """,
+        (content_hash, id, timestamp)
+    )
+    conn.commit()
+    conn.close()
+
+#######################################################################
+#   Speaker names (named identities)
+#######################################################################
+
+def set_speaker_name(id, speaker_id, name, db_path=config.DB_PATH):
+    """Name a speaker of a media item; a falsy name removes it"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    if name:
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO speaker_names (speaker_key, media_id, speaker_id, name, named_t)
+            VALUES (?, ?, ?, ?, strftime('%s', 'now'))
+            """,
+            (f"{id}:{speaker_id}", id, speaker_id, name),
+        )
+    else:
+        cursor.execute("DELETE FROM speaker_names WHERE speaker_key = ?", (f"{id}:{speaker_id}",))
+
+    conn.commit()
+    conn.close()
+
+def fetch_speaker_names(id, db_path=config.DB_PATH):
+    """{speaker_id: name} for one media item"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT speaker_id, name FROM speaker_names WHERE media_id = ?", (id,))
+    names = dict(cursor.fetchall())
+    conn.close()
+    return names
+
+def fetch_speaker_names_for(speaker_keys, db_path=config.DB_PATH):
+    """{(media_id, speaker_id): name} for a list of (media_id, speaker_id) pairs"""
+    if not speaker_keys:
+        return {}
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    keys = [f"{media_id}:{speaker_id}" for media_id, speaker_id in speaker_keys]
+    placeholders = ",".join(["?"] * len(keys))
+    cursor.execute(
+        f"SELECT media_id, speaker_id, name FROM speaker_names WHERE speaker_key IN ({placeholders})",
+        keys,
+    )
+    names = {(media_id, speaker_id): name for media_id, speaker_id, name in cursor.fetchall()}
+    conn.close()
+    return names
+
 #######################################################################
 #   Delete
 #######################################################################
@@ -459,6 +667,15 @@ def delete_media_item(id_list, db_path=config.DB_PATH):
         id_list,
     )
 
+    # Delete speaker names
+    cursor.execute(
+        f"""
+        DELETE FROM speaker_names
+        WHERE media_id IN ({placeholders})
+        """,
+        id_list,
+    )
+
     # Delete from media table
     cursor.execute(
         f"""
@@ -561,6 +778,34 @@ def set_skip_silences(id, skip_silences, db_path=config.DB_PATH):
     conn.commit()
     conn.close()
 
+def fetch_render_inputs(id, db_path=config.DB_PATH):
+    """What a speaker-filtered render of an item is made from (see render.build_edl), or None if there's no such item"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT media_type, duration, merged_segments, speaker_visibility, speaker_speeds, skip_silences,
+               auto_skip_disabled_speakers
+        FROM media
+        WHERE id = ?
+        """,
+        (id,),
+    )
+    row = cursor.fetchone()
+    conn.close()
+
+    if row is None:
+        return None
+
+    result = dict(row)
+    for field in ('merged_segments', 'speaker_visibility', 'speaker_speeds'):
+        result[field] = json.loads(result[field]) if result[field] else None
+    result['skip_silences'] = bool(result['skip_silences'])
+    # NULL (not decided yet) plays hidden speakers, like the player
+    result['auto_skip_disabled_speakers'] = bool(result['auto_skip_disabled_speakers'])
+    return result
+
 def set_zoom_window(id, zoom_window, db_path=config.DB_PATH):
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
@@ -607,6 +852,9 @@ def set_auto_skip_disabled_speakers(id, auto_skip_disabled_speakers, db_path=con
 #   Metadata + diarization processing jobs related
 #######################################################################
 
+# Seconds a queued item may wait for its metadata before duration-aware policies schedule it blind
+METADATA_WAIT_LIMIT = 60
+
 def fetch_job(job_type, db_path=config.DB_PATH):
     db_conn = sqlite3.connect(db_path)
     db_conn.row_factory = sqlite3.Row
@@ -615,22 +863,43 @@ def fetch_job(job_type, db_path=config.DB_PATH):
     if job_type == "main":
         cursor.execute(
             """
-            select id, source, uri from media where status = 'queued'
-            order by submitted_t ASC
+            select id, source, uri, submitted_t, duration, priority, pinned, metadata_status from media where status = 'queued'
             """
         )
+        candidates = [dict(row) for row in cursor.fetchall()]
+
+        policy_name = get_setting('scheduling_policy')
+
+        # Items without a duration are scheduled as a typical item of the library
+        unknown_duration = None
+        if scheduler.is_duration_aware(policy_name):
+            cursor.execute("select duration from media where duration > 0")
+            unknown_duration = scheduler.get_median_duration(row[0] for row in cursor.fetchall())
+        db_conn.close()
+
+        # Duration-aware policies wait for the metadata loop (which runs ahead on queued items)
+        # to fill in durations; items stuck waiting too long are scheduled anyway
+        if scheduler.is_duration_aware(policy_name):
+            now = time.time()
+            candidates = [
+                job for job in candidates
+                if job["metadata_status"] != "pending" or now - (job["submitted_t"] or 0) > METADATA_WAIT_LIMIT
+            ]
+
+        ordered = scheduler.order_queue(candidates, policy_name, unknown_duration)
+        job = {key: ordered[0][key] for key in ("id", "source", "uri", "submitted_t")} if ordered else None
     else:
+        # Items waiting on the main queue get their metadata first, in queue priority order
         cursor.execute(
             """
             select id, source, uri, media_type, force_get_raw_stream from media where metadata_status = 'pending'
-            order by submitted_t ASC
+            order by status = 'queued' DESC, pinned DESC, priority DESC, submitted_t ASC
             """
         )
+        row = cursor.fetchone()
+        db_conn.close()
 
-    row = cursor.fetchone()
-    db_conn.close()
-
-    job = dict(row) if row else None
+        job = dict(row) if row else None
 
     if job and job["source"] == "local":
         # resolve macOS bookmark into POSIX filepath ; None if bookmark couldn't be resolved
@@ -665,7 +934,8 @@ def mark_job_failed(job_type, id, error, db_path=config.DB_PATH):
             update media
             set status = 'failed',
                 finished_t = strftime('%s', 'now'),
-                error = ?
+                error = ?,
+                provisional_segments = NULL
             where id = ?
             """,
             (error, id),
@@ -684,6 +954,139 @@ def mark_job_failed(job_type, id, error, db_path=config.DB_PATH):
     conn.commit()
     conn.close()
 
+def park_job(id, db_path=config.DB_PATH):
+    """Put a preempted job back in the queue; submitted_t is kept so it goes ahead of later submissions"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        update media
+        set status = 'queued',
+            started_t = NULL,
+            provisional_segments = NULL
+        where id = ? and status = 'processing'
+        """,
+        (id,),
+    )
+    conn.commit()
+    conn.close()
+
+def cancel_queued_job(id, db_path=config.DB_PATH):
+    """Cancel a job that hasn't started yet; returns True if it was queued"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        update media
+        set status = 'failed',
+            finished_t = strftime('%s', 'now'),
+            error = ?
+        where id = ? and status = 'queued'
+        """,
+        (json.dumps({'type': 'cancelled', 'full_str': 'Processing cancelled'}), id),
+    )
+    cancelled = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+
+    return cancelled
+
+def should_preempt(active_id, db_path=config.DB_PATH):
+    """True if some queued item outranks (pinned, priority) the job that's currently processing"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        "select coalesce(pinned, 0), coalesce(priority, 0) from media where id = ? and status = 'processing'",
+        (active_id,),
+    )
+    active = cursor.fetchone()
+    if not active:
+        conn.close()
+        return False
+
+    cursor.execute(
+        """
+        select coalesce(pinned, 0), coalesce(priority, 0) from media
+        where status = 'queued'
+        order by pinned DESC, priority DESC
+        limit 1
+        """
+    )
+    top_queued = cursor.fetchone()
+    conn.close()
+
+    return top_queued is not None and tuple(top_queued) > tuple(active)
+
+def set_provisional_segments(id, segments, db_path=config.DB_PATH):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        update media
+        set provisional_segments = ?
+        where id = ? and status = 'processing'
+        """,
+        (json.dumps(segments), id),
+    )
+    conn.commit()
+    conn.close()
+
+def set_peak_memory(id, peak_memory, db_path=config.DB_PATH):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        "update media set peak_memory = ? where id = ?",
+        (json.dumps(peak_memory), id),
+    )
+    conn.commit()
+    conn.close()
+
+def set_priority(id, priority, db_path=config.DB_PATH):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        update media
+        set priority = ?
+        where id = ?
+        """,
+        (priority, id),
+    )
+    conn.commit()
+    conn.close()
+
+def bump_priority(id, amount=1, db_path=config.DB_PATH):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        update media
+        set priority = coalesce(priority, 0) + ?
+        where id = ?
+        """,
+        (amount, id),
+    )
+    cursor.execute("select priority from media where id = ?", (id,))
+    result = cursor.fetchone()
+    conn.commit()
+    conn.close()
+
+    return result[0] if result else None
+
+def set_pinned(id, pinned, db_path=config.DB_PATH):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        update media
+        set pinned = ?
+        where id = ?
+        """,
+        (pinned, id),
+    )
+    conn.commit()
+    conn.close()
+
 def refetch_metadata(id, force_get_raw_stream=None, db_path=config.DB_PATH):
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
@@ -699,6 +1102,168 @@ def refetch_metadata(id, force_get_raw_stream=None, db_path=config.DB_PATH):
     conn.commit()
     conn.close()
 
+def fetch_queue_depths(db_path=config.DB_PATH):
+    """Item counts per processing status and per metadata status"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT status, COUNT(*) FROM media GROUP BY status")
+    status_counts = dict(cursor.fetchall())
+
+    cursor.execute("SELECT metadata_status, COUNT(*) FROM media GROUP BY metadata_status")
+    metadata_status_counts = dict(cursor.fetchall())
+
+    conn.close()
+
+    return status_counts, metadata_status_counts
+
+#######################################################################
+#   Job metrics
+#######################################################################
+
+# Media duration buckets (seconds) for real-time factor aggregates
+RTF_DURATION_BUCKETS = [
+    ('<5m', 0, 5*60),
+    ('5-30m', 5*60, 30*60),
+    ('30m-2h', 30*60, 2*60*60),
+    ('>2h', 2*60*60, float('inf'))
+]
+
+def record_job_metrics(rows, db_path=config.DB_PATH):
+    """rows: [(media_id, job_type, stage, started_t, duration, bytes)]"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # Stamp the media duration known right now (the item may be deleted later)
+    media_ids = list({row[0] for row in rows})
+    placeholders = ",".join(["?"] * len(media_ids))
+    cursor.execute(f"SELECT id, duration FROM media WHERE id IN ({placeholders})", media_ids)
+    durations = dict(cursor.fetchall())
+
+    cursor.executemany(
+        """
+        INSERT INTO job_metrics (media_id, job_type, stage, started_t, duration, bytes, media_duration)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(*row, durations.get(row[0])) for row in rows],
+    )
+    conn.commit()
+    conn.close()
+
+def fetch_job_metrics_summary(since=None, job_type=None, db_path=config.DB_PATH):
+    """
+    Per-stage aggregates: count, p50/p95/mean/total seconds, total bytes, and
+    real-time factor (stage seconds per second of media) p50 by media duration bucket
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    conditions = []
+    params = []
+    if since is not None:
+        conditions.append("started_t >= ?")
+        params.append(since)
+    if job_type is not None:
+        conditions.append("job_type = ?")
+        params.append(job_type)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    cursor.execute(f"SELECT job_type, stage, duration, bytes, media_duration FROM job_metrics {where}", params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    grouped = {}
+    for row_job_type, stage, duration, byte_count, media_duration in rows:
+        grouped.setdefault((row_job_type, stage), []).append((duration, byte_count, media_duration))
+
+    summary = []
+    for (row_job_type, stage), values in sorted(grouped.items()):
+        durations = np.array([v[0] for v in values], dtype=np.float64)
+        byte_counts = [v[1] for v in values if v[1] is not None]
+
+        rtf = {}
+        for bucket_name, low, high in RTF_DURATION_BUCKETS:
+            factors = [v[0] / v[2] for v in values if v[2] and low <= v[2] < high]
+            if factors:
+                rtf[bucket_name] = {
+                    'count': len(factors),
+                    'p50': float(np.percentile(factors, 50))
+                }
+
+        summary.append({
+            'job_type': row_job_type,
+            'stage': stage,
+            'count': len(values),
+            'p50': float(np.percentile(durations, 50)),
+            'p95': float(np.percentile(durations, 95)),
+            'mean': float(durations.mean()),
+            'total': float(durations.sum()),
+            'bytes_total': sum(byte_counts) if byte_counts else None,
+            'rtf_by_media_duration': rtf
+        })
+
+    return summary
+
+def fetch_stage_samples(job_type='main', limit_per_stage=500, db_path=config.DB_PATH):
+    """{stage: [(media_duration, duration)]}, most recent first, only rows with a known media duration"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT stage, media_duration, duration FROM (
+            SELECT stage, media_duration, duration,
+                   ROW_NUMBER() OVER (PARTITION BY stage ORDER BY started_t DESC) AS n
+            FROM job_metrics
+            WHERE job_type = ? AND media_duration IS NOT NULL AND media_duration > 0
+        )
+        WHERE n <= ?
+        """,
+        (job_type, limit_per_stage),
+    )
+    rows = cursor.fetchall()
+    conn.close()
+
+    samples = {}
+    for stage, media_duration, duration in rows:
+        samples.setdefault(stage, []).append((media_duration, duration))
+    return samples
+
+def fetch_diarization_history(limit=500, db_path=config.DB_PATH):
+    """[(duration, diarization_time)] of the most recent successful jobs (predates job_metrics)"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT duration, diarization_time FROM media
+        WHERE status = 'success' AND duration > 0 AND diarization_time IS NOT NULL
+        ORDER BY finished_t DESC
+        LIMIT ?
+        """,
+        (limit,),
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def fetch_throughput(since, db_path=config.DB_PATH):
+    """Jobs finished since `since`: count, total media seconds, total processing (started -> finished) seconds"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT COUNT(*), SUM(duration), SUM(finished_t - started_t) FROM media
+        WHERE status = 'success' AND finished_t >= ? AND started_t IS NOT NULL
+        """,
+        (since,),
+    )
+    count, media_seconds, processing_seconds = cursor.fetchone()
+    conn.close()
+    return {
+        'jobs': count,
+        'media_seconds': media_seconds or 0.0,
+        'processing_seconds': processing_seconds or 0.0
+    }
+
 #######################################################################
 #   Settings (settings.json)
 #######################################################################
@@ -739,7 +1304,15 @@ def get_default_settings():
         "alternate_bg_color": True,
         "restore_zoom_window": True,
         "warmup_processor": True,
-        "auto_skip_by_default": True
+        "auto_skip_by_default": True,
+        "incremental_diarization": False,               # preview speakers chunk by chunk while diarizing; the full pass still runs after, so diarization takes about twice as long
+        "scheduling_policy": "fifo",                    # [fifo, shortest_first, aging]
+        "preempt_jobs": False,                          # park the running job when a higher priority item is queued
+        "stream_youtube_audio": False,                  # decode YouTube audio while it downloads (no compressed temp file)
+        "audio_proxy": True,                            # encode a small AAC copy of big local files' audio while diarizing (?variant=audio)
+        "hls_packaging": True,                          # play badly indexed local videos as HLS, packaged on first play (where the browser supports it)
+        "render_playback": True,                        # play local items with skipped silences/hidden speakers/speaker speeds from a server side render
+        "tracemalloc_enabled": False                    # diff tracemalloc snapshots between jobs (backend + diarize worker); slows allocation-heavy code
         # Add other default settings here as needed
     }
 
@@ -836,7 +1409,32 @@ def get_frames_columns():
         'frame_id': 'TEXT PRIMARY KEY',                     # composite key: media_id-timestamp
         'media_id': 'TEXT NOT NULL',                        # 11 char unique ID for media item
         'timestamp': 'INTEGER NOT NULL',                    # location of frame in video (seconds)
-        'frame': 'BLOB NOT NULL'                            # jpeg raw data
+        'frame': 'BLOB NOT NULL',                           # jpeg raw data
+        'frame_hash': 'TEXT DEFAULT NULL',                  # content hash of frame (ETag)
+        'created_t': 'INTEGER DEFAULT NULL'                 # unix time frame was written (Last-Modified)
+    }
+
+def get_job_metrics_columns():
+    """Define job_metrics table columns with their types and constraints"""
+    return {
+        'metric_id': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+        'media_id': 'TEXT NOT NULL',                        # media item the job was for (row kept after the item is deleted)
+        'job_type': 'TEXT NOT NULL',                        # [main, metadata]
+        'stage': 'TEXT NOT NULL',                           # e.g. queue_wait, download, decompress, diarize, diarize_vad, db_write, metadata_fetch, storyboards
+        'started_t': 'REAL NOT NULL',                       # UNIX timestamp the stage started
+        'duration': 'REAL NOT NULL',                        # wall time of the stage (seconds)
+        'bytes': 'INTEGER DEFAULT NULL',                    # bytes downloaded/produced by the stage, where meaningful
+        'media_duration': 'REAL DEFAULT NULL'               # media duration at the time, for real-time factors
+    }
+
+def get_speaker_names_columns():
+    """Define speaker_names table columns with their types and constraints"""
+    return {
+        'speaker_key': 'TEXT PRIMARY KEY',                  # composite key: media_id:speaker_id
+        'media_id': 'TEXT NOT NULL',                        # 11 char unique ID for media item
+        'speaker_id': 'TEXT NOT NULL',                      # speaker label from diarization (e.g. SPEAKER_01)
+        'name': 'TEXT NOT NULL',                            # user-given identity name
+        'named_t': 'INTEGER NOT NULL'                       # UNIX timestamp of when the name was set
     }
 
 def get_create_media_table_sql():
@@ -853,6 +1451,20 @@ def get_create_frames_table_sql():
     newline_indent = ',\n    '
     return f"CREATE TABLE frames (\n    {newline_indent.join(column_definitions)}\n)"
 
+def get_create_job_metrics_table_sql():
+    """Generate CREATE TABLE SQL for job_metrics table"""
+    columns = get_job_metrics_columns()
+    column_definitions = [f"{name} {definition}" for name, definition in columns.items()]
+    newline_indent = ',\n    '
+    return f"CREATE TABLE job_metrics (\n    {newline_indent.join(column_definitions)}\n)"
+
+def get_create_speaker_names_table_sql():
+    """Generate CREATE TABLE SQL for speaker_names table"""
+    columns = get_speaker_names_columns()
+    column_definitions = [f"{name} {definition}" for name, definition in columns.items()]
+    newline_indent = ',\n    '
+    return f"CREATE TABLE speaker_names (\n    {newline_indent.join(column_definitions)}\n)"
+
 def add_missing_columns(cursor, table_name, expected_columns):
     """
     Check if all expected columns exist in the table and add missing ones.
@@ -920,9 +1532,13 @@ def remove_columns_from_table(cursor, table_name, expected_columns, columns_to_r
         # Rename temp table to original name
         cursor.execute(f"ALTER TABLE {temp_table_name} RENAME TO {table_name}")
 
-        # Recreate indexes if this is the frames table
+        # Recreate indexes
         if table_name == 'frames':
             cursor.execute("CREATE INDEX idx_frames_media_id ON frames(media_id)")
+        elif table_name == 'job_metrics':
+            cursor.execute("CREATE INDEX idx_job_metrics_stage ON job_metrics(stage, started_t)")
+        elif table_name == 'speaker_names':
+            cursor.execute("CREATE INDEX idx_speaker_names_media_id ON speaker_names(media_id)")
 
         print(f"Successfully removed columns {columns_to_remove} from table '{table_name}'")
 
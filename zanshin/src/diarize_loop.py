@@ -1,9 +1,13 @@
 import os
+import glob
 import ffmpeg
 import sqlite3
 import time
+import wave
 import db
 import json
+import numpy as np
+import requests
 from yt_dlp import YoutubeDL
 from yt_dlp.utils import DownloadCancelled
 from misc import (
@@ -14,33 +18,34 @@ from misc import (
     extract_yt_error
 )
 from senko import Diarizer
+from job_worker import JobWorker, JobCancelled, JobWorkerError, check_cancelled
+from job_metrics import JobMetrics
 import config
 import shared_dict
 import rust_comms
+import speaker_index
+import audio_proxy
+import analytics
+import memory_tracking
 
 #######################################################################
 #   diarize_loop
 #######################################################################
 
+QUEUE_RECHECK_INTERVAL_MS = 5000
+
 def diarize_loop(parent_address, db_path=config.DB_PATH):
 
     context, socket = create_dealer_socket(parent_address, "diarize_loop")
 
-    # Create & warm up diarizer
-    warmup = db.get_setting('warmup_processor')
-
-    if warmup:
-        shared_dict.write('processor_status', 'warming up')
-
-    diarizer = Diarizer(warmup=warmup, quiet=False)
+    # Heavy stages run in killable child processes:
+    #   io_worker      - YouTube download + audio decompression
+    #   diarize_worker - holds the warmed up diarizer
+    io_worker = JobWorker('io')
+    diarize_worker = JobWorker('diarize', init_fn=create_diarizer, init_args=(db.get_setting('warmup_processor'),))
 
-    shared_dict.write('processor_status', 'warmed up')
-
-    dealer_to_router(socket, json.dumps({
-        'message_type': 'processor_status_update',
-        'content': 'warmed up'
-    }))
-    print('Processor warmed up')
+    # Create & warm up diarizer
+    start_diarize_worker(diarize_worker, socket)
 
     rust_comms.send({
         "status": "processor warmed up"
@@ -53,6 +58,10 @@ def diarize_loop(parent_address, db_path=config.DB_PATH):
 
         if not job:
             while True:
+                # Duration-aware scheduling may hold queued items back until their metadata
+                # arrives, so wake up periodically to re-check the queue
+                if not socket.poll(QUEUE_RECHECK_INTERVAL_MS):
+                    break
                 message = socket.recv_string()
                 if message == "new_job_submission":
                     break
@@ -66,133 +75,441 @@ def diarize_loop(parent_address, db_path=config.DB_PATH):
 
             # Job exists, start processing
             id = job['id']
-            source = job['source']
-            uri = job['uri']
-
-            is_local_file = source == 'local'
 
             # Update job status from queued to processing
             db.update_diarization_job_status(id, 'processing')
+            shared_dict.write('active_job_id', id)
+            memory_tracking.begin_job(id)
 
             broadcast_active_job_status(socket, 'new_job_started')
 
-            # Temp processing dir
-            output_dir = config.PROCESSING_TEMP_DIR
+            metrics = JobMetrics(id, 'main')
+            if job['submitted_t']:
+                metrics.record('queue_wait', time.time() - job['submitted_t'], started_t=job['submitted_t'])
 
-            # Download audio if a YouTube video
-            if not is_local_file:
-                broadcast_active_job_status(socket, 'progress_update', {
-                    'id': id,
-                    'stage': 'Starting download'
-                })
-                downloaded_file, error = download_youtube_audio(id, uri, output_dir, socket)
-
-                # If download failed, update DB and exit
-                if downloaded_file is None:
-                    db.mark_job_failed('main', id, json.dumps(error))
-                    broadcast_active_job_status(socket, 'job_done', {
-                        'id': id
-                    })
-                    # Continue to next video
-                    continue
+            try:
+                process_job(job, socket, io_worker, diarize_worker, metrics, db_path)
 
-            # Decompress the audio
-            broadcast_active_job_status(socket, 'progress_update', {
-                'id': id,
-                'stage': 'Decompressing audio'
-            })
-            input_file = uri if is_local_file else downloaded_file
-            output_file = os.path.join(output_dir, f"{get_filename(input_file) if is_local_file else uri}.wav")
-            wav_file = decompress_audio(input_file, output_file)
+            except JobCancelled as e:
+                cleanup_job_files(job)
+
+                if e.reason == 'preempted':
+                    # Park: back in the queue, keeping its submission time so it resumes first
+                    db.park_job(id)
+                elif e.reason != 'deleted':
+                    db.mark_job_failed('main', id, json.dumps({
+                        'type': 'cancelled',
+                        'full_str': "Processing cancelled"
+                    }))
 
-            # Decompression failed
-            if wav_file is None:
-                if not is_local_file:
-                    os.remove(downloaded_file)
+                # A killed diarizer has to be brought back (and warmed up) before the next job
+                if not diarize_worker.is_alive():
+                    start_diarize_worker(diarize_worker, socket)
 
+            except JobWorkerError as e:
+                print(f"Error processing {id}: {e}")
+                cleanup_job_files(job)
                 db.mark_job_failed('main', id, json.dumps({
-                    'type': 'no_audio',
-                    'full_str': "No audio track found in file"
+                    'type': 'other',
+                    'full_str': "Processing failed unexpectedly"
                 }))
-                broadcast_active_job_status(socket, 'job_done', {
-                    'id': id
-                })
-                # Continue to next video
-                continue
 
-            # Decompression succeeded, so delete downloaded (compressed) audio
+                if not diarize_worker.is_alive():
+                    start_diarize_worker(diarize_worker, socket)
+
+            metrics.flush()
+            record_job_memory(id, diarize_worker)
+            analytics.invalidate_models()
+            shared_dict.write('active_job_id', None)
+
+            # Alert job done
+            broadcast_active_job_status(socket, 'job_done', {
+                'id': id
+            })
+
+            # Continue to next video in the queue
+            continue
+
+#######################################################################
+#   Per-job memory record
+#######################################################################
+
+def record_job_memory(id, diarize_worker):
+    """Peak RSS per process while the job ran, plus tracemalloc growth since the last job if enabled"""
+    tracemalloc_enabled = bool(db.get_setting('tracemalloc_enabled'))
+    tracemalloc_diffs = None
+
+    if tracemalloc_enabled:
+        tracemalloc_diffs = {memory_tracking.BACKEND_ROLE: memory_tracking.snapshot_diff()}
+    else:
+        memory_tracking.stop_tracing()
+
+    # The diarizer lives in its own process, so its allocations are traced there
+    if diarize_worker.is_alive():
+        try:
+            worker_diff = diarize_worker.run(memory_tracking.snapshot_diff_task, tracemalloc_enabled)
+            if tracemalloc_enabled:
+                tracemalloc_diffs['diarize_worker'] = worker_diff
+        except JobWorkerError as e:
+            print(f"Error taking diarize worker tracemalloc snapshot: {e}")
+
+    peak_memory = memory_tracking.end_job(id, tracemalloc_diffs)
+    if peak_memory:
+        db.set_peak_memory(id, peak_memory)
+
+#######################################################################
+#   process_job
+#######################################################################
+
+def process_job(job, socket, io_worker, diarize_worker, metrics, db_path=config.DB_PATH):
+    """Runs one main processing job; heavy stages run in the workers and can be cancelled"""
+    id = job['id']
+    source = job['source']
+    uri = job['uri']
+
+    is_local_file = source == 'local'
+
+    def relay(message_type, content=''):
+        broadcast_active_job_status(socket, message_type, content)
+
+    worker_opts = {
+        'job_id': id,
+        'control_socket': socket,
+        'on_message': relay
+    }
+
+    # Temp processing dir
+    output_dir = config.PROCESSING_TEMP_DIR
+    output_file = get_wav_path(job)
+    wav_file = None
+
+    # Stream YouTube audio straight into ffmpeg, decoding while it downloads
+    if not is_local_file and db.get_setting('stream_youtube_audio'):
+        relay('progress_update', {
+            'id': id,
+            'stage': 'Starting download'
+        })
+        with metrics.stage('stream_download') as stage:
+            wav_file, stage['bytes'] = io_worker.run(stream_download_task, id, uri, output_file, **worker_opts)
+
+    # Otherwise (or if streaming failed), download the whole file first, then decompress it
+    if wav_file is None:
+        # Download audio if a YouTube video
+        if not is_local_file:
+            relay('progress_update', {
+                'id': id,
+                'stage': 'Starting download'
+            })
+            with metrics.stage('download') as stage:
+                downloaded_file, error = io_worker.run(download_task, id, uri, output_dir, **worker_opts)
+                if downloaded_file:
+                    stage['bytes'] = os.path.getsize(downloaded_file)
+
+            # If download failed, update DB and exit
+            if downloaded_file is None:
+                db.mark_job_failed('main', id, json.dumps(error))
+                return
+
+            check_cancelled(socket, id)
+
+        # Decompress the audio
+        relay('progress_update', {
+            'id': id,
+            'stage': 'Decompressing audio'
+        })
+        input_file = uri if is_local_file else downloaded_file
+        with metrics.stage('decompress') as stage:
+            wav_file = io_worker.run(decompress_task, input_file, output_file, **worker_opts)
+            if wav_file:
+                stage['bytes'] = os.path.getsize(wav_file)
+
+        # Decompression failed
+        if wav_file is None:
             if not is_local_file:
                 os.remove(downloaded_file)
 
-            # Diarize
-            broadcast_active_job_status(socket, 'progress_update', {
+            db.mark_job_failed('main', id, json.dumps({
+                'type': 'no_audio',
+                'full_str': "No audio track found in file"
+            }))
+            return
+
+        # Decompression succeeded, so delete downloaded (compressed) audio
+        if not is_local_file:
+            os.remove(downloaded_file)
+
+    check_cancelled(socket, id)
+
+    # Encode the audio proxy from the wav alongside diarization (ffmpeg is its own process)
+    proxy_process = None
+    if is_local_file and db.get_setting('audio_proxy'):
+        proxy_process = audio_proxy.start_encode(id, uri, wav_file)
+
+    # Diarize
+    relay('progress_update', {
+        'id': id,
+        'stage': 'Identifying speakers...'
+    })
+    try:
+        with metrics.stage('diarize', os.path.getsize(wav_file)):
+            diar_result = diarize_worker.run(
+                diarize_task, id, wav_file, bool(db.get_setting('incremental_diarization')),
+                **worker_opts
+            )
+    except BaseException:
+        # Cancelled, preempted or failed: the job starts over (or is gone)
+        audio_proxy.cancel_encode(proxy_process, id)
+        raise
+
+    if proxy_process is not None:
+        with metrics.stage('audio_proxy'):
+            audio_proxy.finish_encode(proxy_process, id)
+
+    # Remove wav file
+    os.remove(wav_file)
+
+    # Last chance before the result is written (cancelling after that is too late)
+    check_cancelled(socket, id)
+
+    # Check if no speech was detected
+    if diar_result is None:
+        db.mark_job_failed('main', id, json.dumps({
+            'type': 'no_speakers',
+            'full_str': "No speakers in audio!"
+        }))
+        return
+
+    # Convert centroids dict with numpy arrays to JSON-serializable format
+    speaker_centroids = {}
+    for speaker_id, centroid_array in diar_result["speaker_centroids"].items():
+        speaker_centroids[speaker_id] = centroid_array.tolist()
+
+    # Diarizer's own breakdown (vad_time, fbank_time, embeddings_time, clustering_time)
+    for key, value in diar_result["timing_stats"].items():
+        if key.endswith('_time') and key != 'total_time' and isinstance(value, (int, float)):
+            metrics.record(f"diarize_{key[:-len('_time')]}", value)
+
+    # Write diarization data + diarization time to db
+    # (final result replaces any provisional segments in the same statement)
+    db_write_start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        '''
+        update media
+        set raw_segments = ?,
+            merged_segments = ?,
+            speaker_centroids = ?,
+            speaker_color_sets = ?,
+            timing_stats = ?,
+            diarization_time = ?,
+            provisional_segments = NULL,
+            finished_t = strftime('%s', 'now'),
+            status = 'success'
+        where id = ?
+        ''',
+        (
+            json.dumps(diar_result["raw_segments"]),
+            json.dumps(diar_result["merged_segments"]),
+            json.dumps(speaker_centroids),
+            json.dumps(diar_result["speaker_color_sets"]),
+            json.dumps(diar_result["timing_stats"]),
+            diar_result["timing_stats"]["total_time"],
+            id
+        )
+    )
+    conn.commit()
+    conn.close()
+    metrics.record('db_write', time.perf_counter() - db_write_start)
+
+    # Make this item's speakers searchable library-wide
+    try:
+        speaker_index.get_index().add_media(id, diar_result["speaker_centroids"])
+    except Exception as e:
+        print(f"Error updating speaker index: {e}")
+
+def get_wav_path(job):
+    if job['source'] == 'local':
+        return os.path.join(config.PROCESSING_TEMP_DIR, f"{get_filename(job['uri'])}.wav")
+    return os.path.join(config.PROCESSING_TEMP_DIR, f"{job['uri']}.wav")
+
+def cleanup_job_files(job):
+    """Remove whatever a killed job left in the temp dir"""
+    paths = [get_wav_path(job), f"{get_wav_path(job)}.chunk.wav"]
+    if job['source'] != 'local':
+        paths += glob.glob(os.path.join(config.PROCESSING_TEMP_DIR, f"temp_{glob.escape(job['uri'])}.*"))
+
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def start_diarize_worker(diarize_worker, socket):
+    if diarize_worker.init_args[0]:
+        shared_dict.write('processor_status', 'warming up')
+
+    diarize_worker.start()
+
+    shared_dict.write('processor_status', 'warmed up')
+
+    dealer_to_router(socket, json.dumps({
+        'message_type': 'processor_status_update',
+        'content': 'warmed up'
+    }))
+    print('Processor warmed up')
+
+#######################################################################
+#   Worker tasks (run in JobWorker child processes)
+#######################################################################
+
+def create_diarizer(warmup):
+    return Diarizer(warmup=warmup, quiet=False)
+
+def download_task(state, report, id, video_id, output_dir):
+    return download_youtube_audio(id, video_id, output_dir, report)
+
+def stream_download_task(state, report, id, video_id, output_file):
+    return stream_youtube_audio(id, video_id, output_file, report)
+
+def decompress_task(state, report, input_file, output_file):
+    return decompress_audio(input_file, output_file)
+
+def diarize_task(diarizer, report, id, wav_file, incremental):
+    # The incremental pass is extra work, not a head start: Diarizer.diarize only takes a
+    # whole wav (no way to feed it the chunk embeddings), so the full pass after it
+    # recomputes everything. That's the price of the preview, hence the opt-in setting
+    if incremental:
+        def publish_provisional(segments, progress):
+            db.set_provisional_segments(id, segments)
+            report('progress_update', {
+                'id': id,
+                'stage': 'Identifying speakers...',
+                'progress': progress * 100
+            })
+            report('provisional_segments', {
                 'id': id,
-                'stage': 'Identifying speakers...'
+                'segments': segments
             })
-            diar_result = diarizer.diarize(wav_file, generate_colors=True)
 
-            # Remove wav file
-            os.remove(wav_file)
+        diarize_incrementally(diarizer, wav_file, publish_provisional)
 
-            # Check if no speech was detected
-            if diar_result is None:
-                db.mark_job_failed('main', id, json.dumps({
-                    'type': 'no_speakers',
-                    'full_str': "No speakers in audio!"
-                }))
-                broadcast_active_job_status(socket, 'job_done', {
-                    'id': id
-                })
-                # Continue to next video
+        report('progress_update', {
+            'id': id,
+            'stage': 'Finalizing speakers...'
+        })
+
+    return diarizer.diarize(wav_file, generate_colors=True)
+
+#######################################################################
+#   diarize_incrementally
+#######################################################################
+
+def diarize_incrementally(diarizer, wav_file, on_chunk, chunk_seconds=300, match_threshold=0.6):
+    """
+    Diarize wav_file chunk by chunk, calling on_chunk(segments, progress) after each chunk
+    with the provisional merged segments accumulated so far (progress is 0-1).
+
+    Each chunk is clustered on its own, so speaker labels are made consistent across chunks
+    by matching every chunk's centroids against running centroids (cosine similarity).
+    The provisional result is only a preview; the caller still runs a full pass afterwards.
+    """
+    with wave.open(wav_file, 'rb') as wav_in:
+        params = wav_in.getparams()
+        frames_per_chunk = int(chunk_seconds * params.framerate)
+        total_frames = params.nframes
+
+        # Nothing to gain for media that fits in a couple of chunks
+        if total_frames <= frames_per_chunk * 2:
+            return None
+
+        chunk_file = f"{wav_file}.chunk.wav"
+        provisional_segments = []
+        global_centroids = {}   # label -> (normalized centroid, accumulated speech seconds)
+        frames_done = 0
+
+        try:
+            while frames_done < total_frames:
+                frames = wav_in.readframes(frames_per_chunk)
+                if not frames:
+                    break
+
+                with wave.open(chunk_file, 'wb') as wav_out:
+                    wav_out.setparams(params)
+                    wav_out.writeframes(frames)
+
+                chunk_offset = frames_done / params.framerate
+                frames_done += len(frames) // (params.sampwidth * params.nchannels)
+
+                chunk_result = diarizer.diarize(chunk_file, generate_colors=False)
+
+                if chunk_result is not None:
+                    label_map = match_chunk_speakers(chunk_result, global_centroids, match_threshold)
+                    for segment in chunk_result['merged_segments']:
+                        provisional_segments.append({
+                            **segment,
+                            'start': segment['start'] + chunk_offset,
+                            'end': segment['end'] + chunk_offset,
+                            'speaker': label_map[segment['speaker']]
+                        })
+
+                on_chunk(provisional_segments, min(frames_done / total_frames, 1.0))
+        finally:
+            if os.path.exists(chunk_file):
+                os.remove(chunk_file)
+
+    return provisional_segments
+
+def match_chunk_speakers(chunk_result, global_centroids, match_threshold):
+    """
+    Map a chunk's speaker ids onto running speaker labels; updates global_centroids in place.
+    Each global speaker can only be claimed by one speaker per chunk.
+    """
+    speech_time = {}
+    for segment in chunk_result['merged_segments']:
+        speech_time[segment['speaker']] = speech_time.get(segment['speaker'], 0) + (segment['end'] - segment['start'])
+
+    label_map = {}
+    claimed = set()
+
+    # Match the most talkative speakers first, their centroids are the most reliable
+    for speaker_id in sorted(chunk_result['speaker_centroids'], key=lambda s: -speech_time.get(s, 0)):
+        centroid = np.asarray(chunk_result['speaker_centroids'][speaker_id], dtype=np.float32)
+        centroid = centroid / (np.linalg.norm(centroid) or 1.0)
+
+        best_label, best_similarity = None, match_threshold
+        for label, (global_centroid, _) in global_centroids.items():
+            if label in claimed:
                 continue
+            similarity = float(np.dot(centroid, global_centroid))
+            if similarity > best_similarity:
+                best_label, best_similarity = label, similarity
+
+        weight = speech_time.get(speaker_id, 0)
+        if best_label is None:
+            best_label = f"SPEAKER_{len(global_centroids):02d}"
+            global_centroids[best_label] = (centroid, weight)
+        else:
+            # Running speech-weighted mean of the matched centroid
+            global_centroid, global_weight = global_centroids[best_label]
+            merged = global_centroid * global_weight + centroid * weight
+            global_centroids[best_label] = (merged / (np.linalg.norm(merged) or 1.0), global_weight + weight)
 
-            # Convert centroids dict with numpy arrays to JSON-serializable format
-            speaker_centroids = {}
-            for speaker_id, centroid_array in diar_result["speaker_centroids"].items():
-                speaker_centroids[speaker_id] = centroid_array.tolist()
-
-            # Write diarization data + diarization time to db
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute(
-                '''
-                update media
-                set raw_segments = ?,
-                    merged_segments = ?,
-                    speaker_centroids = ?,
-                    speaker_color_sets = ?,
-                    timing_stats = ?,
-                    diarization_time = ?,
-                    finished_t = strftime('%s', 'now'),
-                    status = 'success'
-                where id = ?
-                ''',
-                (
-                    json.dumps(diar_result["raw_segments"]),
-                    json.dumps(diar_result["merged_segments"]),
-                    json.dumps(speaker_centroids),
-                    json.dumps(diar_result["speaker_color_sets"]),
-                    json.dumps(diar_result["timing_stats"]),
-                    diar_result["timing_stats"]["total_time"],
-                    id
-                )
-            )
-            conn.commit()
-            conn.close()
+        claimed.add(best_label)
+        label_map[speaker_id] = best_label
 
-            # Alert job done
-            broadcast_active_job_status(socket, 'job_done', {
-                'id': id
-            })
+    # Segments whose speaker had no centroid
+    for segment in chunk_result['merged_segments']:
+        if segment['speaker'] not in label_map:
+            label_map[segment['speaker']] = segment['speaker']
 
-            # Continue to next video in the queue
-            continue
+    return label_map
 
 #######################################################################
 #   download_youtube_audio
 #######################################################################
 
-def download_youtube_audio(id, video_id, output_dir, socket):
+def download_youtube_audio(id, video_id, output_dir, report):
     def progress_hook(d):
         if d['status'] == 'downloading':
             downloaded = d['downloaded_bytes']
@@ -208,7 +525,7 @@ def download_youtube_audio(id, video_id, output_dir, socket):
             else:
                 speed_str = "N/A"
 
-            broadcast_active_job_status(socket, 'progress_update', {
+            report('progress_update', {
                 'id': id,
                 'stage': 'Downloading audio',
                 'progress': percent,
@@ -290,7 +607,7 @@ def download_youtube_audio(id, video_id, output_dir, socket):
 
             # Specific format not available error - try fallback once and exit
             elif check_error_str(error_str, 'requested format is not available'):
-                broadcast_active_job_status(socket, 'progress_update', {
+                report('progress_update', {
                     'id': id,
                     'stage': 'Audio-only format not available, trying low-res video+audio...'
                 })
@@ -323,7 +640,7 @@ def download_youtube_audio(id, video_id, output_dir, socket):
                             combined_formats.sort(key=lambda x: x.get('height', 0))
                             fallback_format = combined_formats[0]['format_id']
 
-                            broadcast_active_job_status(socket, 'progress_update', {
+                            report('progress_update', {
                                 'id': id,
                                 'stage': f'Downloading with format {fallback_format} ({combined_formats[0].get("height", "unknown")}p)'
                             })
@@ -368,6 +685,172 @@ def download_youtube_audio(id, video_id, output_dir, socket):
 
     return (downloaded_file, error)
 
+#######################################################################
+#   stream_youtube_audio
+#######################################################################
+
+# Size of each ranged request; googlevideo throttles long unranged responses
+STREAM_CHUNK_SIZE = 10 * 1024 * 1024
+
+# Pooled HTTP session for streaming downloads (one per worker process)
+http_session = None
+
+def get_http_session():
+    global http_session
+    if http_session is None:
+        http_session = requests.Session()
+        http_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=3))
+    return http_session
+
+def stream_youtube_audio(id, video_id, output_file, report, max_retries=3):
+    """
+    Decode YouTube audio to output_file (16kHz mono wav) while it downloads, without writing
+    the compressed file to disk. Plain HTTP(S) formats are fetched in ranged chunks through a
+    pooled session and piped into ffmpeg's stdin; manifest based formats (HLS/DASH) are handed
+    to ffmpeg as a URL. Returns (output_file, bytes downloaded); output_file is None on failure
+    so the caller can fall back to download_youtube_audio (which also classifies errors).
+    """
+    try:
+        audio_format = resolve_youtube_audio_format(video_id)
+    except Exception as e:
+        print(f"Could not resolve audio stream for {video_id}: {extract_yt_error(str(e))}")
+        return (None, 0)
+
+    url = audio_format['url']
+    http_headers = audio_format.get('http_headers') or {}
+
+    # Manifest formats: let ffmpeg fetch the segments itself
+    if audio_format.get('protocol') not in ('http', 'https'):
+        report('progress_update', {
+            'id': id,
+            'stage': 'Downloading + decoding audio'
+        })
+        headers_arg = ''.join(f"{key}: {value}\r\n" for key, value in http_headers.items())
+        input_stream = ffmpeg.input(url, headers=headers_arg) if headers_arg else ffmpeg.input(url)
+        try:
+            (
+                input_stream
+                .output(output_file, acodec='pcm_s16le', ac=1, ar=16000)
+                .run(quiet=True, overwrite_output=True)
+            )
+            return (output_file, None)
+        except ffmpeg.Error:
+            return (None, None)
+
+    session = get_http_session()
+    total = audio_format.get('filesize') or None
+    downloaded = 0
+    retries = 0
+    last_report_t = 0
+    start_t = time.time()
+
+    process = (
+        ffmpeg
+        .input('pipe:0')
+        .output(output_file, acodec='pcm_s16le', ac=1, ar=16000)
+        .global_args('-loglevel', 'error')
+        .overwrite_output()
+        .run_async(pipe_stdin=True)
+    )
+
+    try:
+        while total is None or downloaded < total:
+            range_end = downloaded + STREAM_CHUNK_SIZE - 1
+            try:
+                with session.get(
+                    url,
+                    headers={**http_headers, 'Range': f"bytes={downloaded}-{range_end}"},
+                    stream=True,
+                    timeout=10
+                ) as response:
+                    # Past the end of a file whose size the server never gave ("bytes 0-10485759/*"):
+                    # the previous range was the last one
+                    if response.status_code == 416 and total is None and downloaded > 0:
+                        break
+                    response.raise_for_status()
+
+                    # Total size from "Content-Range: bytes 0-10485759/52345678"
+                    content_range = response.headers.get('Content-Range')
+                    if content_range and '/' in content_range:
+                        size = content_range.rsplit('/', 1)[1]
+                        if size.isdigit():
+                            total = int(size)
+
+                    received = 0
+                    for block in response.iter_content(chunk_size=262_144):
+                        process.stdin.write(block)
+                        downloaded += len(block)
+                        received += len(block)
+
+                        now = time.time()
+                        if now - last_report_t > 0.5:
+                            last_report_t = now
+                            speed = downloaded / max(now - start_t, 1e-6)
+                            report('progress_update', {
+                                'id': id,
+                                'stage': 'Downloading audio',
+                                'progress': (downloaded / total * 100) if total else 0,
+                                'other_info': {
+                                    'downloaded_mb': downloaded/1024/1024,
+                                    'total_mb': (total or 0)/1024/1024,
+                                    'speed': f"{speed/1024/1024:.2f} MB/s" if speed > 1024*1024 else f"{speed/1024:.2f} KB/s",
+                                }
+                            })
+
+                    # Server ignored the Range header and sent everything
+                    if response.status_code == 200:
+                        break
+                    # Size unknown: a range shorter than asked for is the end of the file
+                    if total is None and received < STREAM_CHUNK_SIZE:
+                        break
+
+                retries = 0
+
+            except requests.exceptions.RequestException as e:
+                retries += 1
+                if retries > max_retries:
+                    print(f"Streaming download failed for {video_id}: {e}")
+                    raise
+                time.sleep(2 ** retries)
+
+        process.stdin.close()
+        if process.wait() != 0:
+            return (None, downloaded)
+
+        return (output_file, downloaded)
+
+    except (requests.exceptions.RequestException, BrokenPipeError, OSError):
+        process.kill()
+        process.wait()
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        return (None, downloaded)
+
+def resolve_youtube_audio_format(video_id):
+    """Pick the bestaudio format with yt-dlp, without downloading it"""
+    ydl_opts = {
+        'format': 'bestaudio',
+        'skip_download': True,
+        'socket_timeout': 10,
+        'quiet': True,
+        'no_warnings': True,
+        'noprogress': True
+    }
+
+    # If user has allowed reading youtube browser cookies
+    cookies_setting = db.get_setting('cookies_from_browser')
+    if cookies_setting:
+        ydl_opts['cookiesfrombrowser'] = (cookies_setting,)
+
+    with YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
+
+    if info.get('live_status') in ('is_live', 'is_upcoming'):
+        raise DownloadCancelled('Live and upcoming streams cannot be streamed')
+
+    # A single selected format's fields are merged into info
+    return info
+
 #######################################################################
 #   decompress_audio
 #######################################################################
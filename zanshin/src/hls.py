@@ -0,0 +1,227 @@
+import os
+import time
+import struct
+import threading
+import subprocess
+import ffmpeg
+import media_cache
+import transcode
+from flask import Response, send_file
+from misc import get_file_extension
+
+#######################################################################
+#   HLS packaging (/api/hls/<id>/...)
+#######################################################################
+
+# Seeking in a badly laid out file (an MP4 with its index at the end, MPEG-PS/TS, AVI,
+# ...) costs the browser large range reads against /api/stream, each time. Such
+# items can instead be played as HLS: ffmpeg's hls muxer cuts the file into ~6s fMP4
+# segments (streams copied where transcode.get_plan allows), after which a seek is one
+# small segment fetch, whatever the file looks like.
+#
+# A package is made the first time its playlist is asked for, into
+# STREAM_CACHE_DIR/hls/<id>_<size>_<mtime>/. The playlist is an EVENT playlist, so
+# playback starts with the first segments while the rest are still being written, and
+# gets #EXT-X-ENDLIST once it's complete. Until then the player can't seek past what's
+# been packaged, so a well indexed file (faststart MP4, however big) is never packaged,
+# and an item is only offered as HLS when its package can be used right away (see
+# is_available). Packages are evicted least recently used first.
+
+HLS_KIND = "hls"
+HLS_CACHE_MAX_BYTES = 30 * 1024 ** 3
+SEGMENT_SECONDS = 6
+PLAYLIST_NAME = "index.m3u8"
+INIT_NAME = "init.mp4"
+SEGMENT_PATTERN = "seg_%05d.m4s"
+ENDLIST_TAG = b"#EXT-X-ENDLIST"
+
+MAX_CONCURRENT_PACKAGERS = 1
+PLAYLIST_WAIT = 15.0                # seconds a playlist request waits for packaging to start producing
+
+# No index to speak of, or one browsers can't use
+POORLY_INDEXED_EXTENSIONS = {".mpg", ".mpeg", ".ts", ".m2ts", ".mts", ".avi", ".flv", ".wmv"}
+MP4_EXTENSIONS = {".mp4", ".m4v", ".mov"}
+
+packager_slots = threading.BoundedSemaphore(MAX_CONCURRENT_PACKAGERS)
+packages_lock = threading.Lock()
+packagers = {}                      # package dir -> ffmpeg process (None while waiting for a slot)
+
+def is_faststart(fd, size):
+    """Whether an MP4's moov box comes before its mdat (so the index is read first)"""
+    offset = 0
+    while offset + 8 <= size:
+        header = os.pread(fd, 16, offset)
+        if len(header) < 8:
+            return False
+        box_size, box_type = struct.unpack(">I4s", header[:8])
+        if box_type == b"moov":
+            return True
+        if box_type == b"mdat":
+            return False
+        if box_size == 1:
+            if len(header) < 16:
+                return False
+            box_size = struct.unpack(">Q", header[8:16])[0]
+        elif box_size == 0:
+            return False
+        if box_size < 8:
+            return False
+        offset += box_size
+    return False
+
+def wants_hls(handle):
+    """
+    Whether the file behind a StreamHandle would seek better as HLS, if it has video
+    (audio seeks fine from its file or its proxy). Only looks at the file, no probing.
+    """
+    extension = (get_file_extension(handle.file_path) or "").lower()
+    if extension in POORLY_INDEXED_EXTENSIONS:
+        return True
+    if extension in MP4_EXTENSIONS:
+        try:
+            return not is_faststart(handle.fd, handle.size)
+        except OSError:
+            return False
+    # Anything else has to go through ffmpeg anyway (live or remuxed)
+    return transcode.needs_transcode(handle.file_path)
+
+def get_package_dir(id, size, mtime):
+    return os.path.join(media_cache.get_cache_dir(HLS_KIND), f"{id}_{size:x}_{int(mtime * 1000):x}")
+
+def is_complete(package_dir):
+    try:
+        with open(os.path.join(package_dir, PLAYLIST_NAME), "rb") as f:
+            return ENDLIST_TAG in f.read()
+    except OSError:
+        return False
+
+def ensure_package(id, file_path, size, mtime, plan):
+    """Package dir for the file, starting the packager if there's no (complete or in progress) package"""
+    package_dir = get_package_dir(id, size, mtime)
+    with packages_lock:
+        if package_dir in packagers:
+            return package_dir
+        if is_complete(package_dir):
+            media_cache.touch(package_dir)
+            return package_dir
+        # Left half done by an earlier run
+        media_cache.remove_file(package_dir)
+        packagers[package_dir] = None
+
+    threading.Thread(target=package, args=(id, file_path, package_dir, plan), name="hls_packager", daemon=True).start()
+    return package_dir
+
+def package(id, file_path, package_dir, plan):
+    try:
+        with packager_slots:
+            with packages_lock:
+                if package_dir not in packagers:
+                    # Removed (item deleted) while waiting
+                    return
+            # Older packages of this item (the source changed) are dead weight
+            media_cache.remove_matching(HLS_KIND, f"{id}_")
+            os.makedirs(package_dir, exist_ok=True)
+
+            stream = ffmpeg.input(file_path).output(
+                os.path.join(package_dir, PLAYLIST_NAME),
+                format="hls",
+                hls_time=SEGMENT_SECONDS,
+                hls_playlist_type="event",
+                hls_segment_type="fmp4",
+                hls_fmp4_init_filename=INIT_NAME,
+                hls_segment_filename=os.path.join(package_dir, SEGMENT_PATTERN),
+                # Segments appear under their name only once written
+                hls_flags="independent_segments+temp_file",
+                **transcode.get_codec_args(plan)
+            ).overwrite_output()
+            print(f"Packaging {id} as HLS")
+            start = time.perf_counter()
+            with packages_lock:
+                if package_dir not in packagers:
+                    return
+                # stderr isn't read, so it mustn't be a pipe (ffmpeg's progress output would fill it)
+                process = subprocess.Popen(
+                    ffmpeg.compile(stream),
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL
+                )
+                packagers[package_dir] = process
+
+            if process.wait() != 0:
+                print(f"Error packaging {id} as HLS (ffmpeg exited with {process.returncode})")
+                media_cache.remove_file(package_dir)
+                return
+            print(f"Packaged {id} as HLS in {time.perf_counter() - start:.1f}s")
+
+        media_cache.trim_cache(HLS_KIND, HLS_CACHE_MAX_BYTES, keep={package_dir})
+    except Exception as e:
+        print(f"Error packaging {id} as HLS: {str(e)}")
+        media_cache.remove_file(package_dir)
+    finally:
+        with packages_lock:
+            packagers.pop(package_dir, None)
+
+def remove_packages(id):
+    """Stop any packager of id's and delete its packages (e.g. when it's deleted)"""
+    prefix = os.path.join(media_cache.get_cache_dir(HLS_KIND), f"{id}_")
+    with packages_lock:
+        for package_dir, process in list(packagers.items()):
+            if package_dir.startswith(prefix):
+                del packagers[package_dir]
+                if process is not None and process.poll() is None:
+                    process.kill()
+    media_cache.remove_matching(HLS_KIND, f"{id}_")
+
+def is_packaging(package_dir):
+    with packages_lock:
+        return package_dir in packagers
+
+def is_available(package_dir):
+    """
+    Whether the package's playlist can be served without waiting on another item's
+    packaging: it's complete, being made, or a packager slot is free to start it.
+    """
+    with packages_lock:
+        if package_dir in packagers:
+            return True
+        # Started packagers hold a slot, ones waiting for it are queued behind them
+        if len(packagers) >= MAX_CONCURRENT_PACKAGERS:
+            return is_complete(package_dir)
+    return True
+
+#######################################################################
+#   Serving
+#######################################################################
+
+def serve_playlist(package_dir):
+    """The package's playlist; waits a little for a new packager's first segments"""
+    playlist_path = os.path.join(package_dir, PLAYLIST_NAME)
+    deadline = time.monotonic() + PLAYLIST_WAIT
+    while not os.path.exists(playlist_path):
+        if not is_packaging(package_dir):
+            return Response("Packaging failed", status=500)
+        if time.monotonic() > deadline:
+            resp = Response("Still packaging", status=503)
+            resp.headers["Retry-After"] = "2"
+            return resp
+        time.sleep(0.1)
+
+    media_cache.touch(package_dir)
+    resp = send_file(playlist_path, mimetype="application/vnd.apple.mpegurl", conditional=True, max_age=None)
+    # Grows while packaging
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+def serve_segment(package_dir, name):
+    """An init/media segment (names are the packager's own; nothing else in the dir is served)"""
+    if name != INIT_NAME and not (name.startswith("seg_") and name.endswith(".m4s") and name[4:-4].isdigit()):
+        return Response("Not found", status=404)
+    segment_path = os.path.join(package_dir, name)
+    if not os.path.exists(segment_path):
+        return Response("Not found", status=404)
+
+    resp = send_file(segment_path, mimetype="video/mp4", conditional=True)
+    # A segment never changes once it has its name (a changed source gets a new package dir)
+    resp.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return resp
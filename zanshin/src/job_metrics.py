@@ -0,0 +1,59 @@
+import time
+from contextlib import contextmanager
+import db
+import prometheus
+
+#######################################################################
+#   Per-stage job telemetry (written to the job_metrics table)
+#######################################################################
+
+class JobMetrics:
+    """
+    Collects stage timings + byte counts for one job, then writes them in one go.
+
+        metrics = JobMetrics(id, 'main')
+        with metrics.stage('download') as stage:
+            ...
+            stage['bytes'] = os.path.getsize(downloaded_file)
+        metrics.flush()
+    """
+
+    def __init__(self, media_id, job_type):
+        self.media_id = media_id
+        self.job_type = job_type
+        self.rows = []
+
+    @contextmanager
+    def stage(self, name, byte_count=None):
+        stage = {'bytes': byte_count}
+        started_t = time.time()
+        start = time.perf_counter()
+        prometheus.set_active_stage(self.job_type, name)
+        try:
+            yield stage
+        finally:
+            prometheus.set_active_stage(self.job_type, None)
+        # Only stages that ran to completion are recorded (not cancelled/failed ones)
+        self.record(name, time.perf_counter() - start, stage['bytes'], started_t)
+
+    def record(self, name, duration, byte_count=None, started_t=None):
+        """Record a stage timed elsewhere (e.g. the diarizer's own timing_stats)"""
+        if duration is None:
+            return
+        self.rows.append((
+            self.media_id,
+            self.job_type,
+            name,
+            started_t if started_t is not None else time.time(),
+            float(duration),
+            byte_count
+        ))
+
+    def flush(self):
+        if not self.rows:
+            return
+        try:
+            db.record_job_metrics(self.rows)
+        except Exception as e:
+            print(f"Error writing job metrics: {e}")
+        self.rows = []
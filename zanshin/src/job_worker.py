@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import signal
+import threading
+import traceback
+import multiprocessing
+import zmq
+import memory_tracking
+import sampling_profiler
+
+#######################################################################
+#   Killable child processes for the heavy stages of processing jobs
+#######################################################################
+
+class JobCancelled(Exception):
+    """Raised in the job loop when the running job was cancelled ('cancelled', 'deleted') or parked ('preempted')"""
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+class JobWorkerError(Exception):
+    """The task raised in the child process, or the child process died"""
+    pass
+
+# Started and not yet killed, so kill_all_workers can reach them when the app quits
+live_workers_lock = threading.Lock()
+live_workers = set()
+
+class JobWorker:
+    """
+    A child process that runs job stages (download, decompress, diarize) so they can be killed.
+
+    init_fn(*init_args) runs once in the child (e.g. loading + warming up the diarizer); its
+    return value is passed as the first argument to every task. Tasks are module-level
+    functions called as task_fn(state, report, *args), where report(message_type, content)
+    relays a status message back to the parent while the task runs.
+
+    A second pipe is served by a thread in the child, so it can be told things (e.g.
+    start the sampling profiler) while a task is running: see control().
+    """
+
+    def __init__(self, name, init_fn=None, init_args=()):
+        self.name = name
+        self.init_fn = init_fn
+        self.init_args = init_args
+        self.process = None
+        self.conn = None
+        self.control_conn = None
+        self.control_lock = threading.Lock()
+        self.control_seq = 0
+        # spawn: forking a process that has ZMQ sockets, threads and CoreML/CUDA state isn't safe
+        self.mp_context = multiprocessing.get_context('spawn')
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        """Start the child process and block until init_fn has finished"""
+        parent_conn, child_conn = self.mp_context.Pipe()
+        control_parent_conn, control_child_conn = self.mp_context.Pipe()
+        self.process = self.mp_context.Process(
+            target=_worker_main,
+            args=(child_conn, control_child_conn, self.name, self.init_fn, self.init_args),
+            name=f"job_worker:{self.name}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        control_child_conn.close()
+        self.conn = parent_conn
+        with self.control_lock:
+            self.control_conn = control_parent_conn
+        memory_tracking.register_process(f"{self.name}_worker", self.process.pid)
+        with live_workers_lock:
+            live_workers.add(self)
+        # Before init_fn, so a running profiling session also covers loading/warming up
+        sampling_profiler.register_worker(f"{self.name}_worker", self)
+
+        try:
+            message_type, payload = self.conn.recv()
+        except EOFError:
+            self.kill()
+            raise JobWorkerError(f"{self.name} worker exited during startup")
+
+        if message_type == 'error':
+            self.kill()
+            raise JobWorkerError(payload)
+
+    def kill(self):
+        """Kill the child and anything it spawned (ffmpeg, yt-dlp helpers)"""
+        # Keeps what the child's profiler sampled so far
+        sampling_profiler.unregister_worker(f"{self.name}_worker")
+
+        if self.process is not None and self.process.is_alive():
+            _kill_process_group(self.process)
+            self.process.join(timeout=5)
+        with live_workers_lock:
+            live_workers.discard(self)
+
+        if self.conn is not None:
+            self.conn.close()
+        with self.control_lock:
+            if self.control_conn is not None:
+                self.control_conn.close()
+            self.control_conn = None
+
+        memory_tracking.unregister_process(f"{self.name}_worker")
+        self.process = None
+        self.conn = None
+
+    def control(self, command, *args, timeout=5.0):
+        """
+        Run one of CONTROL_COMMANDS in the child, alongside whatever task it's running.
+        Returns its result, or None if there's no child or it didn't answer in time.
+        """
+        with self.control_lock:
+            if self.control_conn is None:
+                return None
+            self.control_seq += 1
+            seq = self.control_seq
+            try:
+                self.control_conn.send((seq, command, args))
+                deadline = time.monotonic() + timeout
+                while self.control_conn.poll(max(deadline - time.monotonic(), 0)):
+                    reply_seq, result = self.control_conn.recv()
+                    # Late answers to earlier (timed out) commands are skipped
+                    if reply_seq == seq:
+                        return result
+            except (EOFError, OSError):
+                pass
+            return None
+
+    def run(self, task_fn, *args, job_id=None, control_socket=None, on_message=None):
+        """
+        Run task_fn in the child and return its result.
+
+        While waiting, control_socket (the loop's ZMQ dealer) is watched for
+        {"command": "cancel_job", "id": job_id, "reason": ...} messages; a matching one kills
+        the child and raises JobCancelled. Other messages on the socket are dropped, since
+        the loop re-checks the queue after every job anyway. A cancel that arrived before
+        the call (between stages) raises before the task is started.
+        """
+        if control_socket is not None:
+            check_cancelled(control_socket, job_id)
+
+        if not self.is_alive():
+            self.start()
+
+        self.conn.send((task_fn, args))
+
+        poller = zmq.Poller()
+        poller.register(self.conn.fileno(), zmq.POLLIN)
+        if control_socket is not None:
+            poller.register(control_socket, zmq.POLLIN)
+
+        while True:
+            events = dict(poller.poll())
+
+            if control_socket is not None and control_socket in events:
+                reason = parse_cancel_command(control_socket.recv_string(), job_id)
+                if reason:
+                    self.kill()
+                    raise JobCancelled(reason)
+
+            if self.conn.fileno() in events:
+                try:
+                    message_type, payload = self.conn.recv()
+                except EOFError:
+                    self.kill()
+                    raise JobWorkerError(f"{self.name} worker exited unexpectedly")
+
+                if message_type == 'message':
+                    if on_message:
+                        on_message(*payload)
+                elif message_type == 'result':
+                    return payload
+                elif message_type == 'error':
+                    raise JobWorkerError(payload)
+
+def parse_cancel_command(message, job_id):
+    """Returns the cancel reason if message is a cancel_job command for job_id, else None"""
+    try:
+        command = json.loads(message)
+    except ValueError:
+        return None
+
+    if not isinstance(command, dict) or command.get('command') != 'cancel_job':
+        return None
+    if command.get('id') != job_id:
+        return None
+
+    return command.get('reason') or 'cancelled'
+
+def check_cancelled(control_socket, job_id):
+    """
+    Raise JobCancelled if a cancel for job_id is waiting on control_socket. For stage
+    boundaries, where no JobWorker.run is polling the socket: a cancel sent then stays
+    queued on it until checked here (or by the next run). Other messages are dropped.
+    """
+    while control_socket.poll(0):
+        reason = parse_cancel_command(control_socket.recv_string(), job_id)
+        if reason:
+            raise JobCancelled(reason)
+
+def cancel_command(id, reason='cancelled'):
+    return json.dumps({
+        'command': 'cancel_job',
+        'id': id,
+        'reason': reason
+    })
+
+#######################################################################
+#   Child process side
+#######################################################################
+
+# What JobWorker.control can run in the child
+CONTROL_COMMANDS = {
+    'profiler_start': sampling_profiler.start,
+    'profiler_stop': sampling_profiler.stop,
+    'profiler_result': sampling_profiler.get_result,
+}
+
+def _kill_process_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, AttributeError):
+        process.kill()
+
+def kill_all_workers():
+    """
+    Kill every live worker and what it spawned, without waiting: for when the app quits
+    (they're in process groups of their own, so nothing else takes them down with it)
+    """
+    # No lock: this runs in a signal handler, which may have interrupted a thread holding it
+    for worker in list(live_workers):
+        process = worker.process
+        if process is not None and process.is_alive():
+            _kill_process_group(process)
+
+def _worker_main(conn, control_conn, name, init_fn, init_args):
+    # Own process group, so kill() also takes out ffmpeg etc. spawned by tasks
+    try:
+        os.setpgrp()
+    except (AttributeError, OSError):
+        pass
+
+    # Samples taken in here are told apart from the backend's by their role
+    sampling_profiler.process_role = f"{name}_worker"
+    threading.Thread(target=_control_main, args=(control_conn,), name="job_worker_control", daemon=True).start()
+
+    try:
+        state = init_fn(*init_args) if init_fn else None
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+        return
+
+    conn.send(('ready', None))
+
+    def report(message_type, content=''):
+        conn.send(('message', (message_type, content)))
+
+    while True:
+        try:
+            task_fn, args = conn.recv()
+        except EOFError:
+            return
+
+        try:
+            result = task_fn(state, report, *args)
+            conn.send(('result', result))
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+
+def _control_main(control_conn):
+    while True:
+        try:
+            seq, command, args = control_conn.recv()
+        except (EOFError, OSError):
+            # The parent is gone (or killing us): don't finish the task on our own, and take
+            # the ffmpeg/yt-dlp it started along, as they're in our process group
+            _exit_process_group()
+        try:
+            result = CONTROL_COMMANDS[command](*args)
+        except Exception:
+            traceback.print_exc()
+            result = None
+        try:
+            control_conn.send((seq, result))
+        except (EOFError, OSError):
+            _exit_process_group()
+
+def _exit_process_group():
+    try:
+        # Only if setpgrp worked: otherwise the group is the backend's
+        if os.getpgrp() == os.getpid():
+            os.killpg(os.getpgrp(), signal.SIGKILL)
+    except (AttributeError, OSError):
+        pass
+    os._exit(1)
@@ -0,0 +1,119 @@
+import os
+import time
+import shutil
+import threading
+import config
+
+#######################################################################
+#   Disk cache for derived media (remuxes, ...)
+#######################################################################
+
+# Files generated from a media item live under STREAM_CACHE_DIR/<kind>/. A file is only
+# ever visible under its final name once complete: it's written to "<path>.part" and
+# renamed. Least recently used goes first when a kind grows past its size limit; "used"
+# is the file's mtime, bumped (at most once per TOUCH_INTERVAL) whenever it's served.
+# An entry can also be a directory of files (an HLS package), which is used, sized and
+# evicted as a whole.
+
+TOUCH_INTERVAL = 60.0           # seconds
+PART_SUFFIX = ".part"
+STALE_PART_AGE = 6 * 3600       # seconds; older .part files are from a crashed/killed build
+
+trim_lock = threading.Lock()
+touched_t = {}                  # path -> monotonic time of its last mtime bump
+
+def get_cache_dir(kind):
+    directory = os.path.join(config.STREAM_CACHE_DIR, kind)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+def get_part_path(path):
+    return path + PART_SUFFIX
+
+def touch(path):
+    """Mark path as recently used"""
+    now = time.monotonic()
+    if now - touched_t.get(path, float("-inf")) < TOUCH_INTERVAL:
+        return
+    touched_t[path] = now
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def get_directory_size(path):
+    total = 0
+    for entry in os.scandir(path):
+        try:
+            total += entry.stat().st_size if entry.is_file() else get_directory_size(entry.path)
+        except OSError:
+            pass
+    return total
+
+def get_cache_usage(kind):
+    """Total bytes of complete entries of `kind`"""
+    total = 0
+    for entry in os.scandir(get_cache_dir(kind)):
+        if entry.is_dir():
+            total += get_directory_size(entry.path)
+        elif entry.is_file() and not entry.name.endswith(PART_SUFFIX):
+            total += entry.stat().st_size
+    return total
+
+def trim_cache(kind, max_bytes, keep=()):
+    """Delete least recently used entries of `kind` until it fits in max_bytes; paths in keep are never deleted"""
+    with trim_lock:
+        now = time.time()
+        files = []
+        for entry in os.scandir(get_cache_dir(kind)):
+            if entry.is_dir():
+                try:
+                    files.append((entry.stat().st_mtime, get_directory_size(entry.path), entry.path))
+                except OSError:
+                    pass
+                continue
+            if not entry.is_file():
+                continue
+            try:
+                file_stat = entry.stat()
+            except OSError:
+                continue
+            if entry.name.endswith(PART_SUFFIX):
+                if now - file_stat.st_mtime > STALE_PART_AGE:
+                    remove_file(entry.path)
+                continue
+            files.append((file_stat.st_mtime, file_stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            if path in keep:
+                continue
+            remove_file(path)
+            total -= size
+            removed += 1
+
+        if removed:
+            print(f"Trimmed {removed} entries from the {kind} cache ({total / 1e9:.1f} GB left)")
+        return total
+
+def remove_file(path):
+    touched_t.pop(path, None)
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+    except OSError:
+        pass
+
+def remove_matching(kind, prefix):
+    """Delete every entry of `kind` whose name starts with prefix (e.g. all versions of a media item)"""
+    directory = os.path.join(config.STREAM_CACHE_DIR, kind)
+    if not os.path.isdir(directory):
+        return
+    for entry in os.scandir(directory):
+        if entry.name.startswith(prefix):
+            remove_file(entry.path)
@@ -0,0 +1,211 @@
+import os
+import time
+import threading
+import subprocess
+import tracemalloc
+from collections import deque
+
+#######################################################################
+#   In-process memory instrumentation (RSS sampling, tracemalloc diffs)
+#######################################################################
+
+# Threads share one address space, so RSS is tracked per process role:
+#   backend        - Flask, parent_listener, diarize_loop + metadata_loop threads
+#   diarize_worker - JobWorker child holding the diarizer
+#   io_worker      - JobWorker child for downloads / decompression
+BACKEND_ROLE = 'backend'
+
+# Sampling intervals (seconds); faster while a job runs so short peaks aren't missed
+IDLE_SAMPLE_INTERVAL = 5.0
+JOB_SAMPLE_INTERVAL = 0.5
+
+# ~1h of idle samples
+SAMPLE_HISTORY = 720
+
+# Jobs kept for the debug endpoint
+JOB_HISTORY = 200
+
+# Allocation sites kept per tracemalloc diff
+TRACEMALLOC_TOP_N = 25
+
+processes = {BACKEND_ROLE: os.getpid()}  # role -> pid
+samples = deque(maxlen=SAMPLE_HISTORY)   # {"t": .., "rss": {role: bytes}}
+job_history = deque(maxlen=JOB_HISTORY)  # {"id", "finished_t", "peak_memory", "tracemalloc"}
+
+state_lock = threading.Lock()
+active_job = None                        # {"id": .., "peaks": {role: bytes}}
+wake_sampler = threading.Event()
+sampler_thread = None
+
+def register_process(role, pid):
+    with state_lock:
+        processes[role] = pid
+
+def unregister_process(role):
+    with state_lock:
+        processes.pop(role, None)
+
+#######################################################################
+#   RSS sampling
+#######################################################################
+
+def read_rss(pid):
+    """Resident set size of pid in bytes, or None if it's gone"""
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except FileNotFoundError:
+        if os.path.exists("/proc/self"):
+            return None
+    except (OSError, ValueError, IndexError):
+        return None
+
+    # macOS: no /proc
+    try:
+        output = subprocess.run(
+            ["ps", "-o", "rss=", "-p", str(pid)],
+            capture_output=True, text=True, timeout=2
+        ).stdout.strip()
+        return int(output) * 1024 if output else None
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+def take_sample():
+    with state_lock:
+        current_processes = dict(processes)
+
+    rss = {}
+    for role, pid in current_processes.items():
+        value = read_rss(pid)
+        if value is not None:
+            rss[role] = value
+
+    sample = {"t": time.time(), "rss": rss}
+    samples.append(sample)
+
+    with state_lock:
+        if active_job is not None:
+            peaks = active_job["peaks"]
+            for role, value in rss.items():
+                if value > peaks.get(role, 0):
+                    peaks[role] = value
+
+    return sample
+
+def sampler_loop():
+    while True:
+        try:
+            take_sample()
+        except Exception as e:
+            print(f"Memory sampler error: {e}")
+        interval = JOB_SAMPLE_INTERVAL if active_job is not None else IDLE_SAMPLE_INTERVAL
+        wake_sampler.wait(interval)
+        wake_sampler.clear()
+
+def start_sampler():
+    global sampler_thread
+    if sampler_thread is None:
+        sampler_thread = threading.Thread(target=sampler_loop, name="memory_sampler", daemon=True)
+        sampler_thread.start()
+
+#######################################################################
+#   Per-job peaks
+#######################################################################
+
+def begin_job(id):
+    global active_job
+    with state_lock:
+        active_job = {"id": id, "peaks": {}}
+    wake_sampler.set()
+
+def end_job(id, tracemalloc_diffs=None):
+    """Stop tracking the job; returns {role: peak RSS bytes} seen while it ran"""
+    global active_job
+    take_sample()
+
+    with state_lock:
+        peaks = active_job["peaks"] if active_job and active_job["id"] == id else {}
+        active_job = None
+
+    job_history.append({
+        "id": id,
+        "finished_t": time.time(),
+        "peak_memory": peaks,
+        "tracemalloc": tracemalloc_diffs
+    })
+    return peaks
+
+#######################################################################
+#   tracemalloc (works in whichever process it's called from)
+#######################################################################
+
+previous_snapshot = None
+
+def snapshot_diff(top_n=TRACEMALLOC_TOP_N):
+    """
+    Allocation growth by source line since the previous call, largest first.
+    The first call starts tracing and returns None (there's nothing to diff against yet).
+    """
+    global previous_snapshot
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        previous_snapshot = None
+
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+    diff = None
+    if previous_snapshot is not None:
+        stats = snapshot.compare_to(previous_snapshot, "lineno")
+        diff = {
+            "traced_bytes": tracemalloc.get_traced_memory()[0],
+            "top": [
+                {
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_diff": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                    "size": stat.size
+                }
+                for stat in stats[:top_n]
+            ]
+        }
+
+    previous_snapshot = snapshot
+    return diff
+
+def stop_tracing():
+    global previous_snapshot
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    previous_snapshot = None
+
+def snapshot_diff_task(state, report, enabled, top_n=TRACEMALLOC_TOP_N):
+    """JobWorker task: snapshot_diff() inside the worker process (or stop tracing there)"""
+    if not enabled:
+        stop_tracing()
+        return None
+    return snapshot_diff(top_n)
+
+#######################################################################
+#   Debug report
+#######################################################################
+
+def get_report(sample_count=120):
+    current = take_sample()
+
+    with state_lock:
+        job = dict(active_job, peaks=dict(active_job["peaks"])) if active_job else None
+        current_processes = dict(processes)
+
+    return {
+        "processes": current_processes,
+        "current": current,
+        "active_job": job,
+        "samples": list(samples)[-sample_count:],
+        "jobs": list(job_history),
+        "tracemalloc_tracing": tracemalloc.is_tracing()
+    }
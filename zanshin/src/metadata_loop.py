@@ -16,8 +16,10 @@ from misc import (
     extract_first_bright_frame,
     extract_first_bright_frame_av,
     extract_yt_error,
-    extract_audio_artwork
+    extract_audio_artwork,
+    get_data_hash
 )
+from job_metrics import JobMetrics
 import config
 import av
 
@@ -64,15 +66,22 @@ def metadata_loop(parent_address, db_path=config.DB_PATH):
 
             is_local_file = source == 'local'
 
+            metrics = JobMetrics(id, 'metadata')
+
             if is_local_file:
-                duration = get_media_duration(uri)
-                aspect_ratio = get_video_aspect_ratio(uri) if media_type == 'video' else None
-                if media_type == 'video':
-                    thumbnail_data = extract_first_bright_frame_av(uri) if config.RUNNING_LINUX else extract_first_bright_frame(uri)
-                else:
-                    thumbnail_data = extract_audio_artwork(uri)
-                thumbnail_low_res_data = create_low_res_thumbnail(thumbnail_data)
+                with metrics.stage('metadata_fetch'):
+                    duration = get_media_duration(uri)
+                    aspect_ratio = get_video_aspect_ratio(uri) if media_type == 'video' else None
+
+                with metrics.stage('thumbnail') as stage:
+                    if media_type == 'video':
+                        thumbnail_data = extract_first_bright_frame_av(uri) if config.RUNNING_LINUX else extract_first_bright_frame(uri)
+                    else:
+                        thumbnail_data = extract_audio_artwork(uri)
+                    thumbnail_low_res_data = create_low_res_thumbnail(thumbnail_data)
+                    stage['bytes'] = len(thumbnail_data) if thumbnail_data else None
 
+                db_write_start = time.perf_counter()
                 conn = sqlite3.connect(db_path)
                 cursor = conn.cursor()
                 cursor.execute(
@@ -81,6 +90,9 @@ def metadata_loop(parent_address, db_path=config.DB_PATH):
                     set aspect_ratio = ?,
                         thumbnail = ?,
                         thumbnail_low_res = ?,
+                        thumbnail_hash = ?,
+                        thumbnail_low_res_hash = ?,
+                        thumbnail_updated_t = strftime('%s', 'now'),
                         duration = ?,
                         metadata_status = 'success'
                     where id = ?
@@ -88,20 +100,24 @@ def metadata_loop(parent_address, db_path=config.DB_PATH):
                     (   aspect_ratio,
                         thumbnail_data,
                         thumbnail_low_res_data,
+                        get_data_hash(thumbnail_data),
+                        get_data_hash(thumbnail_low_res_data),
                         duration,
                         id
                     )
                 )
                 conn.commit()
                 conn.close()
+                metrics.record('db_write', time.perf_counter() - db_write_start)
 
                 if media_type == 'video' and duration:
-                    storyboard_success = extract_thumbnail_previews_local(
-                        uri, id, duration,
-                        output_width=320,
-                        interval=10.0 if duration > 5*60 else 5.0,
-                        quality=50
-                    )
+                    with metrics.stage('storyboards'):
+                        storyboard_success = extract_thumbnail_previews_local(
+                            uri, id, duration,
+                            output_width=320,
+                            interval=10.0 if duration > 5*60 else 5.0,
+                            quality=50
+                        )
 
                     # Update storyboards_fetched status
                     conn = sqlite3.connect(db_path)
@@ -117,12 +133,14 @@ def metadata_loop(parent_address, db_path=config.DB_PATH):
 
             else:
                 # Fetch metadata with retries
-                video_info, error = get_video_info_with_retries(uri, force_get_raw_stream)
+                with metrics.stage('metadata_fetch'):
+                    video_info, error = get_video_info_with_retries(uri, force_get_raw_stream)
 
                 # If metadata could not be fetched, update DB and exit
                 if not video_info:
                     db.mark_job_failed('metadata', id, json.dumps(error))
                     broadcast_active_job_status(socket, 'metadata_refresh')
+                    metrics.flush()
                     # onto next job
                     continue
 
@@ -130,10 +148,13 @@ def metadata_loop(parent_address, db_path=config.DB_PATH):
                 thumbnail_data = None
                 thumbnail_low_res_data = None
                 if video_info['thumbnail_url']:
-                    thumbnail_data = fetch_online_thumbnail(video_info['thumbnail_url'])
-                    thumbnail_low_res_data = create_low_res_thumbnail(thumbnail_data)
+                    with metrics.stage('thumbnail') as stage:
+                        thumbnail_data = fetch_online_thumbnail(video_info['thumbnail_url'])
+                        thumbnail_low_res_data = create_low_res_thumbnail(thumbnail_data)
+                        stage['bytes'] = len(thumbnail_data) if thumbnail_data else None
 
                 # Write metadata into db
+                db_write_start = time.perf_counter()
                 conn = sqlite3.connect(db_path)
                 cursor = conn.cursor()
                 cursor.execute(
@@ -142,6 +163,9 @@ def metadata_loop(parent_address, db_path=config.DB_PATH):
                     set aspect_ratio = ?,
                         thumbnail = ?,
                         thumbnail_low_res = ?,
+                        thumbnail_hash = ?,
+                        thumbnail_low_res_hash = ?,
+                        thumbnail_updated_t = strftime('%s', 'now'),
                         title = ?,
                         duration = ?,
                         date_uploaded = ?,
@@ -156,6 +180,8 @@ def metadata_loop(parent_address, db_path=config.DB_PATH):
                     (   video_info['aspect_ratio'],
                         thumbnail_data,
                         thumbnail_low_res_data,
+                        get_data_hash(thumbnail_data),
+                        get_data_hash(thumbnail_low_res_data),
                         video_info['title'],
                         video_info['duration'],
                         video_info['date_uploaded'],
@@ -169,6 +195,7 @@ def metadata_loop(parent_address, db_path=config.DB_PATH):
                 )
                 conn.commit()
                 conn.close()
+                metrics.record('db_write', time.perf_counter() - db_write_start)
 
             # Alert client of new metadata
             broadcast_active_job_status(socket, 'metadata_refresh')
@@ -176,7 +203,8 @@ def metadata_loop(parent_address, db_path=config.DB_PATH):
             # Process storyboards
             if not is_local_file and not force_get_raw_stream:
                 if media_type == 'video' and video_info.get('storyboard_available'):
-                    storyboard_success = fetch_youtube_thumbnail_previews(uri, id, video_info['duration'], video_info.get('storyboard_subimage_resolution'))
+                    with metrics.stage('storyboards'):
+                        storyboard_success = fetch_youtube_thumbnail_previews(uri, id, video_info['duration'], video_info.get('storyboard_subimage_resolution'))
 
                     # Update storyboards_fetched status
                     conn = sqlite3.connect(db_path)
@@ -211,6 +239,8 @@ def metadata_loop(parent_address, db_path=config.DB_PATH):
                     'id': id
                 })
 
+            metrics.flush()
+
             # Onto next job
             continue
 
@@ -495,14 +525,14 @@ def fetch_youtube_thumbnail_previews(video_id, media_id, video_duration, subimag
 
                             # Add to batch
                             frame_id = f"{media_id}-{timestamp_seconds}"
-                            frame_batch.append((frame_id, media_id, timestamp_seconds, img_data))
+                            frame_batch.append((frame_id, media_id, timestamp_seconds, img_data, get_data_hash(img_data)))
 
                             # Write batch to database when it reaches batch_size
                             if len(frame_batch) >= batch_size:
                                 conn = sqlite3.connect(db_path)
                                 cursor = conn.cursor()
                                 cursor.executemany(
-                                    "INSERT OR REPLACE INTO frames (frame_id, media_id, timestamp, frame) VALUES (?, ?, ?, ?)",
+                                    "INSERT OR REPLACE INTO frames (frame_id, media_id, timestamp, frame, frame_hash, created_t) VALUES (?, ?, ?, ?, ?, strftime('%s', 'now'))",
                                     frame_batch
                                 )
                                 conn.commit()
@@ -524,7 +554,7 @@ def fetch_youtube_thumbnail_previews(video_id, media_id, video_duration, subimag
             conn = sqlite3.connect(db_path)
             cursor = conn.cursor()
             cursor.executemany(
-                "INSERT OR REPLACE INTO frames (frame_id, media_id, timestamp, frame) VALUES (?, ?, ?, ?)",
+                "INSERT OR REPLACE INTO frames (frame_id, media_id, timestamp, frame, frame_hash, created_t) VALUES (?, ?, ?, ?, ?, strftime('%s', 'now'))",
                 frame_batch
             )
             conn.commit()
@@ -625,14 +655,14 @@ def extract_thumbnail_previews_local(video_path, media_id, video_duration, outpu
                     frame_id = f"{media_id}-{rounded_timestamp}"
 
                     # Add to batch
-                    frame_batch.append((frame_id, media_id, rounded_timestamp, img_data))
+                    frame_batch.append((frame_id, media_id, rounded_timestamp, img_data, get_data_hash(img_data)))
 
                     # Write batch to database when it reaches batch_size
                     if len(frame_batch) >= batch_size:
                         conn = sqlite3.connect(db_path)
                         cursor = conn.cursor()
                         cursor.executemany(
-                            "INSERT OR REPLACE INTO frames (frame_id, media_id, timestamp, frame) VALUES (?, ?, ?, ?)",
+                            "INSERT OR REPLACE INTO frames (frame_id, media_id, timestamp, frame, frame_hash, created_t) VALUES (?, ?, ?, ?, ?, strftime('%s', 'now'))",
                             frame_batch
                         )
                         conn.commit()
@@ -656,7 +686,7 @@ def extract_thumbnail_previews_local(video_path, media_id, video_duration, outpu
             conn = sqlite3.connect(db_path)
             cursor = conn.cursor()
             cursor.executemany(
-                "INSERT OR REPLACE INTO frames (frame_id, media_id, timestamp, frame) VALUES (?, ?, ?, ?)",
+                "INSERT OR REPLACE INTO frames (frame_id, media_id, timestamp, frame, frame_hash, created_t) VALUES (?, ?, ?, ?, ?, strftime('%s', 'now'))",
                 frame_batch
             )
             conn.commit()
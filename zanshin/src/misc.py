@@ -3,18 +3,11 @@ import json
 import zmq
 import base64
 import sys
-import av
 import os
 import pwd
 import config
-import ffmpeg
-import requests
-import xxhash
 import subprocess
-import numpy as np
 import shared_dict
-import cv2
-from PIL import Image
 import io
 import tempfile
 import shutil
@@ -22,6 +15,9 @@ import shutil
 if config.RUNNING_DARWIN:
     import Foundation
 
+# av, cv2, ffmpeg, numpy, PIL, requests and xxhash are imported inside the functions that
+# use them: they're slow to load and app.py imports this module before the server is up
+
 #######################################################################
 #   misc
 #######################################################################
@@ -59,6 +55,8 @@ def get_filename(filepath):
     return os.path.basename(filepath)
 
 def get_file_hash(filepath):
+    import xxhash
+
     h = xxhash.xxh3_64()
     with open(filepath, 'rb') as f:
         # 64KB chunks
@@ -66,7 +64,17 @@ def get_file_hash(filepath):
             h.update(chunk)
     return h.hexdigest()
 
+def get_data_hash(data):
+    """Content hash of in-memory bytes (thumbnail/frame ETags), None for no data"""
+    import xxhash
+
+    if data is None:
+        return None
+    return xxhash.xxh3_64_hexdigest(data)
+
 def get_http_status_code(url):
+    import requests
+
     try:
         response = requests.get(url, timeout=10)
         return response.status_code
@@ -81,11 +89,12 @@ def get_file_extension(file_path):
        return None
    return filename[dot_position:]
 
-def is_supported_format(extension):
+def is_browser_playable_format(extension):
+   """Formats /api/stream serves as they are"""
    if extension is None:
        return False
 
-   supported_media_formats = [
+   browser_playable_formats = [
        # Audio Formats
        ".mp3",
        ".wav",
@@ -106,7 +115,41 @@ def is_supported_format(extension):
    if not extension.startswith("."):
        extension = "." + extension
 
-   return extension.lower() in supported_media_formats
+   return extension.lower() in browser_playable_formats
+
+def is_supported_format(extension):
+   """Formats that can be imported: browser playable ones, plus ones /api/stream remuxes/transcodes (see transcode.py)"""
+   if extension is None:
+       return False
+
+   transcoded_formats = [
+       # Audio Formats
+       ".flac",
+       ".mka",
+       ".wma",
+       ".aiff",
+       ".aif",
+       ".wv",
+       ".ape",
+
+       # Video Formats
+       ".mkv",
+       ".mov",
+       ".m4v",
+       ".avi",
+       ".wmv",
+       ".flv",
+       ".ts",
+       ".m2ts",
+       ".mts",
+       ".3gp"
+   ]
+
+   # Ensure the extension has a leading period
+   if not extension.startswith("."):
+       extension = "." + extension
+
+   return is_browser_playable_format(extension) or extension.lower() in transcoded_formats
 
 def check_internet_connection():
     """Check internet connection by pinging Cloudflare's DNS server (macOS only)"""
@@ -157,23 +200,13 @@ def create_dealer_socket(parent_address, dealer_name):
     dealer_to_router(socket, "DEALER_REGISTRATION")
     return context, socket
 
-
-def collect_dealers(socket, expected_count):
-    collected_identities = set()
-    while len(collected_identities) < expected_count:
-        identity = socket.recv()
-        content = socket.recv()
-        message = content.decode('utf-8')
-        if message == "DEALER_REGISTRATION":
-            collected_identities.add(identity)
-
-    return collected_identities
-
 #######################################################################
 #   ffmpeg / opencv
 #######################################################################
 
 def get_media_types(file_path):
+    import ffmpeg
+
     try:
         probe = ffmpeg.probe(file_path)
         media_types = []
@@ -192,6 +225,8 @@ def get_media_types(file_path):
         return []
 
 def get_media_duration(file_path):
+    import ffmpeg
+
     try:
         probe = ffmpeg.probe(file_path)
         duration = float(probe['format']['duration'])
@@ -204,6 +239,8 @@ def get_media_duration(file_path):
         raise
 
 def get_video_aspect_ratio(file_path):
+    import ffmpeg
+
     try:
         probe = ffmpeg.probe(file_path)
         video_streams = [stream for stream in probe['streams']
@@ -225,6 +262,9 @@ def get_video_aspect_ratio(file_path):
         return None
 
 def extract_first_bright_frame(input_video, brightness_threshold=100, max_time=5.0):
+    import cv2
+    import numpy as np
+
     # Open the video file
     cap = cv2.VideoCapture(input_video)
     if not cap.isOpened():
@@ -284,6 +324,10 @@ def extract_first_bright_frame_av(input_video, brightness_threshold=100, max_tim
     Need this becuase on Linux, the regular function above doesn't work
     (see https://github.com/opencv/opencv/issues/24430)
     """
+    import av
+    import numpy as np
+    from PIL import Image
+
     try:
         # Open video container
         container = av.open(input_video)
@@ -338,6 +382,8 @@ def extract_first_bright_frame_av(input_video, brightness_threshold=100, max_tim
         return None
 
 def extract_audio_artwork(audio_file):
+    import ffmpeg
+
     # First try using ffmpeg
     try:
         # Try to extract embedded artwork using ffmpeg
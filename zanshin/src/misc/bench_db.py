@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Synthetic large-library benchmark for the db.py read paths.
+
+Generates a media.db with N media rows (realistic segment JSON sizes, thumbnails,
+storyboard frames) and times fetch_media_previews, fetch_media_item, fetch_frame,
+fetch_thumbnail and check_file_exists, cold (db file evicted from the page cache)
+and warm. Results are written as JSON so runs can be compared between versions.
+
+    python misc/bench_db.py --rows 10000 --output bench_db_results.json
+    python misc/bench_db.py --rows 100000 --frames-per-video 120 --compare previous.json
+
+Runs offline; cold runs use posix_fadvise(DONTNEED), so no root needed on Linux.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+# src/misc.py shadows this directory as a module, so import the backend modules from src/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+# fetch_media_previews reads settings: use a scratch settings file next to the scratch db, not
+# the real one. Set before importing db, whose settings functions take the path as a default
+config.SETTINGS_PATH = os.path.join(tempfile.gettempdir(), "zanshin_bench_settings.json")
+
+import db
+
+#######################################################################
+#   Synthetic library
+#######################################################################
+
+SPEAKERS = [f"SPEAKER_{i:02d}" for i in range(8)]
+
+def synthetic_segments(rng, duration):
+    """Merged segments roughly like real diarization output: a turn every ~2-15s"""
+    segments = []
+    t = 0.0
+    speaker_count = rng.randint(2, 6)
+    while t < duration:
+        length = rng.uniform(2.0, 15.0)
+        segments.append({
+            "start": round(t, 3),
+            "end": round(min(t + length, duration), 3),
+            "speaker": SPEAKERS[rng.randrange(speaker_count)]
+        })
+        t += length + rng.uniform(0.0, 1.0)
+    return segments
+
+def synthetic_raw_segments(rng, merged_segments):
+    """Raw segments are the merged ones split into ~1.5s VAD/embedding windows"""
+    raw = []
+    for segment in merged_segments:
+        t = segment["start"]
+        while t < segment["end"]:
+            raw.append({"start": round(t, 3), "end": round(min(t + 1.5, segment["end"]), 3), "speaker": segment["speaker"]})
+            t += 1.5
+    return raw
+
+def generate_library(db_path, rows, video_fraction, local_fraction, frames_per_video,
+                     thumbnail_bytes, frame_bytes, seed):
+    rng = random.Random(seed)
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    db.initialize(db_path=db_path)
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA synchronous = OFF")
+    cursor.execute("PRAGMA journal_mode = MEMORY")
+
+    # Random (incompressible, like jpeg) blobs, sliced per row to avoid regenerating
+    blob_pool = rng.randbytes(max(thumbnail_bytes, frame_bytes) * 4)
+
+    columns = list(db.get_media_columns().keys())
+    placeholders = ", ".join("?" for _ in columns)
+    insert_media = f"INSERT INTO media ({', '.join(columns)}) VALUES ({placeholders})"
+
+    local_hashes = []
+    video_ids = []
+    now = int(time.time())
+    frame_total = 0
+    start = time.perf_counter()
+
+    for i in range(rows):
+        id = f"{i:011d}"
+        is_local = rng.random() < local_fraction
+        media_type = 'video' if rng.random() < video_fraction else 'audio'
+        duration = rng.lognormvariate(7.3, 0.9)  # median ~25 min, long tail into hours
+        status = rng.choices(['success', 'queued', 'failed', 'processing'], weights=[90, 6, 3, 1])[0]
+
+        merged = synthetic_segments(rng, duration) if status == 'success' else None
+        raw = synthetic_raw_segments(rng, merged) if merged else None
+        offset = rng.randrange(len(blob_pool) - thumbnail_bytes)
+
+        values = {column: None for column in columns}
+        values.update({
+            'id': id,
+            'source': 'local' if is_local else 'youtube',
+            # Non-macOS local uris are plain paths; these don't exist, like moved files
+            'uri': f"/nonexistent/library/{id}.mp4" if is_local else f"yt{id}",
+            'media_type': media_type,
+            'title': f"Synthetic media item {i}",
+            'duration': duration,
+            'aspect_ratio': 16 / 9 if media_type == 'video' else None,
+            'thumbnail': blob_pool[offset:offset + thumbnail_bytes],
+            'thumbnail_low_res': blob_pool[offset:offset + thumbnail_bytes // 9],
+            'creation_timestamp': now - rng.randrange(10**8) if is_local else None,
+            'hash': f"{rng.getrandbits(64):016x}" if is_local else None,
+            'date_uploaded': None if is_local else "20240101",
+            'channel': None if is_local else f"Channel {rng.randrange(500)}",
+            'status': status,
+            'metadata_status': 'success',
+            'submitted_t': now - (rows - i) * 60,
+            'finished_t': now - (rows - i) * 60 + 30 if status == 'success' else None,
+            'merged_segments': json.dumps(merged) if merged else None,
+            'raw_segments': json.dumps(raw) if raw else None,
+            'speaker_color_sets': json.dumps({"1": {s: "#aabbcc" for s in SPEAKERS}}) if merged else None,
+            'selected_colorset_num': 2,
+            'playback_position': 0,
+            'skip_silences': 0,
+            'priority': 0,
+            'pinned': 0,
+        })
+        cursor.execute(insert_media, [values[column] for column in columns])
+
+        if is_local:
+            local_hashes.append(values['hash'])
+
+        if media_type == 'video' and frames_per_video:
+            video_ids.append(id)
+            interval = max(1, int(duration / frames_per_video))
+            frame_rows = []
+            for n in range(frames_per_video):
+                timestamp = n * interval
+                offset = rng.randrange(len(blob_pool) - frame_bytes)
+                frame_rows.append((f"{id}-{timestamp}", id, timestamp, blob_pool[offset:offset + frame_bytes]))
+            cursor.executemany("INSERT OR IGNORE INTO frames (frame_id, media_id, timestamp, frame) VALUES (?, ?, ?, ?)", frame_rows)
+            frame_total += len(frame_rows)
+
+        if i % 1000 == 999:
+            conn.commit()
+            print(f"  {i + 1}/{rows} media rows, {frame_total} frames ({time.perf_counter() - start:.0f}s)")
+
+    conn.commit()
+    conn.close()
+
+    return {
+        'local_hashes': local_hashes,
+        'video_ids': video_ids,
+        'frames_per_video': frames_per_video,
+        'frame_total': frame_total
+    }
+
+def describe_library(db_path):
+    """Ids/hashes to query when reusing an existing synthetic db"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT hash FROM media WHERE source = 'local' AND hash IS NOT NULL")
+    local_hashes = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT DISTINCT media_id FROM frames")
+    video_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT COUNT(*) FROM frames")
+    frame_total = cursor.fetchone()[0]
+    conn.close()
+    return {
+        'local_hashes': local_hashes,
+        'video_ids': video_ids,
+        'frames_per_video': None,
+        'frame_total': frame_total
+    }
+
+#######################################################################
+#   Timing
+#######################################################################
+
+def evict_from_page_cache(path):
+    """Drop the file's pages from the OS page cache (cold read)"""
+    for file_path in (path, f"{path}-wal", f"{path}-shm"):
+        if not os.path.exists(file_path):
+            continue
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'n': len(samples),
+        'min_ms': samples[0] * 1000,
+        'p50_ms': statistics.median(samples) * 1000,
+        'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        'max_ms': samples[-1] * 1000,
+        'mean_ms': statistics.fmean(samples) * 1000
+    }
+
+def time_read_path(name, make_call, db_path, cold_runs, warm_runs):
+    """make_call(rng) -> zero-arg callable for one randomly chosen input"""
+    rng = random.Random(name)
+    cold = []
+    can_evict = hasattr(os, 'posix_fadvise')
+
+    if can_evict:
+        for _ in range(cold_runs):
+            call = make_call(rng)
+            evict_from_page_cache(db_path)
+            start = time.perf_counter()
+            call()
+            cold.append(time.perf_counter() - start)
+
+    # Warm up, then measure
+    for _ in range(min(warm_runs, 10)):
+        make_call(rng)()
+
+    warm = []
+    for _ in range(warm_runs):
+        call = make_call(rng)
+        start = time.perf_counter()
+        call()
+        warm.append(time.perf_counter() - start)
+
+    result = {
+        'cold': summarize(cold) if cold else None,
+        'warm': summarize(warm)
+    }
+    cold_str = f"cold p50 {result['cold']['p50_ms']:8.2f} ms  " if cold else "cold n/a          "
+    print(f"  {name:<28} {cold_str}warm p50 {result['warm']['p50_ms']:8.2f} ms  p95 {result['warm']['p95_ms']:8.2f} ms")
+    return result
+
+def run_benchmarks(db_path, library, cold_runs, warm_runs, preview_runs):
+    conn = sqlite3.connect(db_path)
+    all_ids = [row[0] for row in conn.execute("SELECT id FROM media")]
+    frame_keys = {}
+    conn.close()
+
+    def frame_key(rng):
+        media_id = rng.choice(library['video_ids'])
+        if media_id not in frame_keys:
+            conn = sqlite3.connect(db_path)
+            frame_keys[media_id] = [row[0] for row in conn.execute("SELECT timestamp FROM frames WHERE media_id = ?", (media_id,))]
+            conn.close()
+        return media_id, rng.choice(frame_keys[media_id])
+
+    results = {}
+
+    # Full library listing is expensive at scale, so fewer runs
+    results['fetch_media_previews'] = time_read_path(
+        'fetch_media_previews',
+        lambda rng: lambda: db.fetch_media_previews(db_path=db_path),
+        db_path, min(cold_runs, preview_runs), preview_runs
+    )
+
+    results['fetch_media_item'] = time_read_path(
+        'fetch_media_item',
+        lambda rng: (lambda id: lambda: db.fetch_media_item(id, None, db_path=db_path))(rng.choice(all_ids)),
+        db_path, cold_runs, warm_runs
+    )
+
+    results['fetch_thumbnail'] = time_read_path(
+        'fetch_thumbnail',
+        lambda rng: (lambda id: lambda: db.fetch_thumbnail(id, db_path=db_path))(rng.choice(all_ids)),
+        db_path, cold_runs, warm_runs
+    )
+
+    results['fetch_thumbnail_low_res'] = time_read_path(
+        'fetch_thumbnail_low_res',
+        lambda rng: (lambda id: lambda: db.fetch_thumbnail(id, low_res=True, db_path=db_path))(rng.choice(all_ids)),
+        db_path, cold_runs, warm_runs
+    )
+
+    if library['video_ids']:
+        results['fetch_frame'] = time_read_path(
+            'fetch_frame',
+            lambda rng: (lambda key: lambda: db.fetch_frame(key[0], key[1], db_path=db_path))(frame_key(rng)),
+            db_path, cold_runs, warm_runs
+        )
+
+    if library['local_hashes']:
+        results['check_file_exists_hit'] = time_read_path(
+            'check_file_exists (hit)',
+            lambda rng: (lambda h: lambda: db.check_file_exists(h, db_path=db_path))(rng.choice(library['local_hashes'])),
+            db_path, cold_runs, warm_runs
+        )
+
+    results['check_file_exists_miss'] = time_read_path(
+        'check_file_exists (miss)',
+        lambda rng: (lambda h: lambda: db.check_file_exists(h, db_path=db_path))(f"{rng.getrandbits(64):016x}"),
+        db_path, cold_runs, warm_runs
+    )
+
+    return results
+
+#######################################################################
+#   Results
+#######################################################################
+
+def get_version():
+    version_file = os.path.join(os.path.dirname(config.SCRIPT_DIR), 'VERSION')
+    if os.path.exists(version_file):
+        with open(version_file, 'r') as f:
+            return f.read().strip()
+    return None
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=config.SCRIPT_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+def compare(results, previous_path):
+    with open(previous_path, 'r') as f:
+        previous = json.load(f)
+
+    print(f"\nCompared to {previous_path} (version {previous.get('version')}, {previous.get('git_commit')}):")
+    for name, result in results.items():
+        before = previous.get('results', {}).get(name)
+        if not before:
+            continue
+        for temperature in ('cold', 'warm'):
+            if not result.get(temperature) or not before.get(temperature):
+                continue
+            old = before[temperature]['p50_ms']
+            new = result[temperature]['p50_ms']
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"  {name:<28} {temperature} p50 {old:8.2f} -> {new:8.2f} ms ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark db.py read paths on a synthetic library")
+    parser.add_argument('--rows', type=int, default=10000, help='media rows to generate (default: 10000)')
+    parser.add_argument('--frames-per-video', type=int, default=250, help='storyboard frames per video item (default: 250)')
+    parser.add_argument('--video-fraction', type=float, default=0.4, help='fraction of items that are video (default: 0.4)')
+    parser.add_argument('--local-fraction', type=float, default=0.3, help='fraction of items that are local files (default: 0.3)')
+    parser.add_argument('--thumbnail-bytes', type=int, default=40_000, help='thumbnail size (default: 40000)')
+    parser.add_argument('--frame-bytes', type=int, default=2_000, help='storyboard frame size (default: 2000)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', default=None, help='synthetic db path (default: temp dir)')
+    parser.add_argument('--reuse', action='store_true', help='reuse an existing --db instead of regenerating')
+    parser.add_argument('--cold-runs', type=int, default=20)
+    parser.add_argument('--warm-runs', type=int, default=200)
+    parser.add_argument('--preview-runs', type=int, default=5, help='runs of fetch_media_previews (default: 5)')
+    parser.add_argument('--output', default='bench_db_results.json', help='results JSON path')
+    parser.add_argument('--compare', default=None, help='previous results JSON to diff against')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.gettempdir(), f"zanshin_bench_{args.rows}.db")
+    db.initialize_settings()
+
+    if args.reuse and os.path.exists(db_path):
+        print(f"Reusing {db_path}")
+        library = describe_library(db_path)
+    else:
+        print(f"Generating {args.rows} media rows into {db_path}...")
+        start = time.perf_counter()
+        library = generate_library(
+            db_path, args.rows, args.video_fraction, args.local_fraction, args.frames_per_video,
+            args.thumbnail_bytes, args.frame_bytes, args.seed
+        )
+        print(f"Generated in {time.perf_counter() - start:.1f}s")
+
+    print(f"Library: {args.rows} rows, {library['frame_total']} frames, {os.path.getsize(db_path) / 1e6:.0f} MB\n")
+
+    results = run_benchmarks(db_path, library, args.cold_runs, args.warm_runs, args.preview_runs)
+
+    output = {
+        'version': get_version(),
+        'git_commit': get_git_commit(),
+        'timestamp': time.time(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'params': {
+            'rows': args.rows,
+            'frames': library['frame_total'],
+            'frames_per_video': args.frames_per_video,
+            'video_fraction': args.video_fraction,
+            'local_fraction': args.local_fraction,
+            'thumbnail_bytes': args.thumbnail_bytes,
+            'frame_bytes': args.frame_bytes,
+            'db_bytes': os.path.getsize(db_path),
+            'seed': args.seed
+        },
+        'results': results
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark of the local-file processing path.
+
+Builds deterministic fixture media with ffmpeg's lavfi sources (testsrc2 video +
+synthetic speech-like audio: harmonic "voices" with vibrato and syllable-rate
+amplitude modulation, taking turns), then runs the same steps a local file goes
+through in the app:
+
+    get_file_hash -> duration/aspect probes -> thumbnail -> storyboard frames
+    -> decompress_audio -> diarizer load -> diarize
+
+and reports wall time, CPU time (including ffmpeg subprocesses) and peak RSS per stage.
+
+    python misc/bench_pipeline.py --duration 600 --speakers 3
+    python misc/bench_pipeline.py --duration 3600 --audio-only --output bench_pipeline_results.json
+
+No network access or YouTube needed; requires ffmpeg on PATH and senko installed.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+
+# src/misc.py shadows this directory as a module, so import the backend modules from src/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import config
+from misc import (
+    get_file_hash,
+    get_media_duration,
+    get_video_aspect_ratio,
+    extract_first_bright_frame,
+    extract_first_bright_frame_av
+)
+from metadata_loop import extract_thumbnail_previews_local, create_low_res_thumbnail
+from diarize_loop import decompress_audio
+
+#######################################################################
+#   Fixture media
+#######################################################################
+
+# Fundamental frequencies of the synthetic voices (Hz)
+VOICE_F0 = [110, 196, 147, 233, 123, 175]
+
+def speech_like_expression(speakers, turn_seconds):
+    """
+    aevalsrc expression: one voice at a time, switching every turn_seconds.
+    Each voice is a few harmonics of its f0 with vibrato, amplitude modulated at a
+    syllable-ish rate so VAD and the speaker embeddings see something voice-like.
+    """
+    voices = []
+    for k in range(speakers):
+        f0 = VOICE_F0[k % len(VOICE_F0)]
+        syllable_rate = 3.5 + 0.4 * k
+        phase = f"2*PI*{f0}*t+3*sin(2*PI*{5 + k}*t)"
+        harmonics = f"(sin({phase})+0.5*sin(2*({phase}))+0.25*sin(3*({phase})))"
+        envelope = f"pow(0.5+0.5*sin(2*PI*{syllable_rate}*t),2)"
+        gate = f"eq(mod(floor(t/{turn_seconds}),{speakers}),{k})"
+        voices.append(f"{gate}*{harmonics}*{envelope}")
+    return f"0.3*({'+'.join(voices)})"
+
+def build_fixture(path, duration, speakers, turn_seconds, audio_only, resolution, fps):
+    audio_source = f"aevalsrc='{speech_like_expression(speakers, turn_seconds)}':s=44100:d={duration}"
+
+    command = [shutil.which('ffmpeg') or 'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y']
+    if not audio_only:
+        command += ['-f', 'lavfi', '-i', f"testsrc2=size={resolution}:rate={fps}:duration={duration}"]
+    command += ['-f', 'lavfi', '-i', audio_source]
+
+    if audio_only:
+        command += ['-c:a', 'aac', '-b:a', '128k']
+    else:
+        command += ['-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-g', str(fps * 2),
+                    '-c:a', 'aac', '-b:a', '128k', '-shortest']
+    command += [path]
+
+    subprocess.run(command, check=True)
+    return path
+
+#######################################################################
+#   Per-stage measurement
+#######################################################################
+
+def read_rss():
+    """Current RSS of this process in bytes"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+def maxrss_bytes(usage):
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return usage.ru_maxrss if config.RUNNING_DARWIN else usage.ru_maxrss * 1024
+
+class StageTimer:
+    """Wall time, CPU time (self + waited-for children) and peak RSS of one stage"""
+
+    def __init__(self, name, results, sample_interval=0.01):
+        self.name = name
+        self.results = results
+        self.sample_interval = sample_interval
+        self.peak_rss = 0
+        self.stop_event = threading.Event()
+
+    def sample(self):
+        while not self.stop_event.is_set():
+            rss = read_rss()
+            if rss and rss > self.peak_rss:
+                self.peak_rss = rss
+            self.stop_event.wait(self.sample_interval)
+
+    def __enter__(self):
+        print(f"  {self.name}...", end='', flush=True)
+        self.peak_rss = read_rss() or 0
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        self.self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.start
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.stop_event.set()
+        self.sampler.join()
+
+        cpu_self = (self_usage.ru_utime - self.self_usage.ru_utime) + (self_usage.ru_stime - self.self_usage.ru_stime)
+        cpu_children = (children_usage.ru_utime - self.children_usage.ru_utime) + (children_usage.ru_stime - self.children_usage.ru_stime)
+
+        # ru_maxrss of children is the largest child so far; only meaningful if it grew in this stage
+        children_peak = maxrss_bytes(children_usage) if children_usage.ru_maxrss > self.children_usage.ru_maxrss else None
+
+        self.results[self.name] = {
+            'wall_s': wall,
+            'cpu_s': cpu_self + cpu_children,
+            'cpu_children_s': cpu_children,
+            'peak_rss_bytes': self.peak_rss or maxrss_bytes(self_usage),
+            'children_peak_rss_bytes': children_peak,
+            'ok': exc_type is None
+        }
+        print(f" {wall:.2f}s wall, {cpu_self + cpu_children:.2f}s cpu, {self.results[self.name]['peak_rss_bytes'] / 1e6:.0f} MB peak RSS")
+        return False
+
+#######################################################################
+#   Pipeline
+#######################################################################
+
+def run_pipeline(media_path, audio_only, work_dir, warmup):
+    results = {}
+    db_path = os.path.join(work_dir, 'bench_media.db')
+    db.initialize(db_path=db_path)
+
+    media_id = 'benchmark01'
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "INSERT INTO media (id, source, uri, media_type, status, submitted_t) VALUES (?, 'local', ?, ?, 'queued', strftime('%s', 'now'))",
+        (media_id, media_path, 'audio' if audio_only else 'video')
+    )
+    conn.commit()
+    conn.close()
+
+    with StageTimer('get_file_hash', results):
+        get_file_hash(media_path)
+
+    with StageTimer('metadata_probes', results):
+        duration = get_media_duration(media_path)
+        if not audio_only:
+            get_video_aspect_ratio(media_path)
+
+    if not audio_only:
+        with StageTimer('thumbnail', results):
+            thumbnail_data = extract_first_bright_frame_av(media_path) if config.RUNNING_LINUX else extract_first_bright_frame(media_path)
+            create_low_res_thumbnail(thumbnail_data)
+
+        # Same interval rule as metadata_loop
+        with StageTimer('storyboards', results):
+            extract_thumbnail_previews_local(
+                media_path, media_id, duration,
+                output_width=320,
+                interval=10.0 if duration > 5*60 else 5.0,
+                quality=50,
+                db_path=db_path
+            )
+
+    wav_file = os.path.join(work_dir, f"{media_id}.wav")
+    with StageTimer('decompress_audio', results):
+        decompress_audio(media_path, wav_file)
+
+    # Imported here so the earlier stages' RSS doesn't include the models
+    with StageTimer('diarizer_load', results):
+        from senko import Diarizer
+        diarizer = Diarizer(warmup=warmup, quiet=True)
+
+    with StageTimer('diarize', results):
+        result = diarizer.diarize(wav_file, generate_colors=True)
+
+    diarize_info = {}
+    if result:
+        diarize_info = {
+            'speakers_found': len(result.get('speaker_centroids') or {}),
+            'merged_segments': len(result.get('merged_segments') or []),
+            'timing_stats': result.get('timing_stats')
+        }
+
+    return duration, results, diarize_info
+
+#######################################################################
+#   main
+#######################################################################
+
+def main():
+    from bench_db import get_version, get_git_commit
+
+    parser = argparse.ArgumentParser(description="Benchmark the local-file pipeline on generated media")
+    parser.add_argument('--duration', type=float, default=300, help='fixture length in seconds (default: 300)')
+    parser.add_argument('--speakers', type=int, default=3, help='synthetic voices taking turns (default: 3)')
+    parser.add_argument('--turn-seconds', type=float, default=8.0, help='length of each speaking turn (default: 8)')
+    parser.add_argument('--audio-only', action='store_true', help='generate an audio file (skips video stages)')
+    parser.add_argument('--resolution', default='1280x720', help='fixture video size (default: 1280x720)')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--no-warmup', action='store_true', help='skip diarizer warmup')
+    parser.add_argument('--work-dir', default=None, help='where fixtures + scratch db go (default: temp dir)')
+    parser.add_argument('--keep', action='store_true', help='keep the work dir (fixtures are reused on the next run)')
+    parser.add_argument('--output', default='bench_pipeline_results.json', help='results JSON path')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='zanshin_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+
+    extension = 'm4a' if args.audio_only else 'mp4'
+    fixture_name = f"fixture_{int(args.duration)}s_{args.speakers}spk_{args.turn_seconds:g}t{'' if args.audio_only else '_' + args.resolution}.{extension}"
+    media_path = os.path.join(work_dir, fixture_name)
+
+    try:
+        if os.path.exists(media_path):
+            print(f"Reusing fixture {media_path}")
+        else:
+            print(f"Building fixture {media_path}...")
+            start = time.perf_counter()
+            build_fixture(media_path, args.duration, args.speakers, args.turn_seconds, args.audio_only, args.resolution, args.fps)
+            print(f"Built in {time.perf_counter() - start:.1f}s ({os.path.getsize(media_path) / 1e6:.1f} MB)")
+
+        print("\nStages:")
+        duration, results, diarize_info = run_pipeline(media_path, args.audio_only, work_dir, not args.no_warmup)
+
+        total_wall = sum(stage['wall_s'] for stage in results.values())
+        print(f"\nTotal {total_wall:.2f}s for {duration:.0f}s of media ({duration / total_wall:.1f}x real time)")
+        if diarize_info:
+            print(f"Diarization found {diarize_info['speakers_found']} speakers (fixture has {args.speakers})")
+
+        output = {
+            'version': get_version(),
+            'git_commit': get_git_commit(),
+            'timestamp': time.time(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'params': {
+                'duration': args.duration,
+                'speakers': args.speakers,
+                'turn_seconds': args.turn_seconds,
+                'audio_only': args.audio_only,
+                'resolution': None if args.audio_only else args.resolution,
+                'fps': None if args.audio_only else args.fps,
+                'warmup': not args.no_warmup,
+                'fixture_bytes': os.path.getsize(media_path)
+            },
+            'media_duration': duration,
+            'stages': results,
+            'diarization': diarize_info
+        }
+
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
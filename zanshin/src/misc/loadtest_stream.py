@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Concurrency load test for /api/stream range serving, against a running backend.
+
+Patterns (per simulated client):
+    seek        - seek storm: random open-ended ranges, read a little, abort (scrubbing)
+    sequential  - playback: consecutive windows from a random start
+    tabs        - several "tabs" each playing sequentially, occasionally seeking
+    mixed       - a blend of all three
+
+    python misc/loadtest_stream.py --id <local media id> --pattern seek --concurrency 16 --duration 30
+    python misc/loadtest_stream.py --pattern mixed --concurrency 32 --output loadtest_results.json
+
+Reports requests/s, throughput, TTFB + total latency percentiles and server CPU per MB
+(server CPU is read from the process listening on the port, or --server-pid).
+Stdlib only.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlparse
+
+#######################################################################
+#   Target
+#######################################################################
+
+def fetch_json(base_url, path):
+    url = urlparse(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    conn.request("GET", path)
+    response = conn.getresponse()
+    data = json.loads(response.read())
+    conn.close()
+    return data
+
+def pick_local_media(base_url):
+    """Largest local item in the library"""
+    previews = fetch_json(base_url, "/api/fetch_media_previews")
+    items = [
+        item for status in ("success", "queued", "failed", "processing")
+        for item in previews.get(status, [])
+        if item.get("source") == "local" and item.get("uri")
+    ]
+    if not items:
+        return None
+    return max(items, key=lambda item: item.get("duration") or 0)["id"]
+
+def probe_size(base_url, media_id):
+    """File size from a 1-byte range request's Content-Range"""
+    url = urlparse(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    conn.request("GET", f"/api/stream/{media_id}", headers={"Range": "bytes=0-0"})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    content_range = response.getheader("Content-Range") or ""
+    match = re.search(r"/(\d+)$", content_range)
+    if response.status != 206 or not match:
+        raise RuntimeError(f"Range probe failed: HTTP {response.status} {content_range!r}")
+    return int(match.group(1))
+
+#######################################################################
+#   Server CPU
+#######################################################################
+
+def find_server_pid(port):
+    try:
+        output = subprocess.run(
+            ["lsof", "-t", f"-iTCP:{port}", "-sTCP:LISTEN"],
+            capture_output=True, text=True, timeout=5
+        ).stdout.split()
+        return int(output[0]) if output else None
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+def read_process_cpu(pid):
+    """User + system CPU seconds of pid (Linux /proc, else ps)"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        return (int(fields[11]) + int(fields[12])) / ticks
+    except (OSError, IndexError, ValueError):
+        pass
+
+    try:
+        output = subprocess.run(["ps", "-o", "time=", "-p", str(pid)], capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if not output:
+        return None
+
+    # [[dd-]hh:]mm:ss[.ss]
+    days = 0
+    if "-" in output:
+        day_part, output = output.split("-", 1)
+        days = int(day_part)
+    seconds = 0.0
+    for part in output.split(":"):
+        seconds = seconds * 60 + float(part)
+    return days * 86400 + seconds
+
+#######################################################################
+#   Clients
+#######################################################################
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ttfb = []
+        self.latency = []
+        self.bytes = 0
+        self.requests = 0
+        self.errors = {}
+
+    def add(self, ttfb, latency, byte_count):
+        with self.lock:
+            self.requests += 1
+            self.bytes += byte_count
+            if ttfb is not None:
+                self.ttfb.append(ttfb)
+            self.latency.append(latency)
+
+    def add_error(self, kind):
+        with self.lock:
+            self.requests += 1
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+def ranged_get(host, port, media_id, range_header, max_bytes, stats, read_size=65536):
+    """One request; reads up to max_bytes of the body then closes (like a browser abandoning a seek)"""
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    try:
+        conn.request("GET", f"/api/stream/{media_id}", headers={"Range": range_header})
+        response = conn.getresponse()
+        if response.status not in (200, 206):
+            response.read()
+            stats.add_error(f"http_{response.status}")
+            return 0
+
+        received = 0
+        ttfb = None
+        while received < max_bytes:
+            chunk = response.read(min(read_size, max_bytes - received))
+            if not chunk:
+                break
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            received += len(chunk)
+
+        stats.add(ttfb, time.perf_counter() - start, received)
+        return received
+    except (OSError, http.client.HTTPException) as e:
+        stats.add_error(type(e).__name__)
+        return 0
+    finally:
+        conn.close()
+
+def seek_client(target, stats, stop_event, rng, args):
+    host, port, media_id, file_size = target
+    while not stop_event.is_set():
+        position = rng.randrange(file_size)
+        # Open-ended, like <video> after a seek; the client gives up after a few hundred KB
+        ranged_get(host, port, media_id, f"bytes={position}-", rng.randint(64 * 1024, args.seek_read), stats)
+
+def sequential_client(target, stats, stop_event, rng, args, seek_probability=0.0):
+    host, port, media_id, file_size = target
+    position = rng.randrange(file_size)
+    window = args.window
+    while not stop_event.is_set():
+        if position >= file_size or rng.random() < seek_probability:
+            position = rng.randrange(file_size)
+        end = min(position + window, file_size) - 1
+        window_start = time.perf_counter()
+        received = ranged_get(host, port, media_id, f"bytes={position}-{end}", end - position + 1, stats)
+        position += max(received, 1)
+
+        # Pace to the playback bitrate, if one is set
+        if args.bitrate and received:
+            wait = received * 8 / args.bitrate - (time.perf_counter() - window_start)
+            if wait > 0:
+                stop_event.wait(wait)
+
+def tabs_client(target, stats, stop_event, rng, args):
+    sequential_client(target, stats, stop_event, rng, args, seek_probability=0.1)
+
+def mixed_client(target, stats, stop_event, rng, args):
+    client = rng.choice([seek_client, sequential_client, tabs_client])
+    client(target, stats, stop_event, rng, args)
+
+PATTERNS = {
+    'seek': seek_client,
+    'sequential': sequential_client,
+    'tabs': tabs_client,
+    'mixed': mixed_client,
+}
+
+#######################################################################
+#   Report
+#######################################################################
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    def at(q):
+        return values[min(len(values) - 1, int(q * len(values)))] * 1000
+    return {'p50_ms': at(0.5), 'p90_ms': at(0.9), 'p95_ms': at(0.95), 'p99_ms': at(0.99), 'max_ms': values[-1] * 1000}
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/stream range serving")
+    parser.add_argument('--base-url', default='http://127.0.0.1:1776')
+    parser.add_argument('--id', default=None, help='local media id to stream (default: largest local item)')
+    parser.add_argument('--pattern', choices=sorted(PATTERNS), default='mixed')
+    parser.add_argument('--concurrency', type=int, default=8, help='simulated clients (default: 8)')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run (default: 20)')
+    parser.add_argument('--window', type=int, default=1024 * 1024, help='sequential read window bytes (default: 1MB)')
+    parser.add_argument('--seek-read', type=int, default=512 * 1024, help='max bytes read per seek before aborting (default: 512KB)')
+    parser.add_argument('--bitrate', type=float, default=0, help='pace sequential clients to this many bits/s (default: unpaced)')
+    parser.add_argument('--server-pid', type=int, default=None, help='backend pid for CPU accounting (default: process listening on the port)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='write results JSON here')
+    args = parser.parse_args()
+
+    url = urlparse(args.base_url)
+    host, port = url.hostname, url.port or 80
+
+    media_id = args.id or pick_local_media(args.base_url)
+    if not media_id:
+        print("No local media item found; pass --id")
+        sys.exit(1)
+
+    file_size = probe_size(args.base_url, media_id)
+    server_pid = args.server_pid or find_server_pid(port)
+    print(f"Streaming {media_id} ({file_size / 1e6:.1f} MB), pattern={args.pattern}, concurrency={args.concurrency}, {args.duration:.0f}s")
+    if not server_pid:
+        print("Server pid not found (pass --server-pid); CPU per MB won't be reported")
+
+    stats = Stats()
+    stop_event = threading.Event()
+    target = (host, port, media_id, file_size)
+    client_fn = PATTERNS[args.pattern]
+
+    threads = [
+        threading.Thread(target=client_fn, args=(target, stats, stop_event, random.Random(args.seed + i), args), daemon=True)
+        for i in range(args.concurrency)
+    ]
+
+    server_cpu_start = read_process_cpu(server_pid) if server_pid else None
+    client_cpu_start = time.process_time()
+    start = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+    try:
+        stop_event.wait(args.duration)
+    except KeyboardInterrupt:
+        pass
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    elapsed = time.perf_counter() - start
+    server_cpu_end = read_process_cpu(server_pid) if server_pid else None
+    server_cpu = server_cpu_end - server_cpu_start if server_cpu_start is not None and server_cpu_end is not None else None
+    megabytes = stats.bytes / 1e6
+
+    results = {
+        'timestamp': time.time(),
+        'platform': platform.platform(),
+        'params': {
+            'media_id': media_id,
+            'file_size': file_size,
+            'pattern': args.pattern,
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'window': args.window,
+            'seek_read': args.seek_read,
+            'bitrate': args.bitrate
+        },
+        'elapsed_s': elapsed,
+        'requests': stats.requests,
+        'requests_per_s': stats.requests / elapsed,
+        'errors': stats.errors,
+        'bytes': stats.bytes,
+        'throughput_mb_s': megabytes / elapsed,
+        'ttfb': percentiles(stats.ttfb),
+        'latency': percentiles(stats.latency),
+        'server_cpu_s': server_cpu,
+        'server_cpu_ms_per_mb': server_cpu * 1000 / megabytes if server_cpu is not None and megabytes else None,
+        'client_cpu_s': time.process_time() - client_cpu_start
+    }
+
+    print(f"\n{stats.requests} requests ({results['requests_per_s']:.1f}/s), {sum(stats.errors.values())} errors {stats.errors or ''}")
+    print(f"{megabytes:.1f} MB served, {results['throughput_mb_s']:.1f} MB/s")
+    if results['ttfb']:
+        ttfb = results['ttfb']
+        print(f"TTFB     p50 {ttfb['p50_ms']:7.1f} ms  p95 {ttfb['p95_ms']:7.1f} ms  p99 {ttfb['p99_ms']:7.1f} ms  max {ttfb['max_ms']:7.1f} ms")
+    if results['latency']:
+        latency = results['latency']
+        print(f"Request  p50 {latency['p50_ms']:7.1f} ms  p95 {latency['p95_ms']:7.1f} ms  p99 {latency['p99_ms']:7.1f} ms  max {latency['max_ms']:7.1f} ms")
+    if results['server_cpu_ms_per_mb'] is not None:
+        print(f"Server CPU {server_cpu:.2f}s ({results['server_cpu_ms_per_mb']:.2f} ms per MB)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Checks for render.py's edit decision lists and ffmpeg arguments (no ffmpeg needed).
+
+    python misc/test_render.py
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render
+
+# Linux's MAX_ARG_STRLEN: no single argument can be longer
+MAX_ARGUMENT_BYTES = 128 * 1024
+
+def alternating_segments(count, length=1.0, gap=0.2):
+    """Back to back segments of speakers A and B, `gap` apart"""
+    segments = []
+    t = 0.0
+    for i in range(count):
+        segments.append({"start": t, "end": t + length, "speaker": "AB"[i % 2]})
+        t += length + gap
+    return segments
+
+def overlap(clip, segment):
+    return min(clip[1], segment["end"]) - max(clip[0], segment["start"])
+
+#######################################################################
+#   build_edl
+#######################################################################
+
+class BuildEdlTest(unittest.TestCase):
+
+    def test_alternating_speeds(self):
+        segments = alternating_segments(400)
+        duration = segments[-1]["end"]
+        speeds = {"A": 1.0, "B": 1.5}
+
+        clips = render.build_edl(segments, duration, speaker_speeds=speeds, skip_silences=True)
+        self.assertEqual(len(clips), 400)
+        self.assertEqual([speed for _, _, speed in clips[:4]], [1.0, 1.5, 1.0, 1.5])
+
+        # Silences kept: each at the speed of the segment before it, so joined to it
+        clips = render.build_edl(segments, duration, speaker_speeds=speeds)
+        self.assertEqual(len(clips), 400)
+        self.assertAlmostEqual(sum(end - start for start, end, _ in clips), duration)
+
+    def test_hidden_speaker_and_silences_are_dropped(self):
+        segments = alternating_segments(700)
+        duration = segments[-1]["end"] + 2.0
+        visibility = {"A": True, "B": False}
+
+        clips = render.build_edl(segments, duration, visibility, skip_silences=True, skip_hidden=True)
+        self.assertEqual(len(clips), 350)
+        for clip in clips:
+            for segment in segments:
+                if segment["speaker"] == "B":
+                    self.assertLessEqual(overlap(clip, segment), 0.0)
+        self.assertAlmostEqual(render.get_render_duration(clips), 350.0)
+
+    def test_hidden_speaker_plays_without_auto_skip(self):
+        segments = alternating_segments(10, gap=1.0)
+        visibility = {"A": True, "B": False}
+
+        clips = render.build_edl(segments, segments[-1]["end"], visibility, skip_silences=True, skip_hidden=False)
+        self.assertEqual(len(clips), 10)
+
+    def test_short_gaps_at_the_same_speed_are_joined(self):
+        segments = alternating_segments(10, gap=0.1)
+        clips = render.build_edl(segments, segments[-1]["end"], skip_silences=True)
+        self.assertEqual(clips, [(0.0, segments[-1]["end"], 1.0)])
+
+#######################################################################
+#   ffmpeg arguments
+#######################################################################
+
+class FfmpegArgsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_many_clips_fit_in_arguments(self):
+        segments = alternating_segments(5000)
+        clips = render.build_edl(segments, segments[-1]["end"], speaker_speeds={"A": 1.0, "B": 1.5}, skip_silences=True)
+        self.assertEqual(len(clips), 5000)
+
+        script_path = os.path.join(self.temp_dir, "graph.filter")
+        args = render.build_args("in.mkv", clips, True, script_path)
+        self.assertEqual(args[args.index("-filter_complex_script") + 1], script_path)
+        self.assertLess(max(len(arg.encode()) for arg in args), MAX_ARGUMENT_BYTES)
+
+        with open(script_path) as f:
+            script = f.read()
+        self.assertGreater(len(script.encode()), MAX_ARGUMENT_BYTES)
+        self.assertIn("[v4999][a4999]concat=n=5000:v=1:a=1[v][a]", script)
+
+    def test_filter_graph(self):
+        graph = render.build_filter_graph([(10.0, 12.5, 1.0), (13.0, 15.0, 3.0)], has_video=False, offset=10.0)
+        self.assertEqual(graph, ";\n".join([
+            "[0:a]atrim=start=0.0:end=2.5,asetpts=PTS-STARTPTS[a0]",
+            "[0:a]atrim=start=3.0:end=5.0,asetpts=PTS-STARTPTS,atempo=2.0,atempo=1.5[a1]",
+            "[a0][a1]concat=n=2:v=0:a=1[a]"
+        ]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import time
+import threading
+import db
+import shared_dict
+import request_stats
+
+#######################################################################
+#   Prometheus text exposition (/metrics)
+#######################################################################
+
+# Request latencies come from request_stats. The counters here are updated in place under
+# aggregate_lock, held only for a dict update (nothing may queue up between scrapes:
+# most installs are never scraped at all).
+aggregate_lock = threading.Lock()
+
+bytes_served = {}       # kind -> bytes
+sqlite_busy = {}        # source -> count
+
+# Written by single threads, read by the scraper (plain dict assignment is atomic)
+active_stages = {}      # job_type -> stage name
+dealer_last_seen = {}   # dealer name -> time.time() of last message
+workers = {}            # dealer name -> threading.Thread
+
+#######################################################################
+#   Recording (hot path)
+#######################################################################
+
+def observe_bytes(kind, byte_count):
+    with aggregate_lock:
+        bytes_served[kind] = bytes_served.get(kind, 0) + byte_count
+
+def observe_sqlite_busy(source):
+    with aggregate_lock:
+        sqlite_busy[source] = sqlite_busy.get(source, 0) + 1
+
+def set_active_stage(job_type, stage):
+    active_stages[job_type] = stage
+
+def observe_dealer_message(name):
+    dealer_last_seen[name] = time.time()
+
+def register_worker(name, thread):
+    workers[name] = thread
+
+def is_sqlite_busy_error(e):
+    message = str(e).lower()
+    return 'locked' in message or 'busy' in message
+
+#######################################################################
+#   Exposition
+#######################################################################
+
+def render():
+    """Current metrics in Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+
+    def metric(name, metric_type, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{format_labels(labels)} {format_value(value)}")
+
+    # Queue depth
+    try:
+        status_counts, metadata_status_counts = db.fetch_queue_depths()
+    except Exception as e:
+        if is_sqlite_busy_error(e):
+            observe_sqlite_busy('metrics')
+        status_counts, metadata_status_counts = {}, {}
+
+    metric('zanshin_queue_depth', 'gauge', 'Media items by processing status',
+        [('', {'status': status}, count) for status, count in sorted(status_counts.items(), key=str)])
+    metric('zanshin_metadata_queue_depth', 'gauge', 'Media items by metadata status',
+        [('', {'status': status}, count) for status, count in sorted(metadata_status_counts.items(), key=str)])
+
+    # Active jobs
+    metric('zanshin_active_job_stage', 'gauge', 'Stage the running job of each loop is in (1 per running job)',
+        [('', {'job_type': job_type, 'stage': stage}, 1) for job_type, stage in sorted(active_stages.items()) if stage])
+    metric('zanshin_processor_ready', 'gauge', 'Whether the diarizer is loaded and warmed up',
+        [('', {}, 1 if shared_dict.read('processor_status') == 'warmed up' else 0)])
+
+    # Worker liveness
+    now = time.time()
+    metric('zanshin_worker_up', 'gauge', 'Whether each ZMQ dealer loop thread is alive',
+        [('', {'worker': name}, 1 if thread.is_alive() else 0) for name, thread in sorted(workers.items())])
+    metric('zanshin_worker_last_message_age_seconds', 'gauge', 'Seconds since each ZMQ dealer last sent a message',
+        [('', {'worker': name}, now - seen) for name, seen in sorted(dealer_last_seen.items())])
+
+    # HTTP requests
+    route_stats = sorted(request_stats.get_routes().items())
+
+    lines.append("# HELP zanshin_http_request_duration_seconds Flask request handling time by route")
+    lines.append("# TYPE zanshin_http_request_duration_seconds histogram")
+    for (route, method), stats in route_stats:
+        labels = {'route': route, 'method': method}
+        for bound, count in zip(request_stats.LATENCY_BUCKETS, stats.buckets):
+            lines.append(f"zanshin_http_request_duration_seconds_bucket{format_labels({**labels, 'le': format_value(bound)})} {count}")
+        lines.append(f"zanshin_http_request_duration_seconds_bucket{format_labels({**labels, 'le': '+Inf'})} {stats.count}")
+        lines.append(f"zanshin_http_request_duration_seconds_sum{format_labels(labels)} {format_value(stats.total_seconds)}")
+        lines.append(f"zanshin_http_request_duration_seconds_count{format_labels(labels)} {stats.count}")
+
+    metric('zanshin_http_requests_total', 'counter', 'Flask requests by route, method and status code',
+        [('', {'route': route, 'method': method, 'status': status}, count)
+         for (route, method), stats in route_stats for status, count in sorted(stats.statuses.items())])
+
+    metric('zanshin_http_response_bytes_total', 'counter', 'Response bytes by route (where the length is known up front)',
+        [('', {'route': route, 'method': method}, stats.bytes) for (route, method), stats in route_stats])
+
+    with aggregate_lock:
+        # Bytes served
+        metric('zanshin_served_bytes_total', 'counter', 'Image bytes served (thumbnails, storyboard frames)',
+            [('', {'kind': kind}, count) for kind, count in sorted(bytes_served.items())])
+
+        # SQLite contention
+        metric('zanshin_sqlite_busy_total', 'counter', 'SQLite "database is locked"/busy errors by source',
+            [('', {'source': source}, count) for source, count in sorted(sqlite_busy.items())])
+
+    return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label_value(value)}"' for key, value in labels.items()) + "}"
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_value(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return "+Inf"
+        return repr(value)
+    return str(value)
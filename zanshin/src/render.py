@@ -0,0 +1,263 @@
+import os
+import json
+import tempfile
+import threading
+import ffmpeg
+import db
+import config
+import media_cache
+import transcode
+from flask import Response
+from misc import get_data_hash
+
+#######################################################################
+#   Speaker-filtered renders (/api/render/<id>)
+#######################################################################
+
+# The player hides speakers, skips silences and applies per-speaker speeds by seeking
+# around /api/stream and changing its playback rate, which costs a burst of range
+# requests at every cut. A render does the same edit server side: the item's
+# merged_segments and saved speaker settings become an edit decision list (EDL) of
+# (start, end, speed) clips of the source, and ffmpeg trims, speeds up (atempo/setpts)
+# and concatenates them into one continuous fragmented MP4 that is piped to the client
+# like a live transcode (seek by restarting at ?t=, in render time). The player plays
+# a local item from its render when there's something to edit, mapping between render
+# and source time with the EDL (/api/render/<id>/edl).
+#
+# Every clip is a trim + speed filter chain, so an item with thousands of segments
+# makes a filter graph far longer than the OS lets one argument be: ffmpeg reads it
+# from a file (-filter_complex_script) instead, and there's no limit on clips.
+#
+# A render that's streamed from the start to the end is also written to the render
+# cache (STREAM_CACHE_DIR/render/), remuxed to a regular faststart MP4; from then on
+# it's served like any other file, with ranges. The cache name hashes the EDL and the
+# source's size/mtime, so changing the speaker settings or the file never matches an
+# old render. Renders are evicted least recently used first.
+
+RENDER_KIND = "render"
+RENDER_CACHE_MAX_BYTES = 10 * 1024 ** 3
+
+MIN_SPEED = 0.25
+MAX_SPEED = 4.0
+# seconds; clips closer than this (at the same speed) are joined, like the player, which
+# doesn't skip anything this short
+MIN_GAP = 0.5
+
+VARIANTS = ("video", "audio")
+
+TEE_SUFFIX = ".frag.part"       # the streamed (fragmented) render, before its faststart remux
+
+renders_lock = threading.Lock()
+render_builds = set()           # cache paths being written (teed from a stream or remuxed)
+
+#######################################################################
+#   Edit decision list
+#######################################################################
+
+def build_edl(merged_segments, duration, speaker_visibility=None, speaker_speeds=None, skip_silences=False,
+              skip_hidden=False, min_gap=MIN_GAP):
+    """
+    [(start, end, speed)] clips of the source, in order, that make up its speaker-filtered
+    playback: segments at their speaker's speed (those of hidden speakers only if not
+    skip_hidden, i.e. auto_skip_disabled_speakers), and unless skip_silences, the silences
+    between segments at the speed of the last speaker played (like the player, which only
+    changes its rate when entering a segment).
+    """
+    speaker_visibility = speaker_visibility or {}
+    speaker_speeds = speaker_speeds or {}
+
+    clips = []
+
+    def add_clip(start, end, speed):
+        if end - start <= 0.001:
+            return
+        if clips and clips[-1][2] == speed and start - clips[-1][1] < min_gap:
+            clips[-1] = (clips[-1][0], max(clips[-1][1], end), speed)
+        else:
+            clips.append((start, end, speed))
+
+    position = 0.0
+    speed = 1.0
+    for segment in sorted(merged_segments or [], key=lambda segment: segment["start"]):
+        # Segments can overlap where diarization chunks met
+        start = max(float(segment["start"]), position)
+        end = float(segment["end"])
+        if end <= start:
+            continue
+        if not skip_silences:
+            add_clip(position, start, speed)
+        if not skip_hidden or speaker_visibility.get(segment["speaker"], True):
+            speed = min(max(float(speaker_speeds.get(segment["speaker"]) or 1.0), MIN_SPEED), MAX_SPEED)
+            add_clip(start, end, speed)
+        position = end
+
+    if not skip_silences and duration:
+        add_clip(position, float(duration), speed)
+    return clips
+
+def get_render_duration(clips):
+    return sum((end - start) / speed for start, end, speed in clips)
+
+def clips_from(clips, t):
+    """The clips that play from render time t on (the first one trimmed to start there)"""
+    if t <= 0:
+        return list(clips)
+    elapsed = 0.0
+    for index, (start, end, speed) in enumerate(clips):
+        clip_duration = (end - start) / speed
+        if elapsed + clip_duration > t:
+            return [(start + (t - elapsed) * speed, end, speed)] + list(clips[index + 1:])
+        elapsed += clip_duration
+    return []
+
+def get_edl(id):
+    """{"clips", "duration" (render time), "source_duration"} for an item, or None if it has no segments"""
+    inputs = db.fetch_render_inputs(id)
+    if inputs is None or not inputs["merged_segments"]:
+        return None
+    clips = build_edl(
+        inputs["merged_segments"],
+        inputs["duration"],
+        inputs["speaker_visibility"],
+        inputs["speaker_speeds"],
+        inputs["skip_silences"],
+        inputs["auto_skip_disabled_speakers"]
+    )
+    return {"clips": clips, "duration": get_render_duration(clips), "source_duration": inputs["duration"]}
+
+#######################################################################
+#   Rendering
+#######################################################################
+
+def get_atempo_factors(speed):
+    """atempo only takes factors from 0.5 to 2 (in older ffmpeg builds): chain them for anything else"""
+    factors = []
+    while speed > 2.0:
+        factors.append(2.0)
+        speed /= 2.0
+    while speed < 0.5:
+        factors.append(0.5)
+        speed /= 0.5
+    factors.append(speed)
+    return factors
+
+def build_filter_graph(clips, has_video, offset):
+    """
+    ffmpeg filter graph cutting the clips out of input 0 (seeked to offset), each at its
+    speed, and concatenating them into [v] (with has_video) and [a]
+    """
+    chains = []
+    parts = ""
+    for i, (start, end, speed) in enumerate(clips):
+        start, end = round(start - offset, 3), round(end - offset, 3)
+        if has_video:
+            chains.append(f"[0:v]trim=start={start}:end={end},setpts=(PTS-STARTPTS)/{speed}[v{i}]")
+            parts += f"[v{i}]"
+        audio_filters = [f"atrim=start={start}:end={end}", "asetpts=PTS-STARTPTS"]
+        audio_filters += [f"atempo={factor}" for factor in get_atempo_factors(speed) if factor != 1.0]
+        chains.append(f"[0:a]{','.join(audio_filters)}[a{i}]")
+        parts += f"[a{i}]"
+
+    outputs = "[v][a]" if has_video else "[a]"
+    chains.append(f"{parts}concat=n={len(clips)}:v={1 if has_video else 0}:a=1{outputs}")
+    return ";\n".join(chains)
+
+def build_args(file_path, clips, has_video, script_path):
+    """
+    ffmpeg arguments rendering the clips of file_path, concatenated, as fragmented MP4 to
+    stdout. The filter graph is written to script_path (removed by the caller once ffmpeg
+    is done). Put together here rather than with ffmpeg-python, whose compile() takes
+    seconds on the graph of a few thousand clips.
+    """
+    # Seek the input to the first clip, rather than decode everything before it
+    offset = clips[0][0]
+    with open(script_path, "w") as f:
+        f.write(build_filter_graph(clips, has_video, offset))
+
+    args = ["ffmpeg"]
+    if offset > 0:
+        args += ["-ss", str(offset)]
+    args += ["-i", file_path, "-filter_complex_script", script_path]
+    if has_video:
+        args += ["-map", "[v]"]
+    args += ["-map", "[a]", "-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof", "-c:a", "aac", "-b:a", "128k"]
+    if has_video:
+        args += ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p"]
+    args.append("pipe:")
+    return args
+
+def get_render_path(id, variant, clips, size, mtime):
+    key = json.dumps({"clips": clips, "size": size, "mtime": mtime})
+    return os.path.join(media_cache.get_cache_dir(RENDER_KIND), f"{id}_{variant}_{get_data_hash(key.encode())}.mp4")
+
+def get_cached_render(render_path):
+    if os.path.exists(render_path):
+        media_cache.touch(render_path)
+        return render_path
+    return None
+
+def stream_response(id, file_path, has_video, clips, render_path, start):
+    """
+    Response piping the render from render time `start` (see transcode.pipe_response).
+    Streamed from the start, it's also teed into the cache (one stream per render at a time).
+    """
+    clips = clips_from(clips, start)
+    if not clips:
+        return Response("Past the end of the render", status=416)
+    fd, script_path = tempfile.mkstemp(suffix=".filter", dir=config.PROCESSING_TEMP_DIR)
+    os.close(fd)
+    args = build_args(file_path, clips, has_video, script_path)
+    content_type = "video/mp4" if has_video else "audio/mp4"
+
+    tee_path = None
+    if start <= 0:
+        with renders_lock:
+            if render_path not in render_builds:
+                render_builds.add(render_path)
+                tee_path = render_path + TEE_SUFFIX
+
+    def on_tee_done(complete):
+        if complete:
+            threading.Thread(target=finish_render, args=(id, tee_path, render_path), name="render_finish", daemon=True).start()
+        else:
+            with renders_lock:
+                render_builds.discard(render_path)
+
+    try:
+        resp = transcode.pipe_response(
+            args, content_type, start, tee_path=tee_path, on_tee_done=on_tee_done, temp_paths=(script_path,)
+        )
+    except Exception:
+        if tee_path is not None:
+            on_tee_done(False)
+        raise
+    if tee_path is not None and resp.status_code != 200:
+        on_tee_done(False)
+    return resp
+
+def finish_render(id, tee_path, render_path):
+    """Remux a complete streamed render into its (faststart, so seekable) cache file"""
+    part_path = media_cache.get_part_path(render_path)
+    try:
+        with transcode.build_slots:
+            (
+                ffmpeg.input(tee_path)
+                .output(part_path, format="mp4", c="copy", movflags="+faststart")
+                .run(quiet=True, overwrite_output=True)
+            )
+            os.replace(part_path, render_path)
+        print(f"Cached render of {id}")
+        media_cache.trim_cache(RENDER_KIND, RENDER_CACHE_MAX_BYTES, keep={render_path})
+    except ffmpeg.Error as e:
+        print(f"Error caching render of {id}: {e.stderr.decode(errors='replace')}")
+        media_cache.remove_file(part_path)
+    except Exception as e:
+        print(f"Error caching render of {id}: {str(e)}")
+        media_cache.remove_file(part_path)
+    finally:
+        media_cache.remove_file(tee_path)
+        with renders_lock:
+            render_builds.discard(render_path)
+
+def remove_renders(id):
+    media_cache.remove_matching(RENDER_KIND, f"{id}_")
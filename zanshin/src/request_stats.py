@@ -0,0 +1,145 @@
+import json
+import time
+import threading
+from collections import deque
+from urllib.parse import parse_qsl, urlencode
+
+#######################################################################
+#   Flask request instrumentation (latency histograms, bytes, slow requests)
+#######################################################################
+
+# Request threads add to the aggregates in place under aggregate_lock, which is held for
+# a few additions per request (readers copy under it): memory stays bounded by the number
+# of routes however long nothing reads the stats.
+aggregate_lock = threading.Lock()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Requests slower than this are kept (path + redacted query) for /api/debug/requests
+SLOW_REQUEST_THRESHOLD = 0.5
+SLOW_REQUEST_SAMPLES = 100
+
+routes = {}             # (route, method) -> RouteStats
+slow_requests = deque(maxlen=SLOW_REQUEST_SAMPLES)
+
+# JSON line per request on stdout (--request-log)
+log_requests = False
+
+class RouteStats:
+    __slots__ = ('buckets', 'count', 'total_seconds', 'max_seconds', 'bytes', 'statuses')
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)   # cumulative: requests <= each bound
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.statuses = {}
+
+    def add(self, status, duration, response_bytes):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                self.buckets[i] += 1
+        self.count += 1
+        self.total_seconds += duration
+        if duration > self.max_seconds:
+            self.max_seconds = duration
+        if response_bytes:
+            self.bytes += response_bytes
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def quantile(self, q):
+        """Estimate from the histogram (linear within the bucket), like Prometheus' histogram_quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower_bound, lower_count = 0.0, 0
+        for bound, cumulative in zip(LATENCY_BUCKETS, self.buckets):
+            if cumulative >= rank:
+                in_bucket = cumulative - lower_count
+                if not in_bucket:
+                    return bound
+                return lower_bound + (bound - lower_bound) * (rank - lower_count) / in_bucket
+            lower_bound, lower_count = bound, cumulative
+        # Past the last bucket
+        return self.max_seconds
+
+#######################################################################
+#   Recording (hot path)
+#######################################################################
+
+def record(route, method, status, duration, response_bytes, path, query_string):
+    with aggregate_lock:
+        stats = routes.get((route, method))
+        if stats is None:
+            stats = routes[(route, method)] = RouteStats()
+        stats.add(status, duration, response_bytes)
+
+    if duration >= SLOW_REQUEST_THRESHOLD or log_requests:
+        entry = {
+            't': time.time(),
+            'method': method,
+            'route': route,
+            'path': path,
+            'query': redact_query(query_string),
+            'status': status,
+            'duration_ms': round(duration * 1000, 2),
+            'bytes': response_bytes
+        }
+        if duration >= SLOW_REQUEST_THRESHOLD:
+            slow_requests.append(entry)
+        if log_requests:
+            print(json.dumps({'event': 'request', **entry}), flush=True)
+
+def redact_query(query_string):
+    """Keep parameter names, drop values"""
+    if not query_string:
+        return ""
+    if isinstance(query_string, bytes):
+        query_string = query_string.decode('latin-1')
+    return urlencode([(key, 'REDACTED') for key, _ in parse_qsl(query_string, keep_blank_values=True)])
+
+#######################################################################
+#   Reading
+#######################################################################
+
+def get_routes():
+    """{(route, method): RouteStats} copy, for exporters (e.g. /metrics)"""
+    with aggregate_lock:
+        copies = {}
+        for key, stats in routes.items():
+            copy = RouteStats()
+            copy.buckets = list(stats.buckets)
+            copy.count = stats.count
+            copy.total_seconds = stats.total_seconds
+            copy.max_seconds = stats.max_seconds
+            copy.bytes = stats.bytes
+            copy.statuses = dict(stats.statuses)
+            copies[key] = copy
+        return copies
+
+def get_report():
+    route_stats = get_routes()
+    return {
+        'routes': [
+            {
+                'route': route,
+                'method': method,
+                'count': stats.count,
+                'mean_ms': stats.total_seconds / stats.count * 1000,
+                'p50_ms': stats.quantile(0.5) * 1000,
+                'p95_ms': stats.quantile(0.95) * 1000,
+                'p99_ms': stats.quantile(0.99) * 1000,
+                'max_ms': stats.max_seconds * 1000,
+                'bytes': stats.bytes,
+                'statuses': stats.statuses,
+                'histogram': {
+                    'bounds_ms': [bound * 1000 for bound in LATENCY_BUCKETS],
+                    'cumulative_counts': stats.buckets
+                }
+            }
+            for (route, method), stats in sorted(route_stats.items(), key=lambda item: -item[1].total_seconds)
+        ],
+        'slow_request_threshold_ms': SLOW_REQUEST_THRESHOLD * 1000,
+        'slow_requests': list(slow_requests)
+    }
@@ -0,0 +1,256 @@
+import os
+import sys
+import time
+import threading
+
+#######################################################################
+#   Runtime-toggleable sampling profiler (collapsed stacks / speedscope)
+#######################################################################
+
+# Walks sys._current_frames() from a background thread, so nothing is hooked into the
+# profiled code (unlike sys.setprofile) and there's no cost at all while it's stopped.
+#
+# Jobs run in JobWorker child processes, which the backend's sampler can't see: each one
+# runs a sampler of its own, started/stopped/read through JobWorker.control along with
+# the backend's, and its stacks are merged into the result under the worker's role
+# ('diarize_worker', 'io_worker', or 'diarize_worker:<thread>' for its other threads).
+
+DEFAULT_INTERVAL = 0.01     # 100 Hz
+MIN_INTERVAL = 0.001
+MAX_DURATION = 300          # seconds; a forgotten session stops itself
+MAX_STACK_DEPTH = 128
+
+WORKER_TIMEOUT = 5          # seconds to wait for a worker's sampler to answer
+
+session_lock = threading.Lock()
+session = None              # the running or most recent session
+
+process_role = None         # set in JobWorker children: roles are then that worker's
+
+workers_lock = threading.Lock()
+workers = {}                # role -> JobWorker, whose children are sampled along with this process
+
+class ProfilerSession:
+    def __init__(self, duration, interval, roles):
+        self.duration = min(duration, MAX_DURATION)
+        self.interval = max(interval, MIN_INTERVAL)
+        self.roles = set(roles) if roles else None   # None = every thread
+        self.stacks = {}                              # (role, (frame, ...) root first) -> sample count
+        self.worker_stacks = {}                       # same, from worker processes that have since exited
+        self.samples_taken = 0
+        self.started_t = time.time()
+        self.stopped_t = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sampling_profiler", daemon=True)
+
+    def run(self):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + self.duration
+        thread_names = {}
+
+        while not self.stop_event.is_set() and time.monotonic() < deadline:
+            # Refresh names only when unknown threads show up (request threads come and go)
+            frames = sys._current_frames()
+            if any(ident not in thread_names for ident in frames):
+                thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for ident, frame in frames.items():
+                if ident == own_ident:
+                    continue
+                role = get_thread_role(thread_names.get(ident, f"thread-{ident}"))
+                if self.roles is not None and role not in self.roles:
+                    continue
+
+                key = (role, walk_stack(frame))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+            self.samples_taken += 1
+            del frames
+            self.stop_event.wait(self.interval)
+
+        self.stopped_t = time.time()
+
+    def is_running(self):
+        return self.thread.is_alive()
+
+    def status(self):
+        return {
+            'running': self.is_running(),
+            'started_t': self.started_t,
+            'stopped_t': self.stopped_t,
+            'duration': self.duration,
+            'interval': self.interval,
+            'roles': sorted(self.roles) if self.roles else None,
+            'samples_taken': self.samples_taken,
+            'threads_seen': sorted({role for role, _ in list(self.stacks)})
+        }
+
+    def remaining(self):
+        return max(self.started_t + self.duration - time.time(), 0)
+
+def get_thread_role(thread_name):
+    """Group threads: all werkzeug request threads profile as one 'flask' role"""
+    if process_role is not None:
+        return process_role if thread_name == 'MainThread' else f"{process_role}:{thread_name}"
+    if 'process_request_thread' in thread_name:
+        return 'flask'
+    return thread_name
+
+def walk_stack(frame):
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+def format_frame(frame):
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+#######################################################################
+#   Control
+#######################################################################
+
+def start(duration=30, interval=DEFAULT_INTERVAL, roles=None):
+    """Start a session (in the workers too); returns its status, or None if one is already running"""
+    global session
+    with session_lock:
+        if session is not None and session.is_running():
+            return None
+        session = ProfilerSession(duration, interval, roles)
+        session.thread.start()
+        current = session
+
+    # A worker's threads are all '<role>...', so it only samples if one of them is asked for
+    for role, worker in get_workers():
+        if is_worker_profiled(current, role):
+            worker.control('profiler_start', current.duration, current.interval, roles, timeout=WORKER_TIMEOUT)
+    return current.status()
+
+def stop():
+    with session_lock:
+        current = session
+    if current is None:
+        return None
+    current.stop_event.set()
+    current.thread.join(timeout=5)
+
+    for role, worker in get_workers():
+        if is_worker_profiled(current, role):
+            worker.control('profiler_stop', timeout=WORKER_TIMEOUT)
+    return current.status()
+
+def status():
+    with session_lock:
+        current = session
+    if current is None:
+        return None
+    result = current.status()
+    result['workers'] = sorted(role for role, _ in get_workers())
+    return result
+
+#######################################################################
+#   Worker processes
+#######################################################################
+
+def get_workers():
+    with workers_lock:
+        return list(workers.items())
+
+def is_worker_profiled(current, role):
+    return current.roles is None or any(name.split(':')[0] == role for name in current.roles)
+
+def register_worker(role, worker):
+    """Sample a (just started) JobWorker child along with this process from now on"""
+    with workers_lock:
+        workers[role] = worker
+    with session_lock:
+        current = session
+    # Joins a session that's running, for what's left of it
+    if current is not None and current.is_running() and is_worker_profiled(current, role):
+        roles = sorted(current.roles) if current.roles else None
+        worker.control('profiler_start', current.remaining(), current.interval, roles, timeout=WORKER_TIMEOUT)
+
+def unregister_worker(role):
+    """Before a JobWorker child goes away: keeps what it sampled in the current session"""
+    with workers_lock:
+        worker = workers.pop(role, None)
+    with session_lock:
+        current = session
+    if worker is None or current is None or not is_worker_profiled(current, role):
+        return
+    worker_stacks, _ = worker.control('profiler_result', timeout=1) or (None, None)
+    add_stacks(current.worker_stacks, worker_stacks)
+
+def add_stacks(stacks, more):
+    for key, count in (more or {}).items():
+        stacks[key] = stacks.get(key, 0) + count
+
+#######################################################################
+#   Output
+#######################################################################
+
+def get_result():
+    """(stacks, interval) of the running or most recent session, workers included, or (None, None)"""
+    with session_lock:
+        current = session
+    if current is None:
+        return None, None
+    # Copy, since the sampler may still be adding to it
+    stacks = dict(list(current.stacks.items()))
+    add_stacks(stacks, dict(list(current.worker_stacks.items())))
+
+    if process_role is None:
+        for role, worker in get_workers():
+            if is_worker_profiled(current, role):
+                worker_stacks, _ = worker.control('profiler_result', timeout=WORKER_TIMEOUT) or (None, None)
+                add_stacks(stacks, worker_stacks)
+    return stacks, current.interval
+
+def to_collapsed(stacks):
+    """Brendan Gregg collapsed format (flamegraph.pl, speedscope, inferno): role;frame;frame count"""
+    lines = []
+    for (role, stack), count in sorted(stacks.items(), key=lambda item: -item[1]):
+        frames = ";".join(format_frame(frame).replace(";", ":") for frame in stack)
+        lines.append(f"{role};{frames} {count}" if frames else f"{role} {count}")
+    return "\n".join(lines) + "\n"
+
+def to_speedscope(stacks, interval):
+    """speedscope file format: one 'sampled' profile per thread role, weights in seconds"""
+    frame_index = {}
+    frames = []
+    profiles = {}
+
+    for (role, stack), count in stacks.items():
+        indices = []
+        for frame in stack:
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                name, filename, line = frame
+                frames.append({'name': name, 'file': filename, 'line': line})
+            indices.append(frame_index[frame])
+
+        profile = profiles.setdefault(role, {'samples': [], 'weights': []})
+        profile['samples'].append(indices)
+        profile['weights'].append(count * interval)
+
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [
+            {
+                'type': 'sampled',
+                'name': role,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(profile['weights']),
+                'samples': profile['samples'],
+                'weights': profile['weights']
+            }
+            for role, profile in sorted(profiles.items())
+        ],
+        'name': 'Zanshin backend',
+        'exporter': 'zanshin sampling_profiler'
+    }
@@ -0,0 +1,78 @@
+import time
+
+#######################################################################
+#   Processing queue scheduling policies
+#######################################################################
+
+# Seconds of queue wait that cancel out one second of media duration (aging policy)
+AGING_RATE = 0.5
+
+# Duration assumed for items whose metadata hasn't been fetched (or failed) when there's
+# no library to take a typical duration from. Must be finite, or such items never age
+DEFAULT_UNKNOWN_DURATION = 1800.0
+
+def fifo_key(job, now):
+    return job['submitted_t'] or 0
+
+def shortest_first_key(job, now):
+    return (job['duration'], job['submitted_t'] or 0)
+
+def aging_key(job, now):
+    """
+    Shortest-job-first, but every second spent waiting in the queue counts against
+    the item's duration, so long items can't be starved by a stream of short ones
+    """
+    submitted_t = job['submitted_t'] or now
+    return (job['duration'] - AGING_RATE * (now - submitted_t), submitted_t)
+
+POLICIES = {
+    'fifo': fifo_key,
+    'shortest_first': shortest_first_key,
+    'aging': aging_key,
+}
+
+# Policies that need media durations before they can make good decisions
+DURATION_AWARE_POLICIES = {'shortest_first', 'aging'}
+
+def register_policy(name, key_fn, duration_aware=False):
+    """key_fn(job, now) -> sort key; lower keys run first"""
+    POLICIES[name] = key_fn
+    if duration_aware:
+        DURATION_AWARE_POLICIES.add(name)
+
+def get_policy(policy_name):
+    return POLICIES.get(policy_name) or POLICIES['fifo']
+
+def get_median_duration(durations):
+    """Median of the known (positive) durations, or DEFAULT_UNKNOWN_DURATION if there are none"""
+    known = sorted(duration for duration in durations if duration and duration > 0)
+    if not known:
+        return DEFAULT_UNKNOWN_DURATION
+    middle = len(known) // 2
+    return known[middle] if len(known) % 2 else (known[middle - 1] + known[middle]) / 2
+
+def order_queue(jobs, policy_name, unknown_duration=None):
+    """
+    Sort queued jobs into the order they'll be processed.
+    Pinned items always go first, then higher priority, then whatever the policy decides.
+    Policies see unknown_duration (default: the median of the jobs' known durations)
+    for items without a duration.
+    """
+    policy = get_policy(policy_name)
+    now = time.time()
+    if unknown_duration is None:
+        unknown_duration = get_median_duration(job.get('duration') for job in jobs)
+
+    def sort_key(job):
+        if not job.get('duration'):
+            job = {**job, 'duration': unknown_duration}
+        return (
+            0 if job.get('pinned') else 1,
+            -(job.get('priority') or 0),
+            policy(job, now)
+        )
+
+    return sorted(jobs, key=sort_key)
+
+def is_duration_aware(policy_name):
+    return policy_name in DURATION_AWARE_POLICIES
@@ -2,7 +2,8 @@ import threading
 
 shared_dict = {
     "processor_status": "loading",
-    "active_job_status": None
+    "active_job_status": None,
+    "active_job_id": None
 }
 
 dict_lock = threading.Lock()
@@ -0,0 +1,310 @@
+import os
+import atexit
+import threading
+import numpy as np
+import db
+import config
+
+#######################################################################
+#   Library-wide speaker index (cosine similarity on embedding centroids)
+#######################################################################
+
+# Build an IVF coarse quantizer once the library has this many speakers; below that an
+# exact scan over the whole matrix is already sub-millisecond
+IVF_MIN_SPEAKERS = 20_000
+
+# Probe this many coarse lists per query
+IVF_NPROBE = 8
+
+# Changes are written to disk at most this often (the whole npz is rewritten each time)
+SAVE_DELAY = 2.0        # seconds
+
+class SpeakerIndex:
+    """
+    Normalized float32 speaker centroids of every diarized media item, one row per
+    (media_id, speaker_id). Persisted to config.SPEAKER_INDEX_PATH and updated
+    incrementally as jobs finish or items are deleted.
+    """
+
+    def __init__(self, path=config.SPEAKER_INDEX_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.matrix = None          # (n, dim) float32, rows L2-normalized
+        self.labels = []            # [(media_id, speaker_id)] aligned with matrix rows
+        self.covered_ids = set()    # media ids accounted for, incl. ones with no (usable) centroids
+        self.ivf_centroids = None   # (nlist, dim) float32, or None for exact search
+        self.ivf_assignments = None # (n,) int32 coarse list of each row
+        self.ivf_trained_size = 0
+        self.save_timer = None      # pending debounced _save (guarded by lock)
+
+    #######################################################################
+    #   Load / save
+    #######################################################################
+
+    def load(self, db_path=config.DB_PATH):
+        """Load from disk, rebuilding from media.db if the index file is missing, unreadable or out of date"""
+        with self.lock:
+            if os.path.exists(self.path):
+                try:
+                    data = np.load(self.path, allow_pickle=False)
+                    # Items finished or deleted since the last save (crash, kill -9, older npz)
+                    covered_ids = set(data['covered_ids'].tolist()) if 'covered_ids' in data.files else None
+                    if covered_ids == db.fetch_speaker_centroid_media_ids(db_path=db_path):
+                        self.matrix = data['matrix'].astype(np.float32, copy=False)
+                        self.labels = list(zip(data['media_ids'].tolist(), data['speaker_ids'].tolist()))
+                        self.covered_ids = covered_ids
+                        if 'ivf_centroids' in data.files:
+                            self.ivf_centroids = data['ivf_centroids']
+                            self.ivf_assignments = data['ivf_assignments']
+                            self.ivf_trained_size = int(data['ivf_trained_size'])
+                        return
+                    print("Speaker index out of date with media.db, rebuilding")
+                except Exception as e:
+                    print(f"Speaker index unreadable, rebuilding: {e}")
+
+            self._rebuild(db_path)
+            self._save()
+
+    def _rebuild(self, db_path):
+        rows = []
+        labels = []
+        covered_ids = set()
+        for media_id, centroids in db.fetch_all_speaker_centroids(db_path=db_path):
+            covered_ids.add(media_id)
+            for speaker_id, centroid in centroids.items():
+                rows.append(centroid)
+                labels.append((media_id, speaker_id))
+
+        # Centroids from different embedding models can't be stacked or compared: keep the
+        # size of the most recently processed item's (the current model's)
+        if rows:
+            dim = rows[-1].shape[0]
+            kept = [i for i, row in enumerate(rows) if row.shape[0] == dim]
+            if len(kept) < len(rows):
+                print(f"Speaker index: skipping {len(rows) - len(kept)} centroids not of size {dim} (older embedding model)")
+                rows = [rows[i] for i in kept]
+                labels = [labels[i] for i in kept]
+
+        self.matrix = normalize(np.vstack(rows)) if rows else None
+        self.labels = labels
+        self.covered_ids = covered_ids
+        self.ivf_centroids = None
+        self.ivf_assignments = None
+        self._maybe_train_ivf()
+
+    def _schedule_save(self):
+        """Save SAVE_DELAY from now, batching whatever else changes until then; caller holds lock"""
+        if self.save_timer is not None:
+            return
+        self.save_timer = threading.Timer(SAVE_DELAY, self.flush)
+        self.save_timer.daemon = True
+        self.save_timer.start()
+
+    def flush(self, timeout=-1):
+        """Write pending changes now; gives up after timeout seconds if the index is busy"""
+        if not self.lock.acquire(timeout=timeout):
+            print("Speaker index busy, pending changes not saved")
+            return
+        try:
+            if self.save_timer is None:
+                return
+            self.save_timer.cancel()
+            self.save_timer = None
+            self._save()
+        finally:
+            self.lock.release()
+
+    def _save(self):
+        arrays = {
+            'matrix': self.matrix if self.matrix is not None else np.zeros((0, 0), dtype=np.float32),
+            'media_ids': np.array([media_id for media_id, _ in self.labels], dtype=str),
+            'speaker_ids': np.array([speaker_id for _, speaker_id in self.labels], dtype=str),
+            'covered_ids': np.array(sorted(self.covered_ids), dtype=str),
+        }
+        if self.ivf_centroids is not None:
+            arrays['ivf_centroids'] = self.ivf_centroids
+            arrays['ivf_assignments'] = self.ivf_assignments
+            arrays['ivf_trained_size'] = np.array(self.ivf_trained_size)
+
+        # Write to a temp file and swap, so a crash never leaves a half-written index
+        temp_path = f"{self.path}.tmp.npz"
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, self.path)
+
+    #######################################################################
+    #   Incremental updates
+    #######################################################################
+
+    def add_media(self, media_id, speaker_centroids):
+        """Add (or replace) the speakers of one media item; speaker_centroids is {speaker_id: vector}"""
+        with self.lock:
+            self._remove([media_id])
+            self.covered_ids.add(media_id)
+            if not speaker_centroids:
+                self._schedule_save()
+                return
+
+            speaker_ids = list(speaker_centroids.keys())
+            new_rows = normalize(np.vstack([np.asarray(speaker_centroids[s], dtype=np.float32) for s in speaker_ids]))
+
+            if self.matrix is not None and len(self.matrix) and self.matrix.shape[1] != new_rows.shape[1]:
+                # The embedding model changed: the existing rows can't be compared with anything from now on
+                print(f"Speaker index: centroid size changed ({self.matrix.shape[1]} -> {new_rows.shape[1]}), dropping {len(self.matrix)} older centroids")
+                self.matrix = None
+                self.labels = []
+                self.ivf_centroids = None
+                self.ivf_assignments = None
+
+            self.matrix = new_rows if self.matrix is None or not len(self.matrix) else np.vstack([self.matrix, new_rows])
+            self.labels += [(media_id, speaker_id) for speaker_id in speaker_ids]
+
+            if self.ivf_centroids is not None:
+                new_assignments = np.argmax(new_rows @ self.ivf_centroids.T, axis=1).astype(np.int32)
+                self.ivf_assignments = np.concatenate([self.ivf_assignments, new_assignments])
+
+            self._maybe_train_ivf()
+            self._schedule_save()
+
+    def remove_media(self, media_ids):
+        with self.lock:
+            if self._remove(media_ids):
+                self._schedule_save()
+
+    def _remove(self, media_ids):
+        media_ids = set(media_ids)
+        uncovered = bool(self.covered_ids & media_ids)
+        self.covered_ids -= media_ids
+
+        if self.matrix is None or not self.labels:
+            return uncovered
+
+        keep = np.array([media_id not in media_ids for media_id, _ in self.labels], dtype=bool)
+        if keep.all():
+            return uncovered
+
+        self.matrix = self.matrix[keep]
+        self.labels = [label for label, kept in zip(self.labels, keep) if kept]
+        if self.ivf_assignments is not None:
+            self.ivf_assignments = self.ivf_assignments[keep]
+        return True
+
+    #######################################################################
+    #   Query
+    #######################################################################
+
+    def query(self, vector, k=10, exclude_media_id=None, nprobe=IVF_NPROBE):
+        """
+        Top-k most similar speakers to vector by cosine similarity.
+        Returns [{"media_id", "speaker_id", "similarity"}], most similar first.
+        """
+        with self.lock:
+            if self.matrix is None or not len(self.matrix):
+                return []
+
+            query = normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+            if query.shape[0] != self.matrix.shape[1]:
+                return []
+
+            # Coarse quantizer: only score rows in the nprobe closest lists
+            if self.ivf_centroids is not None:
+                closest_lists = np.argsort(self.ivf_centroids @ query)[::-1][:nprobe]
+                candidates = np.flatnonzero(np.isin(self.ivf_assignments, closest_lists))
+            else:
+                candidates = np.arange(len(self.matrix))
+
+            if exclude_media_id is not None:
+                keep = np.array([self.labels[i][0] != exclude_media_id for i in candidates], dtype=bool)
+                candidates = candidates[keep]
+
+            if not len(candidates):
+                return []
+
+            similarities = self.matrix[candidates] @ query
+            k = min(k, len(candidates))
+            top = np.argpartition(-similarities, k - 1)[:k]
+            top = top[np.argsort(-similarities[top])]
+
+            return [
+                {
+                    'media_id': self.labels[candidates[i]][0],
+                    'speaker_id': self.labels[candidates[i]][1],
+                    'similarity': float(similarities[i])
+                }
+                for i in top
+            ]
+
+    def lookup(self, media_id, speaker_id):
+        """Indexed (normalized) centroid of one speaker, or None"""
+        with self.lock:
+            try:
+                return self.matrix[self.labels.index((media_id, speaker_id))].copy()
+            except (ValueError, TypeError):
+                return None
+
+    #######################################################################
+    #   IVF coarse quantizer
+    #######################################################################
+
+    def _maybe_train_ivf(self):
+        n = 0 if self.matrix is None else len(self.matrix)
+
+        if n < IVF_MIN_SPEAKERS:
+            self.ivf_centroids = None
+            self.ivf_assignments = None
+            self.ivf_trained_size = 0
+            return
+
+        # Retrain when the library has doubled since the last training
+        if self.ivf_centroids is None or n >= 2 * self.ivf_trained_size:
+            nlist = int(np.sqrt(n))
+            self.ivf_centroids, self.ivf_assignments = spherical_kmeans(self.matrix, nlist)
+            self.ivf_trained_size = n
+
+#######################################################################
+#   Helpers
+#######################################################################
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+def spherical_kmeans(data, nlist, iterations=10, seed=0):
+    """k-means on the unit sphere (cosine); returns (centroids, assignments)"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(data @ centroids.T, axis=1)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, data)
+
+        # Re-seed empty lists with random points
+        empty = np.flatnonzero(~sums.any(axis=1))
+        if len(empty):
+            sums[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+
+        centroids = normalize(sums)
+
+    assignments = np.argmax(data @ centroids.T, axis=1).astype(np.int32)
+    return centroids, assignments
+
+index = None
+index_lock = threading.Lock()
+
+def get_index():
+    """Process-wide index, loaded on first use"""
+    global index
+    with index_lock:
+        if index is None:
+            index = SpeakerIndex()
+            index.load()
+            # Don't lose the last SAVE_DELAY of changes on a normal exit (SIGTERM goes through flush_index)
+            atexit.register(index.flush)
+        return index
+
+def flush_index(timeout=5.0):
+    """Write pending changes of the process-wide index, if loaded; doesn't take index_lock, so signal handlers can call it"""
+    if index is not None:
+        index.flush(timeout=timeout)
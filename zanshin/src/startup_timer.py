@@ -0,0 +1,40 @@
+import time
+import socket
+
+#######################################################################
+#   Startup phase timing (reported to the launcher with "started app")
+#######################################################################
+
+# Imported first thing in app.py, so `start_t` is as close to interpreter start as we get
+start_t = time.perf_counter()
+last_t = start_t
+phases = {}             # phase name -> seconds, in the order they were marked
+
+def mark(phase):
+    """Close `phase`: the time since the previous mark (or module import) is attributed to it"""
+    global last_t
+    now = time.perf_counter()
+    phases[phase] = phases.get(phase, 0.0) + now - last_t
+    last_t = now
+
+def get_report():
+    """{"phases_ms": {phase: ms}, "total_ms": ms}, total measured up to now"""
+    return {
+        "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in phases.items()},
+        "total_ms": round((time.perf_counter() - start_t) * 1000, 1)
+    }
+
+def format_report(report):
+    phases_text = ", ".join(f"{phase} {ms:.0f}ms" for phase, ms in report["phases_ms"].items())
+    return f"Startup took {report['total_ms']:.0f}ms ({phases_text})"
+
+def wait_for_port(port, host="127.0.0.1", timeout=30.0):
+    """Block until something accepts connections on host:port; False on timeout"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.01)
+    return False
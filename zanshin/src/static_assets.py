@@ -0,0 +1,126 @@
+import os
+import threading
+import mimetypes
+from flask import request, send_file, Response
+import config
+
+#######################################################################
+#   UI asset serving (ui_dist)
+#######################################################################
+
+# ui_dist is indexed once into `manifest` (relative path -> asset), so a request is a
+# dict lookup: no filesystem probing, and unknown SPA routes fall back to index.html
+# without an exception. The build writes .br and .gz next to compressible files
+# (adapter-static precompress); the smallest variant the client accepts is sent.
+# SvelteKit puts content-hashed files under _app/immutable/, which can be cached for
+# good; everything else (index.html, version.json, ...) is revalidated with its ETag.
+
+IMMUTABLE_PREFIX = "_app/immutable/"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+manifest_lock = threading.Lock()
+manifest = {}
+manifest_index_mtime = None     # index.html mtime when the manifest was built
+watch_for_rebuilds = False      # dev mode: re-index when the UI is rebuilt
+
+def load_manifest(watch=False):
+    """Index ui_dist; with watch, re-index whenever index.html changes (i.e. after `bun run build`)"""
+    global manifest, manifest_index_mtime, watch_for_rebuilds
+    assets = build_manifest(config.UI_DIST_DIR)
+    with manifest_lock:
+        manifest = assets
+        manifest_index_mtime = get_index_mtime()
+        watch_for_rebuilds = watch
+    return len(assets)
+
+def build_manifest(root):
+    assets = {}
+    for directory, _, filenames in os.walk(root):
+        names = set(filenames)
+        for filename in filenames:
+            # Variants are attached to the file they compress
+            if any(filename.endswith(suffix) and filename[:-len(suffix)] in names for _, suffix in ENCODINGS):
+                continue
+
+            file_path = os.path.join(directory, filename)
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                continue
+
+            relative_path = os.path.relpath(file_path, root).replace(os.sep, "/")
+            variants = []
+            for encoding, suffix in ENCODINGS:
+                if filename + suffix in names:
+                    try:
+                        variants.append((encoding, file_path + suffix, os.path.getsize(file_path + suffix)))
+                    except OSError:
+                        pass
+
+            assets[relative_path] = {
+                "path": file_path,
+                "size": file_stat.st_size,
+                "etag": f"{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}",
+                "content_type": mimetypes.guess_type(filename)[0] or "application/octet-stream",
+                "immutable": relative_path.startswith(IMMUTABLE_PREFIX),
+                # Only variants that are actually smaller, smallest first
+                "variants": sorted((variant for variant in variants if variant[2] < file_stat.st_size), key=lambda variant: variant[2])
+            }
+    return assets
+
+def get_index_mtime():
+    try:
+        return os.stat(os.path.join(config.UI_DIST_DIR, "index.html")).st_mtime_ns
+    except OSError:
+        return None
+
+def get_manifest():
+    if watch_for_rebuilds and get_index_mtime() != manifest_index_mtime:
+        load_manifest(watch=True)
+    with manifest_lock:
+        return manifest
+
+def find_asset(assets, path):
+    """(asset, is_fallback) for a request path"""
+    path = path.strip("/") or "index.html"
+    for candidate in (path, f"{path}.html", f"{path}/index.html"):
+        asset = assets.get(candidate)
+        if asset is not None:
+            return asset, False
+
+    # Missing files (anything with an extension) are a 404, not the app shell
+    if "." in path.rsplit("/", 1)[-1]:
+        return None, False
+
+    # SPA routing: the client-side router handles the path
+    return assets.get("index.html"), True
+
+def accepts_encoding(encoding):
+    return request.accept_encodings[encoding] > 0
+
+def serve_asset(path):
+    asset, _ = find_asset(get_manifest(), path)
+    if asset is None:
+        return Response("Not found", status=404)
+
+    file_path = asset["path"]
+    etag = asset["etag"]
+    content_encoding = None
+    for encoding, variant_path, _ in asset["variants"]:
+        if accepts_encoding(encoding):
+            file_path, content_encoding = variant_path, encoding
+            # Each representation needs its own validator
+            etag = f"{etag}-{encoding}"
+            break
+
+    response = send_file(file_path, mimetype=asset["content_type"], etag=etag, conditional=True)
+    if content_encoding:
+        response.headers["Content-Encoding"] = content_encoding
+    if asset["variants"]:
+        response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if asset["immutable"] else REVALIDATE_CACHE_CONTROL
+    return response
@@ -1,215 +1,719 @@
 import os
+import re
+import time
+import socket
+import secrets
+import selectors
+import threading
 import mimetypes
 import sqlite3
-from flask import request, send_file, Response
+from flask import request, Response
+from werkzeug.http import parse_date
+from werkzeug.wsgi import ClosingIterator
 from misc import resolve_bookmark
 import config
+import db
+import hls
+import render
+import transcode
+import audio_proxy
+
+#######################################################################
+#   Local media streaming (/api/stream/<id>)
+#######################################################################
+
+# Bodies are sent with os.sendfile (Linux/macOS) straight from the file to the client
+# socket, so no data passes through Python. That needs the raw connection, which
+# werkzeug's server exposes as environ['werkzeug.socket']; under any other server the
+# chunked generator is used instead.
+
+# Per-sendfile() call cap, so one huge range doesn't hog the socket for too long per syscall
+SENDFILE_BLOCKSIZE = 8 * 1024 * 1024
+
+def get_client_socket():
+    """The client connection if the body can be written to it directly, else None"""
+    if not hasattr(os, "sendfile"):
+        return None
+    sock = request.environ.get("werkzeug.socket")
+    if not isinstance(sock, socket.socket):
+        return None
+    # Non-blocking sockets would need the server's own event loop to wait on
+    if sock.gettimeout() == 0:
+        return None
+    return sock
+
+def get_chunk_size(file_size):
+    """Read size for the generator fallback, based on file size"""
+    if file_size > 1_073_741_824:  # > 1GB
+        return 262_144  # 256KB for very large files
+    elif file_size > 104_857_600:  # > 100MB
+        return 131_072  # 128KB for large files
+    elif file_size > 10_485_760:  # > 10MB
+        return 65_536  # 64KB for medium files
+    else:
+        return 8192  # 8KB for small files
+
+def resolve_moved_file(id):
+    """Resolve the item's bookmark again (the file may have been moved); raises FileNotFoundError"""
+    conn = sqlite3.connect(config.DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT uri FROM media WHERE id = ? AND source = "local"', (id,)
+    )
+    bookmark_result = cursor.fetchone()
+    conn.close()
+
+    if not bookmark_result:
+        raise FileNotFoundError("Media record no longer exists")
+
+    new_file_path = resolve_bookmark(bookmark_result[0])
+    if not new_file_path:
+        raise FileNotFoundError("File could not be located")
+
+    return new_file_path
+
+#######################################################################
+#   Stream handle cache
+#######################################################################
+
+# Seeking sends a burst of range requests for the same item. Everything that doesn't
+# depend on the range (DB lookup, bookmark resolution, stat, content type, the open fd)
+# is cached per media id, so a request is a dict lookup plus, at most once per
+# STAT_RECHECK_INTERVAL, a stat() to notice the file changing, moving or disappearing.
+# The fd is shared by concurrent streams: it's only read with positional I/O
+# (os.sendfile with an offset, os.pread), never seek + read.
+# Files generated from an item (a cached remux or render) get handles too, under their own key.
+
+STAT_RECHECK_INTERVAL = 1.0     # seconds
+HANDLE_IDLE_TTL = 60.0          # seconds unused before a handle is closed
+MAX_STREAM_HANDLES = 32
+
+handles_lock = threading.Lock()
+stream_handles = {}             # key (media id, or e.g. "<id>:remux") -> StreamHandle
+
+def get_content_type(file_path, media_type):
+    # Try to get a more specific content type from the file extension
+    specific_type = mimetypes.guess_type(file_path)[0]
+    if specific_type:
+        return specific_type
+    return "video/mp4" if media_type == "video" else "audio/mpeg"
+
+class StreamHandle:
+    def __init__(self, key, file_path, content_type, media_id):
+        self.key = key
+        self.media_id = media_id
+        # Only the item's own file can be found again through its bookmark
+        self.is_source = key == media_id
+        self.file_path = file_path
+        self.fd = os.open(file_path, os.O_RDONLY)
+        file_stat = os.fstat(self.fd)
+        self.size = file_stat.st_size
+        self.mtime = file_stat.st_mtime
+        self.inode = (file_stat.st_dev, file_stat.st_ino)
+        self.etag = f'"{key}-{int(self.mtime)}"'
+        self.content_type = content_type
+
+        self.checked_t = time.monotonic()
+        self.last_used_t = self.checked_t
+        self.users = 0          # responses currently streaming from fd (guarded by handles_lock)
+        self.evicted = False
+
+    def is_current(self):
+        """Whether the file at file_path is still the one fd has open, unchanged"""
+        try:
+            file_stat = os.stat(self.file_path)
+        except OSError:
+            return False
+        return (
+            (file_stat.st_dev, file_stat.st_ino) == self.inode
+            and file_stat.st_size == self.size
+            and file_stat.st_mtime == self.mtime
+        )
+
+    def release(self):
+        with handles_lock:
+            self.users -= 1
+            close = self.evicted and self.users == 0
+        if close:
+            os.close(self.fd)
+
+def evict_handle(handle):
+    """Drop handle from the cache; caller holds handles_lock. fd is closed once nothing streams from it"""
+    if stream_handles.get(handle.key) is handle:
+        del stream_handles[handle.key]
+    if not handle.evicted:
+        handle.evicted = True
+        if handle.users == 0:
+            os.close(handle.fd)
+
+def evict_idle_handles(now):
+    """Caller holds handles_lock"""
+    for handle in list(stream_handles.values()):
+        if handle.users == 0 and now - handle.last_used_t > HANDLE_IDLE_TTL:
+            evict_handle(handle)
+
+    # Still too many: least recently used first
+    if len(stream_handles) > MAX_STREAM_HANDLES:
+        idle = sorted((handle for handle in stream_handles.values() if handle.users == 0), key=lambda handle: handle.last_used_t)
+        for handle in idle[:len(stream_handles) - MAX_STREAM_HANDLES]:
+            evict_handle(handle)
+
+def invalidate_stream_handle(id):
+    """Forget the cached handles for a media item (e.g. when it's deleted)"""
+    with handles_lock:
+        for handle in list(stream_handles.values()):
+            if handle.media_id == id:
+                evict_handle(handle)
+
+def get_cached_handle(key, now):
+    """Cached handle for key with one use taken, if its file is unchanged; else None"""
+    with handles_lock:
+        handle = stream_handles.get(key)
+        if handle is not None:
+            handle.users += 1
+            handle.last_used_t = now
+
+    if handle is None:
+        return None
+    if now - handle.checked_t < STAT_RECHECK_INTERVAL:
+        return handle
+    if handle.is_current():
+        handle.checked_t = now
+        return handle
+    # Changed, moved or deleted
+    with handles_lock:
+        evict_handle(handle)
+    handle.release()
+    return None
+
+def store_handle(handle, now):
+    """Cache a new handle, with one use taken"""
+    with handles_lock:
+        previous = stream_handles.get(handle.key)
+        if previous is not None:
+            evict_handle(previous)
+        stream_handles[handle.key] = handle
+        handle.users += 1
+        evict_idle_handles(now)
+    return handle
+
+def acquire_stream_handle(id):
+    """
+    StreamHandle for media item `id` with one use taken (call release() when done),
+    or None if it isn't a local media item. Raises FileNotFoundError if its file can't be found.
+    """
+    now = time.monotonic()
+
+    handle = get_cached_handle(id, now)
+    if handle is not None:
+        return handle
+
+    # Get file path from database
+    conn = sqlite3.connect(config.DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT uri, media_type FROM media WHERE id = ? AND source = "local"', (id,)
+    )
+    result = cursor.fetchone()
+    conn.close()
+
+    if not result:
+        return None
+
+    macos_bookmark, media_type = result
+    file_path = resolve_bookmark(macos_bookmark)
+    if not file_path:
+        raise FileNotFoundError("File could not be located")
 
-def stream_local_file(id):
     try:
-        # Get file path from database
-        conn = sqlite3.connect(config.DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT uri, media_type FROM media WHERE id = ? AND source = "local"', (id,)
-        )
-        result = cursor.fetchone()
-        conn.close()
+        handle = StreamHandle(id, file_path, get_content_type(file_path, media_type), id)
+    except OSError:
+        # Moved since the bookmark was resolved (or resolved to a stale path)
+        file_path = resolve_moved_file(id)
+        handle = StreamHandle(id, file_path, get_content_type(file_path, media_type), id)
+
+    return store_handle(handle, now)
+
+def acquire_derived_handle(key, media_id, file_path, content_type):
+    """StreamHandle (one use taken) for a file generated from media item media_id, e.g. its cached remux"""
+    now = time.monotonic()
+
+    handle = get_cached_handle(key, now)
+    if handle is not None:
+        if handle.file_path == file_path:
+            return handle
+        # Regenerated under a new name (store_handle replaces the old handle)
+        handle.release()
+
+    return store_handle(StreamHandle(key, file_path, content_type, media_id), now)
+
+#######################################################################
+#   Response body
+#######################################################################
+
+def sendfile_once(sock, fd, offset, count):
+    """One os.sendfile() of up to count bytes at offset (doesn't touch fd's file position)"""
+    while True:
+        try:
+            return os.sendfile(sock.fileno(), fd, offset, min(count, SENDFILE_BLOCKSIZE))
+        except BlockingIOError:
+            # Socket has a timeout (so is non-blocking underneath): wait until it's writable
+            with selectors.DefaultSelector() as selector:
+                selector.register(sock, selectors.EVENT_WRITE)
+                if not selector.select(sock.gettimeout()):
+                    raise TimeoutError("timed out")
+
+def generate_body(handle, segments, chunk_size, sock):
+    """
+    Response body, sent in order from `segments`: bytes (multipart part headers) are
+    yielded as they are, (start, length) ranges of the handle's file are sent with
+    sendfile when there's a client socket (after yielding b"" once, so the server
+    writes the status line and headers first) and otherwise read and yielded in chunks.
+    If reading the item's own file fails (e.g. the file's volume went away), the bookmark
+    is resolved again and the rest is read from the file's new location.
+    """
+    fd = handle.fd
+    reopened_fd = None
 
-        if not result:
-            return Response("Media not found", status=404)
+    try:
+        if sock is not None:
+            yield b""
+
+        for segment in segments:
+            if isinstance(segment, bytes):
+                # werkzeug writes yielded data to the same connection before asking for more,
+                # so this stays in order with what sendfile wrote directly
+                yield segment
+                continue
+
+            start, length = segment
+            current_position = start
+            bytes_sent = 0
+
+            if sock is not None and reopened_fd is None:
+                try:
+                    while bytes_sent < length:
+                        sent = sendfile_once(sock, fd, current_position, length - bytes_sent)
+                        if not sent:
+                            break
+                        bytes_sent += sent
+                        current_position += sent
+                except (ConnectionError, TimeoutError):
+                    # Client went away (seeking abandons requests all the time)
+                    return
+                except OSError:
+                    # Not a client error: the read loop below picks up from current_position
+                    pass
+                if bytes_sent >= length:
+                    continue
+
+            while bytes_sent < length:
+                try:
+                    # Read smaller chunks to avoid loading the entire range at once
+                    chunk = os.pread(fd, min(chunk_size, length - bytes_sent), current_position)
+                    if not chunk:
+                        break
+                    bytes_sent += len(chunk)
+                    current_position += len(chunk)
+                    yield chunk
+
+                except (IOError, OSError):
+                    # File access error occurred - the file might have been moved.
+                    # Open the new location for the rest of this response only
+                    if reopened_fd is not None or not handle.is_source:
+                        raise
+                    invalidate_stream_handle(handle.media_id)
+                    reopened_fd = os.open(resolve_moved_file(handle.media_id), os.O_RDONLY)
+                    fd = reopened_fd
 
-        macos_bookmark, media_type = result
-        file_path = resolve_bookmark(macos_bookmark)
+    except Exception as e:
+        # Log the error for debugging
+        print(f"Error during streaming: {str(e)}")
+        raise
+
+    finally:
+        if reopened_fd is not None:
+            os.close(reopened_fd)
+
+#######################################################################
+#   Byte ranges (RFC 7233)
+#######################################################################
+
+# More ranges than this in one request are ignored (whole file sent): lots of tiny
+# ranges cost far more to serve than they save
+MAX_RANGES = 64
+
+RANGE_SPEC_REGEX = re.compile(r"(\d*)-(\d*)", re.ASCII)
+
+def parse_range_header(range_header, file_size):
+    """
+    Range header -> [(start, end)] inclusive byte ranges, sorted with overlapping and
+    adjacent ones merged. [] means nothing in it is satisfiable (416); None means the
+    header is to be ignored and the whole file sent (another unit, malformed, too many ranges).
+    """
+    unit, _, range_set = range_header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+
+    # Empty list elements are allowed ("bytes=0-1,,5-6")
+    specs = [spec.strip() for spec in range_set.split(",") if spec.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        match = RANGE_SPEC_REGEX.fullmatch(spec)
+        if not match or not (match.group(1) or match.group(2)):
+            return None
+        first, last = match.groups()
+
+        if not first:
+            # Suffix range: the final N bytes
+            suffix_length = int(last)
+            if suffix_length > 0 and file_size > 0:
+                ranges.append((max(0, file_size - suffix_length), file_size - 1))
+            continue
+
+        start = int(first)
+        end = int(last) if last else file_size - 1
+        if last and end < start:
+            # Invalid range-spec, so the whole header is
+            return None
+        if start < file_size:
+            ranges.append((start, min(end, file_size - 1)))
+
+    return coalesce_ranges(ranges)
+
+def coalesce_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def if_range_matches(if_range, etag, file_mtime):
+    """Whether an If-Range validator still matches the file (if not, the Range header is ignored)"""
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        # Strong comparison; W/ tags never match
+        return if_range == etag
+    if if_range.startswith("W/"):
+        return False
+    date = parse_date(if_range)
+    return date is not None and int(date.timestamp()) == int(file_mtime)
+
+def build_multipart_segments(ranges, content_type, file_size):
+    """(segments for generate_body, boundary, content length) of a multipart/byteranges body"""
+    boundary = secrets.token_hex(16)
+    segments = []
+    for start, end in ranges:
+        segments.append((
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+        ).encode("latin-1"))
+        segments.append((start, end - start + 1))
+    segments.append(f"\r\n--{boundary}--\r\n".encode("latin-1"))
+
+    content_length = sum(len(segment) if isinstance(segment, bytes) else segment[1] for segment in segments)
+    return segments, boundary, content_length
 
-        if not file_path:
-            return Response("File not found", status=404)
+def stream_local_file(id):
+    handle = None
+    try:
+        try:
+            handle = acquire_stream_handle(id)
+        except FileNotFoundError as e:
+            return Response(f"File not found: {str(e)}", status=404)
 
-        # Get file size and modification time for caching
-        file_size = os.path.getsize(file_path)
-        file_mtime = os.path.getmtime(file_path)
-        etag = f'"{id}-{int(file_mtime)}"'
+        if handle is None:
+            return Response("Media not found", status=404)
 
-        # Set content type based on media_type
-        content_type = "video/mp4" if media_type == "video" else "audio/mpeg"
+        # Listen-only playback: the item's small audio proxy instead of its file
+        if request.args.get("variant") == "audio":
+            proxy_path = audio_proxy.get_proxy_path(id)
+            if os.path.exists(proxy_path):
+                source_handle, handle = handle, None
+                source_handle.release()
+                handle = acquire_derived_handle(f"{id}:audio", id, proxy_path, "audio/mp4")
+            else:
+                # Made before proxies existed: serve the file this time
+                audio_proxy.build_from_source(id, handle.file_path)
+
+        if handle.is_source and transcode.needs_transcode(handle.file_path):
+            plan = transcode.get_plan(handle.file_path, handle.size, handle.mtime)
+
+            # ?t= asks for the live stream restarted at t (the player seeking in it)
+            remux_path = None
+            if "t" not in request.args:
+                remux_path = transcode.get_cached_remux(id, handle.file_path, handle.size, handle.mtime, plan)
+
+            if remux_path is None:
+                start = transcode.get_seek_point(handle.file_path, plan, request.args.get("t", 0.0, type=float))
+                return transcode.live_stream_response(id, handle.file_path, handle.size, handle.mtime, plan, start)
+
+            # From here on it's the remuxed file that's served
+            source_handle, handle = handle, None
+            source_handle.release()
+            handle = acquire_derived_handle(f"{id}:remux", id, remux_path, plan["content_type"])
+
+        served_handle, handle = handle, None
+        return file_response(served_handle)
 
-        # Try to get a more specific content type from the file extension
-        specific_type = mimetypes.guess_type(file_path)[0]
-        if specific_type:
-            content_type = specific_type
+    except Exception as e:
+        return Response(f"Error streaming file: {str(e)}", status=500)
+
+    finally:
+        # Not handed over to file_response
+        if handle is not None:
+            handle.release()
+
+def file_response(handle):
+    """
+    Response serving the file of a StreamHandle (conditional requests, ranges). Takes
+    over the caller's use of the handle: it's released once the response is done with it.
+    """
+    try:
+        file_size = handle.size
+        file_mtime = handle.mtime
+        etag = handle.etag
+        content_type = handle.content_type
 
-        # Check if-none-match for caching
         if_none_match = request.headers.get("If-None-Match")
         if if_none_match and if_none_match == etag:
             return Response(status=304)  # Not Modified
 
+        # If-Modified-Since is only considered without If-None-Match (RFC 9110 13.1.3)
+        if_modified_since = request.if_modified_since
+        if not if_none_match and if_modified_since and int(file_mtime) <= if_modified_since.timestamp():
+            return Response(status=304)  # Not Modified
+
         # Handle range requests for seeking
         range_header = request.headers.get("Range", None)
+        ranges = None
 
-        # Determine optimal chunk size based on file size
-        base_chunk_size = 8192  # 8KB default
-        if file_size > 1_073_741_824:  # > 1GB
-            chunk_size = 262_144  # 256KB for very large files
-        elif file_size > 104_857_600:  # > 100MB
-            chunk_size = 131_072  # 128KB for large files
-        elif file_size > 10_485_760:  # > 10MB
-            chunk_size = 65_536  # 64KB for medium files
+        if range_header:
+            # A stale If-Range means the client wants the whole (changed) file instead
+            if_range = request.headers.get("If-Range")
+            if not if_range or if_range_matches(if_range, etag, file_mtime):
+                ranges = parse_range_header(range_header, file_size)
+
+        if ranges == []:
+            resp = Response("Range Not Satisfiable", status=416)
+            resp.headers.add("Content-Range", f"bytes */{file_size}")
+            resp.headers.add("Accept-Ranges", "bytes")
+            return resp
+
+        content_range = None
+        if ranges is None:
+            # Whole file
+            status = 200
+            segments = [(0, file_size)]
+            content_length = file_size
+        elif len(ranges) == 1:
+            status = 206
+            start, end = ranges[0]
+            segments = [(start, end - start + 1)]
+            content_length = end - start + 1
+            content_range = f"bytes {start}-{end}/{file_size}"
         else:
-            chunk_size = base_chunk_size  # 8KB for small files
+            # Several ranges (e.g. a player probing the moov atom/cues at the end as well)
+            status = 206
+            segments, boundary, content_length = build_multipart_segments(ranges, content_type, file_size)
+            content_type = f"multipart/byteranges; boundary={boundary}"
+
+        # The server closes the body iterable once it's done with it (or the client is gone),
+        # even if it never started iterating. (Response.call_on_close callbacks don't run
+        # for direct_passthrough responses, so the release goes on the iterable itself.)
+        body = ClosingIterator(
+            generate_body(handle, segments, get_chunk_size(file_size), get_client_socket()),
+            handle.release
+        )
 
-        if range_header:
-            try:
-                # Parse the range header
-                bytes_range = range_header.replace("bytes=", "").split("-")
-                start = int(bytes_range[0]) if bytes_range[0] else 0
-                end = int(bytes_range[1]) if bytes_range[1] else file_size - 1
-
-                # Clamp the range to valid values
-                if start >= file_size:
-                    return Response(status=416)  # Range Not Satisfiable
-
-                # Ensure end doesn't exceed file size
-                end = min(end, file_size - 1)
-
-                # Calculate content length for the response
-                length = end - start + 1
-
-                # Create a streaming response for large files
-                def generate():
-                    nonlocal file_path  # Use nonlocal to access the variable from the outer scope
-                    file_handle = None
-                    current_position = start
-                    bytes_sent = 0
-
-                    try:
-                        file_handle = open(file_path, "rb")
-                        file_handle.seek(current_position)
-
-                        while bytes_sent < length:
-                            try:
-                                # Read smaller chunks to avoid loading the entire range at once
-                                chunk = file_handle.read(
-                                    min(chunk_size, length - bytes_sent)
-                                )
-                                if not chunk:
-                                    break
-                                bytes_sent += len(chunk)
-                                current_position += len(chunk)
-                                yield chunk
-
-                            except (IOError, OSError):
-                                # File access error occurred - the file might have been moved
-                                if file_handle:
-                                    file_handle.close()
-
-                                # Try to resolve the bookmark again
-                                conn = sqlite3.connect(config.DB_PATH)
-                                cursor = conn.cursor()
-                                cursor.execute(
-                                    'SELECT uri FROM media WHERE id = ? AND source = "local"',
-                                    (id,),
-                                )
-                                bookmark_result = cursor.fetchone()
-                                conn.close()
-
-                                if not bookmark_result:
-                                    raise FileNotFoundError(
-                                        "Media record no longer exists"
-                                    )
-
-                                new_file_path = resolve_bookmark(bookmark_result[0])
-                                if not new_file_path:
-                                    raise FileNotFoundError("File could not be located")
-
-                                file_path = new_file_path  # Now properly updates the outer variable
-
-                                # Open the new file location and seek to the current position
-                                file_handle = open(file_path, "rb")
-                                file_handle.seek(current_position)
-
-                    except Exception as e:
-                        # Log the error for debugging
-                        print(f"Error during streaming: {str(e)}")
-                        # Close the file handle if it's open
-                        if file_handle:
-                            file_handle.close()
-                        # Re-raise to be caught by the outer exception handler
-                        raise
+        # Create the streaming response
+        resp = Response(
+            body,
+            status,
+            mimetype=content_type,
+            content_type=content_type,
+            direct_passthrough=True,
+        )
+        if content_range:
+            resp.headers.add("Content-Range", content_range)
+        resp.headers.add("Accept-Ranges", "bytes")
+        resp.headers.add("Content-Length", str(content_length))
+        resp.headers.add("ETag", etag)
+        resp.last_modified = file_mtime
+        resp.headers.add(
+            "Cache-Control", "private, max-age=3600"
+        )  # 1 hour client-side cache
+
+        handle = None
+        return resp
+
+    finally:
+        # Not handed over to a streaming response
+        if handle is not None:
+            handle.release()
+
+def get_stream_info(id):
+    """
+    {"stream_mode", "hls", "render"} for a local item. stream_mode is how /api/stream/<id>
+    serves it: "direct" (its file), "cached" (a remuxed copy) or "live" (piped through
+    ffmpeg: no ranges, seek by restarting at ?t=); None if it can't be streamed. hls:
+    whether to play /api/hls/<id>/index.m3u8 instead, where the browser can. render:
+    whether to play /api/render/<id> when the speaker settings edit the item (see
+    get_render_info).
+    """
+    info = {"stream_mode": None, "hls": False, "render": bool(db.get_setting('render_playback'))}
+    try:
+        handle = acquire_stream_handle(id)
+    except FileNotFoundError:
+        return info
+    if handle is None:
+        return info
 
-                    finally:
-                        # Ensure file is closed when done
-                        if file_handle:
-                            file_handle.close()
-
-                # Create the streaming response with the partial content
-                resp = Response(
-                    generate(),
-                    206,
-                    mimetype=content_type,
-                    content_type=content_type,
-                    direct_passthrough=True,
-                )
-                resp.headers.add("Content-Range", f"bytes {start}-{end}/{file_size}")
-                resp.headers.add("Accept-Ranges", "bytes")
-                resp.headers.add("Content-Length", str(length))
-                resp.headers.add("ETag", etag)
-                resp.headers.add(
-                    "Cache-Control", "private, max-age=3600"
-                )  # 1 hour client-side cache
-                return resp
-
-            except (ValueError, IndexError) as e:
-                # Handle malformed range header
-                return Response(f"Invalid range header: {str(e)}", status=400)
-            except FileNotFoundError as e:
-                return Response(f"File not found: {str(e)}", status=404)
+    try:
+        plan = None
+        if not transcode.needs_transcode(handle.file_path):
+            info["stream_mode"] = "direct"
         else:
-            # For non-range requests, we need to handle file moves
-            # Create a custom file sender
-            def custom_send_file():
-                nonlocal file_path  # Use nonlocal to access the variable from the outer scope
-                try:
-                    return send_file(
-                        file_path,
-                        mimetype=content_type,
-                        as_attachment=False,
-                        conditional=True,
-                    )
-                except (IOError, OSError):
-                    # Try to resolve the bookmark again
-                    conn = sqlite3.connect(config.DB_PATH)
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        'SELECT uri FROM media WHERE id = ? AND source = "local"', (id,)
-                    )
-                    bookmark_result = cursor.fetchone()
-                    conn.close()
-
-                    if not bookmark_result:
-                        return Response("Media record no longer exists", status=404)
-
-                    new_file_path = resolve_bookmark(bookmark_result[0])
-                    if not new_file_path:
-                        return Response("File could not be located", status=404)
-
-                    file_path = new_file_path  # Update the outer scope variable
-
-                    # Try with the new path
-                    return send_file(
-                        file_path,
-                        mimetype=content_type,
-                        as_attachment=False,
-                        conditional=True,
-                    )
-
-            response = custom_send_file()
-            if isinstance(response, Response):
-                response.headers.add("Accept-Ranges", "bytes")
-                response.headers.add("ETag", etag)
-                response.headers.add(
-                    "Cache-Control", "private, max-age=3600"
-                )  # 1 hour client-side cache
-            return response
+            plan = transcode.get_plan(handle.file_path, handle.size, handle.mtime)
+            # Also starts building the remux, so it's likely ready by the next playback
+            if transcode.get_cached_remux(id, handle.file_path, handle.size, handle.mtime, plan):
+                info["stream_mode"] = "cached"
+            else:
+                info["stream_mode"] = "live"
+
+        # A cached remux is a faststart MP4: it seeks fine as it is
+        if (info["stream_mode"] != "cached" and db.get_setting('hls_packaging') and hls.wants_hls(handle)
+                and hls.is_available(hls.get_package_dir(id, handle.size, handle.mtime))):
+            plan = plan or transcode.get_plan(handle.file_path, handle.size, handle.mtime)
+            info["hls"] = plan["video_codec"] is not None
+    except Exception as e:
+        print(f"Error checking stream mode: {str(e)}")
+    finally:
+        handle.release()
+    return info
+
+def serve_hls(id, name):
+    """/api/hls/<id>/<name>: the playlist (packaging the item if need be) or one of its segments"""
+    try:
+        handle = acquire_stream_handle(id)
+    except FileNotFoundError as e:
+        return Response(f"File not found: {str(e)}", status=404)
+    if handle is None:
+        return Response("Media not found", status=404)
+
+    try:
+        if name != hls.PLAYLIST_NAME:
+            return hls.serve_segment(hls.get_package_dir(id, handle.size, handle.mtime), name)
+        plan = transcode.get_plan(handle.file_path, handle.size, handle.mtime)
+        package_dir = hls.ensure_package(id, handle.file_path, handle.size, handle.mtime, plan)
+    except Exception as e:
+        return Response(f"Error packaging file: {str(e)}", status=500)
+    finally:
+        handle.release()
+
+    return hls.serve_playlist(package_dir)
+
+def get_stream_seek_point(id, t):
+    """Where the live stream restarted for time t starts (see transcode.get_seek_point); None if not applicable"""
+    try:
+        handle = acquire_stream_handle(id)
+    except FileNotFoundError:
+        return None
+    if handle is None:
+        return None
+
+    try:
+        if not transcode.needs_transcode(handle.file_path):
+            return None
+        plan = transcode.get_plan(handle.file_path, handle.size, handle.mtime)
+        return transcode.get_seek_point(handle.file_path, plan, t)
+    finally:
+        handle.release()
+
+def get_render_info(id, variant):
+    """
+    The item's EDL (see render.get_edl) and how /api/render/<id> serves it: stream_mode
+    "cached" (a finished render, with ranges) or "live"; None if there's nothing to render
+    """
+    edl = render.get_edl(id)
+    if edl is None or not edl["clips"]:
+        return None
+
+    try:
+        handle = acquire_stream_handle(id)
+    except FileNotFoundError:
+        return None
+    if handle is None:
+        return None
+
+    try:
+        plan = transcode.get_plan(handle.file_path, handle.size, handle.mtime)
+        if plan["audio_codec"] is None:
+            return None
+        has_video = variant == "video" and plan["video_codec"] is not None
+        render_path = render.get_render_path(id, "video" if has_video else "audio", edl["clips"], handle.size, handle.mtime)
+        edl["stream_mode"] = "cached" if os.path.exists(render_path) else "live"
+        return edl
+    except Exception as e:
+        print(f"Error checking render: {str(e)}")
+        return None
+    finally:
+        handle.release()
+
+def stream_render(id):
+    """
+    /api/render/<id>: the item as the player would play it with its speaker settings,
+    edited server side (see render.py). ?variant=audio leaves out the video; ?t= restarts
+    the live render at that render time.
+    """
+    variant = request.args.get("variant", "video")
+    if variant not in render.VARIANTS:
+        return Response(f"Unknown variant: {variant}", status=400)
+
+    edl = render.get_edl(id)
+    if edl is None or not edl["clips"]:
+        return Response("Nothing to render", status=404)
+
+    handle = None
+    try:
+        try:
+            handle = acquire_stream_handle(id)
+        except FileNotFoundError as e:
+            return Response(f"File not found: {str(e)}", status=404)
+
+        if handle is None:
+            return Response("Media not found", status=404)
+
+        plan = transcode.get_plan(handle.file_path, handle.size, handle.mtime)
+        if plan["audio_codec"] is None:
+            return Response("Media has no audio", status=404)
+
+        has_video = variant == "video" and plan["video_codec"] is not None
+        content_type = "video/mp4" if has_video else "audio/mp4"
+        render_path = render.get_render_path(id, "video" if has_video else "audio", edl["clips"], handle.size, handle.mtime)
+
+        if "t" not in request.args and render.get_cached_render(render_path):
+            source_handle, handle = handle, None
+            source_handle.release()
+            handle = acquire_derived_handle(f"{id}:render_{variant}", id, render_path, content_type)
+            served_handle, handle = handle, None
+            return file_response(served_handle)
+
+        # Everything is re-encoded, so a restart starts exactly at ?t= (no keyframe to look up)
+        start = max(request.args.get("t", 0.0, type=float), 0.0)
+        resp = render.stream_response(id, handle.file_path, has_video, edl["clips"], render_path, start)
+        resp.headers["X-Render-Duration"] = f"{edl['duration']:.3f}"
+        return resp
 
     except Exception as e:
-        return Response(f"Error streaming file: {str(e)}", status=500)
\ No newline at end of file
+        return Response(f"Error rendering file: {str(e)}", status=500)
+
+    finally:
+        if handle is not None:
+            handle.release()
@@ -0,0 +1,362 @@
+import os
+import threading
+import subprocess
+import ffmpeg
+import config
+import media_cache
+from flask import Response
+from werkzeug.wsgi import ClosingIterator
+from misc import get_file_extension, is_browser_playable_format
+
+#######################################################################
+#   Remux/transcode streaming (/api/stream for formats browsers can't play)
+#######################################################################
+
+# MKV, MOV, AVI, FLAC, ... are piped through ffmpeg into fragmented MP4, which plays
+# while it's being written. Streams a browser can decode are copied (remux: cheap, no
+# quality loss); only what it can't decode is transcoded. The pipe can't seek, so a
+# seek restarts ffmpeg at the requested time (?t=): with the video copied that has to
+# be a keyframe, which get_seek_point looks up.
+#
+# When nothing has to be re-encoded as video, the whole file is also remuxed once in the
+# background into a regular (faststart) MP4 in the remux cache; from then on /api/stream
+# serves that file like any other, with ranges and sendfile. Re-encoding a whole video
+# costs too much to do speculatively: a video transcode is cached from a live stream that
+# played from the start to the end instead (teed to disk, then remuxed to faststart).
+
+VIDEO_COPY_CODECS = {"h264", "vp9", "av1"}
+AUDIO_COPY_CODECS = {"aac", "mp3"}
+if config.RUNNING_DARWIN:
+    # Safari and Chrome on macOS decode HEVC in MP4 (tagged hvc1)
+    VIDEO_COPY_CODECS.add("hevc")
+
+MAX_CONCURRENT_TRANSCODES = 3       # live ffmpeg pipes; further requests get a 503
+PIPE_READ_SIZE = 256 * 1024
+
+REMUX_CACHE_KIND = "remux"
+REMUX_CACHE_MAX_BYTES = 20 * 1024 ** 3
+TEE_SUFFIX = ".frag.part"           # a teed (fragmented) transcode, before its faststart remux
+
+# How far back from the requested time to look for a keyframe, then a second, wider try
+KEYFRAME_SEARCH_WINDOWS = (20.0, 300.0)     # seconds
+
+transcode_slots = threading.BoundedSemaphore(MAX_CONCURRENT_TRANSCODES)
+build_slots = threading.BoundedSemaphore(1)     # background remuxes run one at a time
+
+plans_lock = threading.Lock()
+plans = {}              # (file_path, size, mtime) -> plan
+remux_builds = set()    # cache paths being built (guarded by plans_lock)
+
+# The player asks for the seek point, then requests the stream at it: both are answered from here
+MAX_SEEK_POINTS = 256
+seek_points = {}        # (file_path, t) -> seek point
+
+def needs_transcode(file_path):
+    return not is_browser_playable_format(get_file_extension(file_path))
+
+def get_plan(file_path, size, mtime):
+    """
+    How to make file_path playable: {"video_codec", "audio_codec" (None: no such stream,
+    "copy" or an encoder), "hevc", "content_type", "remux_in_background"}. Raises ffmpeg.Error if it can't be probed.
+    """
+    key = (file_path, size, mtime)
+    with plans_lock:
+        plan = plans.get(key)
+    if plan is not None:
+        return plan
+
+    probe = ffmpeg.probe(file_path)
+    video = next((
+        stream for stream in probe["streams"]
+        if stream["codec_type"] == "video" and stream.get("disposition", {}).get("attached_pic", 0) == 0
+    ), None)
+    audio = next((stream for stream in probe["streams"] if stream["codec_type"] == "audio"), None)
+
+    video_codec = None
+    if video is not None:
+        video_codec = "copy" if video.get("codec_name") in VIDEO_COPY_CODECS else "libx264"
+    audio_codec = None
+    if audio is not None:
+        audio_codec = "copy" if audio.get("codec_name") in AUDIO_COPY_CODECS else "aac"
+
+    plan = {
+        "video_codec": video_codec,
+        "audio_codec": audio_codec,
+        "hevc": video is not None and video.get("codec_name") == "hevc",
+        "content_type": "video/mp4" if video is not None else "audio/mp4",
+        # Otherwise the remux cache is filled from a complete live stream (see live_stream_response)
+        "remux_in_background": video_codec != "libx264"
+    }
+
+    with plans_lock:
+        plans[key] = plan
+    return plan
+
+def get_codec_args(plan):
+    """ffmpeg output options selecting and encoding/copying the plan's streams"""
+    args = {"sn": None, "dn": None}
+
+    if plan["video_codec"] is None:
+        args["vn"] = None       # also drops cover art
+    elif plan["video_codec"] == "copy":
+        args["c:v"] = "copy"
+        if plan["hevc"]:
+            args["tag:v"] = "hvc1"
+    else:
+        args.update({"c:v": plan["video_codec"], "preset": "veryfast", "crf": 23, "pix_fmt": "yuv420p"})
+
+    if plan["audio_codec"] is None:
+        args["an"] = None
+    elif plan["audio_codec"] == "copy":
+        args["c:a"] = "copy"
+    else:
+        args.update({"c:a": plan["audio_codec"], "b:a": "192k"})
+    return args
+
+def get_output_args(plan, fragmented):
+    args = {"format": "mp4", **get_codec_args(plan)}
+
+    # Fragmented: playable while it's written to a pipe; otherwise index up front for seeking
+    args["movflags"] = "frag_keyframe+empty_moov+default_base_moof" if fragmented else "+faststart"
+    return args
+
+#######################################################################
+#   Seeking
+#######################################################################
+
+def get_seek_point(file_path, plan, t):
+    """Where a stream restarted for time t actually starts: the keyframe at or before t when video is copied, else t"""
+    if t <= 0:
+        return 0.0
+    if plan["video_codec"] != "copy":
+        # Decoding starts at the previous keyframe and drops frames up to t
+        return t
+
+    seek_point = seek_points.get((file_path, t))
+    if seek_point is None:
+        seek_point = find_keyframe(file_path, t)
+        if len(seek_points) >= MAX_SEEK_POINTS:
+            seek_points.clear()
+        seek_points[(file_path, t)] = seek_point
+        seek_points[(file_path, seek_point)] = seek_point
+    return seek_point
+
+def find_keyframe(file_path, t):
+    """Time of the last video keyframe at or before t"""
+    for window in KEYFRAME_SEARCH_WINDOWS:
+        try:
+            probe = ffmpeg.probe(
+                file_path,
+                select_streams="v:0",
+                skip_frame="nokey",
+                show_entries="frame=pts_time,best_effort_timestamp_time",
+                read_intervals=f"{max(0.0, t - window)}%{t + 0.001}"
+            )
+        except ffmpeg.Error as e:
+            print(f"Error finding keyframe: {e.stderr.decode(errors='replace')}")
+            return t
+
+        keyframe_times = []
+        for frame in probe.get("frames", []):
+            frame_time = frame.get("pts_time", frame.get("best_effort_timestamp_time"))
+            try:
+                keyframe_times.append(float(frame_time))
+            except (TypeError, ValueError):
+                pass
+
+        keyframe_times = [keyframe_time for keyframe_time in keyframe_times if keyframe_time <= t + 0.001]
+        if keyframe_times:
+            return max(keyframe_times)
+
+    return 0.0
+
+#######################################################################
+#   Live stream
+#######################################################################
+
+def live_stream_response(id, file_path, size, mtime, plan, start):
+    """
+    Response piping ffmpeg's fragmented MP4 of file_path from `start` seconds; 503 if all
+    transcode slots are busy. A video transcode streamed from the start is also teed into
+    the remux cache (one stream per item at a time), kept if it gets to the end.
+    """
+    stream = ffmpeg.input(file_path, ss=start) if start > 0 else ffmpeg.input(file_path)
+    args = ffmpeg.compile(stream.output("pipe:", **get_output_args(plan, fragmented=True)))
+
+    remux_path = tee_path = None
+    if start <= 0 and not plan["remux_in_background"]:
+        remux_path = get_remux_path(id, size, mtime)
+        with plans_lock:
+            if remux_path not in remux_builds:
+                remux_builds.add(remux_path)
+                tee_path = remux_path + TEE_SUFFIX
+
+    def on_tee_done(complete):
+        if complete:
+            threading.Thread(target=finish_remux, args=(id, tee_path, remux_path), name="remux_finish", daemon=True).start()
+        else:
+            with plans_lock:
+                remux_builds.discard(remux_path)
+
+    try:
+        resp = pipe_response(args, plan["content_type"], start, tee_path=tee_path, on_tee_done=on_tee_done)
+    except Exception:
+        if tee_path is not None:
+            on_tee_done(False)
+        raise
+    if tee_path is not None and resp.status_code != 200:
+        on_tee_done(False)
+    return resp
+
+def pipe_response(args, content_type, start=0.0, tee_path=None, on_tee_done=None, temp_paths=()):
+    """
+    Response piping the output of ffmpeg run with args (ffmpeg.compile of a stream with
+    output "pipe:"), counted against the transcode slots; 503 if they're all busy. With
+    tee_path, what's sent is also written there, and once the response is closed
+    on_tee_done(complete) is called, complete being whether ffmpeg got to the end (if not,
+    the file has been removed). temp_paths (files only this ffmpeg reads, e.g. a filter
+    script) are removed once it's done.
+    """
+    if not transcode_slots.acquire(blocking=False):
+        for path in temp_paths:
+            media_cache.remove_file(path)
+        resp = Response("Too many streams being transcoded", status=503)
+        resp.headers["Retry-After"] = "2"
+        return resp
+
+    try:
+        process = subprocess.Popen(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+    except Exception:
+        transcode_slots.release()
+        for path in temp_paths:
+            media_cache.remove_file(path)
+        raise
+
+    closed = threading.Lock()
+    tee = {"file": None, "complete": False}
+
+    def close():
+        # Called by the server when the response is done or the client is gone (seeking
+        # abandons streams all the time); the slot is only free once ffmpeg is
+        if not closed.acquire(blocking=False):
+            return
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        process.stdout.close()
+        transcode_slots.release()
+        for path in temp_paths:
+            media_cache.remove_file(path)
+        if tee_path is None:
+            return
+        if tee["file"] is not None:
+            tee["file"].close()
+        if not tee["complete"]:
+            media_cache.remove_file(tee_path)
+        if on_tee_done is not None:
+            on_tee_done(tee["complete"])
+
+    def generate():
+        if tee_path is not None:
+            tee["file"] = open(tee_path, "wb")
+        while True:
+            chunk = process.stdout.read1(PIPE_READ_SIZE)
+            if not chunk:
+                break
+            if tee["file"] is not None:
+                tee["file"].write(chunk)
+            yield chunk
+
+        if tee["file"] is not None and process.wait() == 0:
+            tee["file"].close()
+            tee["file"] = None
+            tee["complete"] = True
+
+    # close() on the body, not resp.call_on_close: that isn't run for direct_passthrough responses
+    resp = Response(ClosingIterator(generate(), close), 200, mimetype=content_type, direct_passthrough=True)
+    resp.headers["Accept-Ranges"] = "none"
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Stream-Start"] = f"{start:.3f}"
+    return resp
+
+#######################################################################
+#   Remux cache
+#######################################################################
+
+def get_remux_path(id, size, mtime):
+    # Size and mtime in the name: a changed source never matches an old remux
+    return os.path.join(media_cache.get_cache_dir(REMUX_CACHE_KIND), f"{id}_{size:x}_{int(mtime * 1000):x}.mp4")
+
+def get_cached_remux(id, file_path, size, mtime, plan):
+    """Path of the complete remux of file_path, or None; starts building it in the background if the plan allows"""
+    remux_path = get_remux_path(id, size, mtime)
+    if os.path.exists(remux_path):
+        media_cache.touch(remux_path)
+        return remux_path
+
+    if not plan["remux_in_background"]:
+        return None
+
+    with plans_lock:
+        if remux_path in remux_builds:
+            return None
+        remux_builds.add(remux_path)
+
+    threading.Thread(target=build_remux, args=(id, file_path, remux_path, plan), name="remux_build", daemon=True).start()
+    return None
+
+def build_remux(id, file_path, remux_path, plan):
+    part_path = media_cache.get_part_path(remux_path)
+    try:
+        with build_slots:
+            # Older remuxes of this item (the source changed) are dead weight
+            media_cache.remove_matching(REMUX_CACHE_KIND, f"{id}_")
+            print(f"Remuxing {id} for playback")
+            (
+                ffmpeg.input(file_path)
+                .output(part_path, **get_output_args(plan, fragmented=False))
+                .run(quiet=True, overwrite_output=True)
+            )
+            os.replace(part_path, remux_path)
+        media_cache.trim_cache(REMUX_CACHE_KIND, REMUX_CACHE_MAX_BYTES, keep={remux_path})
+    except ffmpeg.Error as e:
+        print(f"Error remuxing {id}: {e.stderr.decode(errors='replace')}")
+        media_cache.remove_file(part_path)
+    except Exception as e:
+        print(f"Error remuxing {id}: {str(e)}")
+        media_cache.remove_file(part_path)
+    finally:
+        with plans_lock:
+            remux_builds.discard(remux_path)
+
+def finish_remux(id, tee_path, remux_path):
+    """Remux a complete teed transcode into its (faststart, so seekable) cache file"""
+    part_path = media_cache.get_part_path(remux_path)
+    try:
+        with build_slots:
+            (
+                ffmpeg.input(tee_path)
+                .output(part_path, format="mp4", c="copy", movflags="+faststart")
+                .run(quiet=True, overwrite_output=True)
+            )
+            os.replace(part_path, remux_path)
+        print(f"Cached transcode of {id}")
+        media_cache.trim_cache(REMUX_CACHE_KIND, REMUX_CACHE_MAX_BYTES, keep={remux_path})
+    except ffmpeg.Error as e:
+        print(f"Error caching transcode of {id}: {e.stderr.decode(errors='replace')}")
+        media_cache.remove_file(part_path)
+    except Exception as e:
+        print(f"Error caching transcode of {id}: {str(e)}")
+        media_cache.remove_file(part_path)
+    finally:
+        media_cache.remove_file(tee_path)
+        with plans_lock:
+            remux_builds.discard(remux_path)
+
+def remove_cached_remuxes(id):
+    media_cache.remove_matching(REMUX_CACHE_KIND, f"{id}_")
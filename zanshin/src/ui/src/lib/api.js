@@ -81,6 +81,21 @@ export async function retry_processing(id, jobs_to_retry, force_get_raw_stream =
     return response.status === 200;
 }
 
+export async function fetch_render_edl(id, variant) {
+    const response = await fetch(`/api/render/${id}/edl?variant=${variant}`, {
+        method: 'GET',
+        headers: {
+            'Content-Type': 'application/json',
+        }
+    });
+
+    if (response.status === 200) {
+        return await response.json();
+    } else {
+        return null;
+    }
+}
+
 export async function get_setting(key) {
     const response = await fetch(`/api/get_setting?key=${key}`, {
         method: 'GET',
@@ -9,7 +9,7 @@ const config = {
 			pages: '../ui_dist',
 			assets: '../ui_dist',
 			fallback: 'index.html', // Important for SPA mode
-			precompress: false,
+			precompress: true, // .br + .gz next to each asset, served by static_assets.py
 			strict: false // This helps avoid errors with routes not found
 		})
 	}
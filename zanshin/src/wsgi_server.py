@@ -0,0 +1,72 @@
+import itertools
+import threading
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+#######################################################################
+#   Bounded threaded WSGI server (--server-mode / --server-backend threaded)
+#######################################################################
+
+# Like werkzeug's threaded dev server (a thread per connection, so a long stream or a
+# websocket never waits behind another request), but:
+#   - at most max_connections are served at once; further connections wait in the
+#     listen backlog instead of each getting a thread
+#   - a connection idle between requests (keep-alive) or slow to send its request line is
+#     closed after keep_alive_timeout, so idle clients can't hold on to the slots
+# Request threads are named process_request_thread-N, like werkzeug's, which is what
+# sampling_profiler groups into its 'flask' role.
+
+DEFAULT_MAX_CONNECTIONS = 64
+DEFAULT_KEEP_ALIVE_TIMEOUT = 15.0   # seconds
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    def handle_one_request(self):
+        # Only waiting for the request line is bounded; the request itself (a stream, a
+        # websocket) runs without a socket timeout, as under the dev server
+        self.connection.settimeout(self.server.keep_alive_timeout)
+        super().handle_one_request()
+
+    def parse_request(self):
+        # Called once the request line has arrived
+        self.connection.settimeout(None)
+        return super().parse_request()
+
+class BoundedThreadedWSGIServer(BaseWSGIServer):
+    multithread = True
+    daemon_threads = True
+
+    def __init__(self, host, port, app, max_connections=DEFAULT_MAX_CONNECTIONS, keep_alive_timeout=DEFAULT_KEEP_ALIVE_TIMEOUT):
+        super().__init__(host, port, app, handler=KeepAliveRequestHandler)
+        self.max_connections = max_connections
+        self.keep_alive_timeout = keep_alive_timeout
+        self.connection_slots = threading.BoundedSemaphore(max_connections)
+        self.thread_numbers = itertools.count(1)
+
+    def process_request(self, request, client_address):
+        # Blocks the accept loop while every slot is taken
+        self.connection_slots.acquire()
+        try:
+            thread = threading.Thread(
+                target=self.process_request_thread,
+                args=(request, client_address),
+                name=f"process_request_thread-{next(self.thread_numbers)}",
+                daemon=True
+            )
+            thread.start()
+        except Exception:
+            self.connection_slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.connection_slots.release()
+
+def run_threaded(app, host, port, max_connections=DEFAULT_MAX_CONNECTIONS, keep_alive_timeout=DEFAULT_KEEP_ALIVE_TIMEOUT):
+    """Serve app (Flask + the Socket.IO middleware) until interrupted"""
+    server = BoundedThreadedWSGIServer(host, port, app, max_connections, keep_alive_timeout)
+    print(f"Serving on {host}:{port} (threaded, max {max_connections} connections, {keep_alive_timeout:g}s keep-alive timeout)")
+    server.serve_forever()